@@ -0,0 +1,38 @@
+# need to import from another folder; this block enables that
+import sys, os, inspect
+current_folder = os.path.realpath(os.path.abspath(os.path.split(inspect.getfile( inspect.currentframe() ))[0]))
+parent_folder = os.path.split(current_folder)[0]
+if parent_folder not in sys.path:
+    sys.path.insert(0, parent_folder)
+del sys, os, inspect, current_folder, parent_folder
+
+
+###### EXAMPLE 3 #####
+# The same checks as in example 2, but declared as a schema rather than
+# written out in method check_before_setting_attribute
+from preferences import Preferences
+from preferences.schema import Coerce, Range
+
+prefs = Preferences(filename = "preferences - example3.txt",
+                    schema = {"X": int,                        # must be an integer
+                              "Y": Coerce(int),                # converted into an integer
+                              "Z": [Coerce(int), Range(0, 10)]},  # both, and between 0 and 10
+                    X = 1, Y = 2, Z = 3)
+
+prefs.X = 5                              # succeeds
+prefs.Y = 6                              # succeeds
+
+try:              prefs.X = "1"          # fails
+except TypeError: pass
+
+prefs.Y = "1"                            # succeeds, and is converted
+assert isinstance(prefs.Y, int)          # into an integer
+
+try:              prefs.Y = "random txt" # fails
+except TypeError: pass
+
+try:              prefs.Z = 11           # fails, as it is out of range
+except ValueError: pass
+
+# deletes the stored file. 
+prefs.delete_preferences_file()
@@ -11,9 +11,189 @@ Under MIT license
 
 
 from copy import copy
-import json
+from contextlib import contextmanager, nullcontext
 import os.path
+import sys
 import collections as col
+from .tracking import track
+from .serializers import SERIALIZERS, HEADER_SPLITTER, RawJSON
+from .readonly import ReadOnlyPreferences
+from .watching import FileWatcher
+from .schema import compile_schema, schema_hash
+from .storage import Storage, FileStorage, MemoryStorage, DELETED, write_atomically
+from .database import SQLiteStorage, is_database
+from .instrumentation import Instrumentation, EVENTS
+from .fork import PreferencesFork, Snapshot, copy_value
+import threading
+import time
+import atexit
+import weakref
+import fnmatch
+import traceback
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # e.g. on Windows; only needed for the shared mode
+
+
+
+# Instances in the "deferred" flush-mode may still hold changes that have
+# not been written to file yet. These are flushed when the interpreter exits.
+_INSTANCES_WITH_DEFERRED_WRITES = weakref.WeakSet()
+
+def _flush_deferred_writes_at_exit():
+    for preferences in list(_INSTANCES_WITH_DEFERRED_WRITES):
+        try:
+            preferences.flush()
+        except Exception:
+            pass
+
+atexit.register(_flush_deferred_writes_at_exit)
+
+
+
+class _UndoLog():
+    """
+    What a batch (see method batch of class Preferences) needs to undo
+    its changes: the state of every attribute and default value as it
+    was when the batch first changed it, and the names that the batch
+    added to the unwritten changes. Only what the batch changes is kept,
+    so that starting a batch does not depend on how many attributes
+    there are. (Only once the batch deletes an attribute, the order of
+    all names is kept as well, so that a deleted attribute gets its
+    place back.)
+    """
+    __slots__ = ("values", "defaults", "unwritten_changes", "unwritten_defaults",
+                 "writes", "all_defaults_unwritten", "names_order")
+
+    def __init__(self, writes, all_defaults_unwritten):
+        self.values = {}   # (name: its value, its stored value that was not decoded yet, whether it existed)
+        self.defaults = {} # (name: its default value)
+        self.unwritten_changes = set()
+        self.unwritten_defaults = set()
+        self.writes = writes # (the number of writes when the batch began)
+        self.all_defaults_unwritten = all_defaults_unwritten
+        self.names_order = None
+
+    def merge_into(self, outer_log):
+        # (once a nested batch is finished, its changes belong to the enclosing batch)
+        for name, state in self.values.items():
+            outer_log.values.setdefault(name, state)
+        for name, default in self.defaults.items():
+            outer_log.defaults.setdefault(name, default)
+        outer_log.unwritten_changes |= self.unwritten_changes
+        outer_log.unwritten_defaults |= self.unwritten_defaults
+        if outer_log.names_order is None:
+            # (the enclosing batch did not delete anything before, so the order was the same then)
+            outer_log.names_order = self.names_order
+
+
+
+class _WriterThread(threading.Thread):
+    """
+    The single thread that writes the file of an instance of Preferences
+    in the thread-safe mode (see argument 'thread_safe'). Other threads
+    only ask for a write (method request_write), and may wait for it
+    (method write_and_wait). Requests that come in while the thread is
+    busy are handled by a single write afterwards. The instance is only
+    referred to weakly, so that this thread does not keep it alive, except
+    while a write has been requested (so that its changes are still
+    written if the instance is deleted meanwhile).
+    """
+    def __init__(self, preferences):
+        super().__init__(name = "preferences-writer", daemon = True)
+        self._preferences = weakref.ref(preferences)
+        self._condition = threading.Condition()
+        self._requested = 0  # (number of the last request)
+        self._written = 0    # (number of the last request that has been handled)
+        self._urgent = False # (i.e. someone is waiting, so the "deferred" flush-mode does not wait)
+        self._stopped = False
+        self._error = None   # (raised by the last write that failed, for the requests in _failed_requests)
+        self._failed_requests = range(0)
+        self._keep_alive = None # (the instance, while a requested write has not been done yet)
+        self.writing = threading.Lock() # (held while writing without the lock of the instance)
+
+    def request_write(self, urgent = False):
+        with self._condition:
+            self._requested += 1
+            self._urgent = self._urgent or urgent
+            if self._keep_alive is None:
+                self._keep_alive = self._preferences()
+            self._condition.notify_all()
+            return self._requested
+
+    def write_and_wait(self):
+        """
+        Waits until all changes made so far are written (by this thread),
+        and raises the error that writing them raised, if any.
+        """
+        if threading.current_thread() is self:
+            # (e.g. a callback of method subscribe, called while writing)
+            return
+        with self._condition:
+            request = self.request_write(urgent = True)
+            self._condition.wait_for(lambda: self._written >= request or self._stopped)
+            if request in self._failed_requests:
+                raise self._error
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._requested > self._written or self._stopped)
+                if self._stopped:
+                    return
+                preferences = self._preferences()
+                if preferences is None:
+                    return
+                if preferences._flush_mode_of_this_class == "deferred":
+                    # collects more changes first
+                    self._condition.wait_for(lambda: self._urgent or self._stopped,
+                                             preferences._flush_interval_of_this_class)
+                request = self._requested
+                self._urgent = False
+            error = None
+            try:
+                preferences._write_from_writer_thread()
+            except Exception as exception:
+                error = exception
+                traceback.print_exc()
+            del preferences
+            with self._condition:
+                if error is not None:
+                    self._error = error
+                    self._failed_requests = range(self._written + 1, request + 1)
+                self._written = request
+                keep_alive = None
+                if self._written >= self._requested:
+                    keep_alive, self._keep_alive = self._keep_alive, None
+                self._condition.notify_all()
+            del keep_alive # (which may delete the instance, and thereby stop this thread)
+
+
+
+_MISSING = object()
+
+# values of these types cannot be changed in place, nor hold other values
+_SCALAR_TYPES = (str, bytes, int, float, complex, bool, type(None))
+
+def _is_same_value(old_value, new_value):
+    """
+    Returns whether setting an attribute from 'old_value' to 'new_value'
+    changes nothing (and therefore does not need to be written). Only
+    scalars of the same type are compared; containers may hold values
+    that are equal but of another type (e.g. [1] and [1.0]), so these
+    are left to the storage (which skips writing the same content).
+    """
+    if type(old_value) is not type(new_value) or not isinstance(new_value, _SCALAR_TYPES):
+        return False
+    if isinstance(new_value, float):
+        return repr(old_value) == repr(new_value) # (0.0 == -0.0, but they are written differently)
+    return old_value == new_value
 
   
 class Preferences():
@@ -28,7 +208,7 @@ class Preferences():
     stored as well.
     (NOTE: This only works by explicitly setting the value. Changing a
     list with append or a dictionary with update will not trigger the
-    change to be stored into the file.)
+    change to be stored into the file, unless 'track_mutations' is set.)
 
     Arguments:
     defaults:        A dictionary that holds the default values for the
@@ -38,10 +218,122 @@ class Preferences():
                      Recognizes both relative paths and absolute paths.
                      If it is a relative path, the file will be stored
                      in the same directory as the script that called
-                     upon this class.          Default = preferences.txt
+                     upon this class (or in 'base_dir', if given).
+                                               Default = preferences.txt
     header:          Any details you'd like to mention. This text will
                      appear at the top of the file if specified.
                      Default = ""
+    flush:           Either "immediate" or "deferred". If "immediate",
+                     every change is written to the file right away. If
+                     "deferred", changes are collected and written at
+                     most once per 'flush_interval' seconds (by a
+                     background thread), when the method flush is
+                     called, or when the interpreter exits.
+                     Default = "immediate"
+    flush_interval:  Number of seconds a change may wait before it is
+                     written to file in the "deferred" flush-mode.
+                     Default = 0.5
+    backend:         Either "file", "journal", "sqlite" or "memory".
+                     With "file", all values are (re)written to the file
+                     whenever something changes. With "journal", only
+                     the changes are appended to a second file (the
+                     filename followed by ".journal"), which is merged
+                     back into the file once it holds 'compact_every'
+                     changes. (The journal is written as JSON, whatever
+                     'format' is; with the formats "pickle" and
+                     "marshal", or a value that is no JSON, the whole
+                     file is written instead.) With "sqlite", the file is an SQLite
+                     database in which every attribute is a row, so that
+                     a change only writes the rows that changed (in a
+                     single transaction); other processes can read the
+                     database meanwhile. The values are stored as JSON,
+                     and 'format' is not used. See methods
+                     import_from_file and export_to_file to convert
+                     between files and databases. With "memory", nothing is written to (or
+                     read from) the disk at all, e.g. for tests. Instead
+                     of a name, an instance of a subclass of
+                     preferences.storage.Storage may be given, to store
+                     the values anywhere else (see module 'storage');
+                     instances given the same storage share their
+                     values.                        Default = "file"
+    compact_every:   Number of changes the journal may hold before it is
+                     merged into the file (only used with the backend
+                     "journal").                    Default = 1000
+    durability:      The file is always replaced as a whole (so it is
+                     never found half-written), but whether it is also
+                     flushed to the disk before continuing depends on
+                     this argument: "none" leaves that to the operating
+                     system, "file" syncs the data of the file (and
+                     journal), and "directory" syncs its directory too.
+                     Syncing is safer if the computer crashes, but
+                     slower.                        Default = "none"
+    shared:          Set to True if multiple processes use the same file
+                     at the same time. Before writing, the file is then
+                     locked and re-read, such that changes from other
+                     processes are taken over rather than overwritten.
+                     Method get (and reload) also take over changes of
+                     other processes, but only re-read the file if it
+                     has changed. Requires module 'fcntl' (Unix).
+                     Default = False
+    track_mutations: Set to True to also store changes made to lists,
+                     dicts and sets in place (e.g. by append or
+                     update). Such values are then replaced by (a copy
+                     in the form of) a list, dict or set that notices
+                     these changes. Note that changes made in place are
+                     not checked by check_before_setting_attribute.
+                     Default = False
+    format:          The format in which the values are stored: "json"
+                     (readable), "compact-json" (JSON on one line),
+                     "pickle" (binary; any python object), "marshal"
+                     (binary, fastest; only builtin types) or "indexed"
+                     (binary; JSON values behind an index of the keys,
+                     see method open_readonly). If None, the format of
+                     the existing file is used, or "json" for a new
+                     file. The format of a file is recognized
+                     automatically when it is read, apart from "pickle":
+                     as unpickling can execute arbitrary code, such a
+                     file is only read if "pickle" is given here.
+                     Default = None
+    lazy:            Set to True to only decode (and check) the stored
+                     value of an attribute once it is used, instead of
+                     decoding all values when this class initializes.
+                     This makes initializing fast for large files of
+                     which only a few values are used. Only has effect
+                     on files in the format "json" (or "compact-json")
+                     and "indexed", and on the backend "sqlite".
+                     Default = False
+    thread_safe:     Set to True to share this instance between threads.
+                     Changes are then made under a lock (a batch, and
+                     methods like set_value, hold it until they are
+                     done), while reading attributes takes no lock at
+                     all. The file is written by a single background
+                     thread, so setting an attribute does not wait for
+                     the file; method flush waits until all changes made
+                     so far are written.            Default = False
+    schema:          A dict that couples the names of attributes to what
+                     their values should be: a type (e.g. int), Coerce
+                     (e.g. Coerce(int) converts "1" into 1), Range (e.g.
+                     Range(0, 10)), a function that returns the value to
+                     set, or a list of these (see module 'schema'). Every
+                     value that is set is validated accordingly before
+                     check_before_setting_attribute is called. Values
+                     read from a file that was written with the same
+                     schema are not validated again, unless the schema
+                     holds a lambda (or another function without a name
+                     of its own). A function is only known by its name:
+                     after changing what a function does, change its
+                     name as well, or the values read are not validated
+                     again.                         Default = None
+    instrument:      Set to True to time setting, validating, checking,
+                     encoding, writing and loading the values. The
+                     timings are then returned by method stats, and
+                     hooks can be called with them (see method
+                     add_hook). Without it, this costs next to nothing.
+                     Default = False
+    base_dir:        The directory to which a relative 'filename' is
+                     relative. If None, this is the directory of the
+                     script that called upon this class.
+                     Default = None
     **keyword_defaults:
                      The keywords entered will be set as attributes,
                      while their corresponding value will be set as
@@ -62,26 +354,120 @@ class Preferences():
     _ATTRIBUTES_TO_IGNORE = ("_initialization_complete_of_this_class",
                              "_filename_to_store_the_preferences",
                              "_header_of_this_class",
+                             "_stored_header_of_this_class",
+                             "_flush_mode_of_this_class",
+                             "_flush_interval_of_this_class",
+                             "_flush_timer_of_this_class",
+                             "_unwritten_changes_of_this_class",
+                             "_lock_of_this_class",
+                             "_batch_depth_of_this_class",
+                             "_undo_logs_of_this_class",
+                             "_backend_of_this_class",
+                             "_durability_of_this_class",
+                             "_lock_file_of_this_class",
+                             "_file_lock_depth_of_this_class",
+                             "_file_signature_of_this_class",
+                             "_track_mutations_of_this_class",
+                             "_serializer_of_this_class",
+                             "_statistics_of_this_class",
+                             "_lazy_values_of_this_class",
+                             "_loading_depth_of_this_class",
+                             "_subscriptions_of_this_class",
+                             "_notifications_of_this_class",
+                             "_watcher_of_this_class",
+                             "_writer_of_this_class",
+                             "_validators_of_this_class",
+                             "_schema_hash_of_this_class",
+                             "_stored_values_are_valid_of_this_class",
+                             "_names_of_this_class",
+                             "_unwritten_defaults_of_this_class",
+                             "_options_of_this_class",
+                             "_schema_of_this_class",
+                             "_namespaces_of_this_class",
+                             "_storage_of_this_class",
+                             "_instrumentation_of_this_class",
                              "_ATTRIBUTES_TO_IGNORE")
+
+    # the internal attributes are kept in slots, such that __dict__ only holds the values of the
+    # attributes, and can be written as it is (see method _attributes_to_write)
+    __slots__ = tuple(name for name in _ATTRIBUTES_TO_IGNORE if name != "_ATTRIBUTES_TO_IGNORE") + \
+                ("_defaults_of_this_class", "__dict__", "__weakref__")
+
+    # (as sets, so that looking a name up does not depend on how many there are)
+    _IGNORED_NAMES = frozenset(_ATTRIBUTES_TO_IGNORE)
+    _INTERNAL_NAMES = frozenset(_ATTRIBUTES_TO_IGNORE + ("_defaults_of_this_class",))
+    _UNSLOTTED_NAMES = frozenset() # (internal attributes that end up in __dict__ nonetheless)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # subclasses may add to _ATTRIBUTES_TO_IGNORE (and should add these to __slots__ as well)
+        cls._IGNORED_NAMES = frozenset(cls._ATTRIBUTES_TO_IGNORE)
+        cls._INTERNAL_NAMES = frozenset(cls._ATTRIBUTES_TO_IGNORE + ("_defaults_of_this_class",))
+        slots = set()
+        for base in cls.__mro__:
+            base_slots = base.__dict__.get("__slots__", ())
+            slots.update((base_slots,) if isinstance(base_slots, str) else base_slots)
+        cls._UNSLOTTED_NAMES = cls._IGNORED_NAMES - slots - {"_ATTRIBUTES_TO_IGNORE"}
     
-    _HEADER_SPLITTER = 40*"#"
+    _HEADER_SPLITTER = HEADER_SPLITTER
+
+    _FLUSH_MODES = ("immediate", "deferred")
+
+    _BACKENDS = ("file", "journal", "sqlite", "memory")
+
+    _LOCK_EXTENSION = ".lock"
+
+    _DURABILITIES = ("none", "file", "directory")
+
+    _SCHEMA_HASH_KEY = "_schema_hash_of_this_class" # (under which the hash of the schema is stored in the file)
 
     
     def __init__(self, defaults = "dict",
                        filename = "preferences.txt",
                        header   = "",
+                       flush    = "immediate",
+                       flush_interval = 0.5,
+                       backend  = "file",
+                       compact_every = 1000,
+                       durability = "none",
+                       shared   = False,
+                       track_mutations = False,
+                       format   = None,
+                       lazy     = False,
+                       thread_safe = False,
+                       schema   = None,
+                       instrument = False,
+                       base_dir = None,
                        **keyword_defaults
                  ):
 
+        # (looked at whenever an attribute is set, so these come first)
+        self._initialization_complete_of_this_class = False
+        self._instrumentation_of_this_class = None
+        self._validators_of_this_class = {}
+        self._writer_of_this_class = None
+        self._watcher_of_this_class = None
+        self._undo_logs_of_this_class = [] # (one per batch, see method _batch)
+
+        # the names of all valid attributes (see method valid_attributes), as keys of a
+        # dict (which keeps them in order), so that no method has to search for them
+        self._names_of_this_class = {}
+
+        # values that are read from the file, but not decoded yet (see argument 'lazy')
+        self._lazy_values_of_this_class = {}
+        self._loading_depth_of_this_class = 0
+
         # processing filename
         if not isinstance(filename,(str,bytes)):
             error_message = "Argument 'filename' needs to be a path (either string or bytes) but found type %s."%filename
             raise TypeError(error_message)
         path_to_filename = os.path.split(filename)[0]
         if not os.path.isabs(path_to_filename): #it's not an absolute path, which makes it a relative path
-            import inspect
-
-            originating_folder = os.path.split( inspect.stack()[1][1] )[0]
+            if base_dir is not None:
+                originating_folder = base_dir
+            else:
+                # (only looks up the frame of the caller; inspect.stack() would collect every frame)
+                originating_folder = os.path.split( sys._getframe(1).f_code.co_filename )[0]
             path = os.path.join(originating_folder , filename) # gets path of place from where this function is called, and join it with the new filename/relative path
             path = os.path.abspath(path) # in case input was not formatted correctly
             path_to_filename = os.path.split(path)[0]
@@ -97,36 +483,127 @@ class Preferences():
 
         self._header_of_this_class = header
 
-        
-        saved_values = ""
-        try:        
-            with open(self._filename_to_store_the_preferences, 'r') as inputfile:
-                for line in inputfile:
-                    saved_values += line
-        except FileNotFoundError:
-             text_file = open(self._filename_to_store_the_preferences,'w')
-             text_file.close()             
+        # processing flush-mode
+        if not flush in self._FLUSH_MODES:
+            error_message = "Argument 'flush' should be one of '%s', but found '%s'."\
+                            %("', '".join(self._FLUSH_MODES), flush)
+            raise ValueError(error_message)
+        if isinstance(flush_interval, bool) or not isinstance(flush_interval, (int, float)):
+            error_message = "Argument 'flush_interval' should be a number, but found type %s."%(type(flush_interval))
+            raise TypeError(error_message)
+        if flush_interval < 0:
+            error_message = "Argument 'flush_interval' cannot be negative, but found %s."%(flush_interval)
+            raise ValueError(error_message)
+        self._flush_mode_of_this_class = flush
+        self._flush_interval_of_this_class = flush_interval
+        self._flush_timer_of_this_class = None
+        self._unwritten_changes_of_this_class = set()
+        self._unwritten_defaults_of_this_class = set() # (see method _store_default_change)
+        self._lock_of_this_class = threading.RLock()
+        self._batch_depth_of_this_class = 0
+        self._statistics_of_this_class = {"writes": 0, "unchanged_values": 0, "unchanged_writes": 0,
+                                          "coalesced_changes": 0, "bytes_written": 0}
+        # (None unless instrumented, see module 'instrumentation')
+        if instrument:
+            self._instrumentation_of_this_class = Instrumentation()
+        self._subscriptions_of_this_class = []
+        self._notifications_of_this_class = []
+        if flush == "deferred":
+            _INSTANCES_WITH_DEFERRED_WRITES.add(self)
+
+        # processing backend
+        if not (isinstance(backend, Storage) or backend in self._BACKENDS):
+            error_message = "Argument 'backend' should be one of '%s', but found '%s'."\
+                            %("', '".join(self._BACKENDS), backend)
+            raise ValueError(error_message)
+        if isinstance(compact_every, bool) or not isinstance(compact_every, int):
+            error_message = "Argument 'compact_every' should be an integer, but found type %s."%(type(compact_every))
+            raise TypeError(error_message)
+        if compact_every < 1:
+            error_message = "Argument 'compact_every' should be at least 1, but found %s."%(compact_every)
+            raise ValueError(error_message)
+        self._backend_of_this_class = backend
+
+        # processing durability
+        if not durability in self._DURABILITIES:
+            error_message = "Argument 'durability' should be one of '%s', but found '%s'."\
+                            %("', '".join(self._DURABILITIES), durability)
+            raise ValueError(error_message)
+        self._durability_of_this_class = durability
+
+        # processing shared
+        self._lock_file_of_this_class = None
+        self._file_lock_depth_of_this_class = 0
+        if shared:
+            if fcntl is None:
+                error_message = "Argument 'shared' requires module 'fcntl', which is not available on this platform."
+                raise OSError(error_message)
+            self._lock_file_of_this_class = open(self._sidecar_filename(self._LOCK_EXTENSION), 'a')
+
+        self._track_mutations_of_this_class = bool(track_mutations)
+
+        # processing format
+        if format is not None and not format in SERIALIZERS:
+            error_message = "Argument 'format' should be None or one of '%s', but found '%s'."\
+                            %("', '".join(SERIALIZERS), format)
+            raise ValueError(error_message)
+
+        # the storage that reads and writes the values (see module 'storage')
+        if isinstance(backend, Storage):
+            self._storage_of_this_class = backend
+        elif backend == "sqlite":
+            self._storage_of_this_class = SQLiteStorage(self._filename_to_store_the_preferences, durability)
+        elif backend == "memory":
+            self._storage_of_this_class = MemoryStorage()
         else:
-            saved_values = "".join(saved_values)
-            if self._HEADER_SPLITTER in saved_values:
-                header_from_file = saved_values.split(self._HEADER_SPLITTER)[0][:-2]
-                if not self._header_of_this_class:
-                    self._header_of_this_class = header_from_file
-                saved_values = saved_values.split(self._HEADER_SPLITTER)[-1]
-            saved_values = saved_values.replace("\n","")
-            try:
-                saved_values = json.loads(saved_values)
-            except:
-                print("something has gone wrong when trying to read the preferences_file named '%s'. What was read is: \n'%s'"%(
-                    self._filename_to_store_the_preferences,saved_values) )
-                raise
+            self._storage_of_this_class = FileStorage(self._filename_to_store_the_preferences,
+                                                      SERIALIZERS[format] if format is not None else None,
+                                                      durability, journal = backend == "journal",
+                                                      compact_every = compact_every)
+
+        # processing schema
+        self._validators_of_this_class = compile_schema(schema) if schema is not None else {}
+        self._schema_hash_of_this_class = schema_hash(schema) if schema is not None else None
+        self._schema_of_this_class = schema
+
+        # the arguments that the namespaces of this instance take over (see method namespace)
+        self._options_of_this_class = {"header": header, "flush": flush, "flush_interval": flush_interval,
+                                       "backend": backend, "compact_every": compact_every,
+                                       "durability": durability, "shared": shared,
+                                       "track_mutations": track_mutations, "format": format,
+                                       "lazy": lazy, "thread_safe": thread_safe, "instrument": instrument}
+        self._namespaces_of_this_class = {}
+
+        
+        with self._locked_file(exclusive = False):
+            header_from_file, saved_values = self._read_stored_values(lazy = lazy)
+        self._serializer_of_this_class = SERIALIZERS[format] if format is not None else self._storage_of_this_class.serializer
+        if header_from_file is not None and not self._header_of_this_class:
+            self._header_of_this_class = header_from_file
+        self._stored_header_of_this_class = header_from_file # (a new header is only stored by writing everything)
+        # values that were validated against the same schema when they were written, are not validated again
+        # (unless the journal changed them)
+        stored_schema_hash = saved_values.pop(self._SCHEMA_HASH_KEY, None)
+        if isinstance(stored_schema_hash, RawJSON):
+            stored_schema_hash = stored_schema_hash.decode()
+        self._stored_values_are_valid_of_this_class = self._schema_hash_of_this_class is not None and \
+            stored_schema_hash == self._schema_hash_of_this_class and not self._storage_of_this_class.journal_length
+        for attr_name in saved_values:
+            value = saved_values[attr_name]
+            if isinstance(value, RawJSON):
+                if attr_name == "_defaults_of_this_class":
+                    value = value.decode()
+                else:
+                    self._lazy_values_of_this_class[attr_name] = value
+                    self._names_of_this_class[attr_name] = None
+                    continue
+            if self._stored_values_are_valid_of_this_class:
+                self._set_attribute(attr_name, value)
             else:
-                for attr_name in saved_values:
-                    setattr(self, attr_name, saved_values[attr_name])
+                setattr(self, attr_name, value)
                         
-        try:
-            self._defaults_of_this_class = col.OrderedDict(sorted(self._defaults_of_this_class.items(),key = lambda x:x[0]))
-        except AttributeError:
+        # (the defaults are kept unsorted; they are only sorted when written, see method _attributes_to_write)
+        if not hasattr(self, "_defaults_of_this_class"):
             self._defaults_of_this_class = {}  #just initiating this attribute, the method set_default_values sets it
 
         self._initialization_complete_of_this_class = True
@@ -141,25 +618,511 @@ class Preferences():
         if keyword_defaults:
             self.set_default_values(keyword_defaults)
 
-    # TODO: ehmm, when a list is altered through methods like append or remove (or dicts with upgrade)
-    # the __setattr__ is not triggered, and therefore the value in the file is not changed
-    # the next link suggests a fix for this, although that is somewhat cumbbersome to integrate
-    # http://stackoverflow.com/questions/37799938/what-happens-when-we-editappend-remove-a-list-and-can-we-execute-actions-e
+        if thread_safe:
+            writer = _WriterThread(self)
+            self._writer_of_this_class = writer
+            weakref.finalize(self, writer.stop)
+            _INSTANCES_WITH_DEFERRED_WRITES.add(self)
+            writer.start()
+
+    @classmethod
+    def open_readonly(cls, filename = "preferences.txt", base_dir = None):
+        """
+        Opens the file 'filename', which must have been written in the
+        format "indexed" (see argument 'format'), read-only. Returns a
+        ReadOnlyPreferences, which maps the file into memory and only
+        decodes the values that are asked for (with method get, or as
+        attributes). This suits processes that only read a large file:
+        they do not hold a copy of every value, and share the memory of
+        the file with each other. A relative 'filename' is relative to
+        the calling script (or to 'base_dir', if given).
+
+        Example:
+        prefs = Preferences(filename = "big.prefs", format = "indexed")
+        view = Preferences.open_readonly("big.prefs")   # (in another process)
+        view.x
+        """
+        if isinstance(filename, (str, bytes)) and not os.path.isabs(filename):
+            if base_dir is None:
+                base_dir = os.path.split( sys._getframe(1).f_code.co_filename )[0]
+            filename = os.path.abspath(os.path.join(base_dir, filename))
+        return ReadOnlyPreferences(filename)
+
+
+    def _read_stored_values(self, lazy = False):
+        """
+        Reads the stored values (see module 'storage'). Returns the header
+        that was stored (None if there is none) and a dict with the stored
+        values. If 'lazy', the values may be returned as RawJSON (i.e. not
+        decoded yet).
+        """
+        self._file_signature_of_this_class = self._current_file_signature()
+        start = time.perf_counter()
+        header, values = self._storage_of_this_class.load(lazy)
+        self._record("load", start, len(values))
+        return header, values
+
+
+    def _record(self, event, start, detail = None):
+        # (adds the time since 'start' to the histogram of 'event', if instrumented)
+        instrumentation = self._instrumentation_of_this_class
+        if instrumentation is not None:
+            instrumentation.record(event, time.perf_counter() - start, detail)
+
+
+    def _record_encoding(self, encoding_time, characters_encoded):
+        # (records the encoding done by the storage since it had spent 'encoding_time' on 'characters_encoded')
+        instrumentation = self._instrumentation_of_this_class
+        storage = self._storage_of_this_class
+        if instrumentation is not None and storage.characters_encoded != characters_encoded:
+            instrumentation.record("encode", storage.encoding_time - encoding_time,
+                                   storage.characters_encoded - characters_encoded)
+
+
+    def _current_file_signature(self):
+        """
+        Returns something that changes whenever the file (or its journal)
+        is written, without having to read the file (see method signature
+        of the storage).
+        """
+        return self._storage_of_this_class.signature()
+
+
+    @contextmanager
+    def _locked_file(self, exclusive = True):
+        """
+        In the shared mode, locks the file for other processes (that use
+        this class) for the duration of the with-block. An exclusive
+        lock is needed for writing, while reading only requires a
+        shared lock. Does nothing when not in the shared mode.
+        """
+        if self._lock_file_of_this_class is None:
+            yield
+            return
+        with self._lock_of_this_class:
+            if not self._file_lock_depth_of_this_class:
+                fcntl.flock(self._lock_file_of_this_class, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._file_lock_depth_of_this_class += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth_of_this_class -= 1
+                if not self._file_lock_depth_of_this_class:
+                    fcntl.flock(self._lock_file_of_this_class, fcntl.LOCK_UN)
+
+
+    def _reload_changed_values(self, exclude = ()):
+        """
+        Takes over the values from the file, if the file has changed
+        since it was last read or written. Attributes in 'exclude' or
+        with changes that have not been written yet are left alone.
+        Returns the names of the attributes that changed.
+        """
+        if self._current_file_signature() == self._file_signature_of_this_class:
+            return []
+        header_from_file, saved_values = self._read_stored_values()
+        self._stored_header_of_this_class = header_from_file
+        exclude = set(exclude) | self._unwritten_changes_of_this_class
+        changed = []
+        for name in saved_values:
+            if name in exclude or name == self._SCHEMA_HASH_KEY:
+                continue
+            raw_value = self._lazy_values_of_this_class.pop(name, None)
+            if raw_value is not None:
+                old_value = raw_value.decode()
+            elif name == "_defaults_of_this_class":
+                old_value = self._defaults_of_this_class
+            else:
+                old_value = self.__dict__.get(name, _MISSING)
+            if raw_value is not None or old_value is _MISSING or old_value != saved_values[name]:
+                # these values have been checked by whoever wrote them
+                value = saved_values[name]
+                if self._track_mutations_of_this_class and name != "_defaults_of_this_class":
+                    value = track(value, self, name)
+                object.__setattr__(self, name, value)
+                if name != "_defaults_of_this_class":
+                    self._names_of_this_class[name] = None
+                if name != "_defaults_of_this_class" and (old_value is _MISSING or old_value != value):
+                    changed.append(name)
+                    self._add_notification(name, old_value, value)
+        for name in self.valid_attributes():
+            if not name in saved_values and not name in exclude:
+                # deleted by someone else
+                raw_value = self._lazy_values_of_this_class.pop(name, None)
+                if raw_value is None:
+                    old_value = self.__dict__[name]
+                    object.__delattr__(self, name)
+                else:
+                    old_value = raw_value.decode()
+                self._names_of_this_class.pop(name, None)
+                changed.append(name)
+                self._add_notification(name, old_value, _MISSING)
+        return changed
+
+
+    def reload(self):
+        """
+        Takes over the values from the file, if the file has changed
+        since it was last read or written (e.g. by another process).
+        This only costs a quick look at the file if it has not changed.
+        Attributes with changes that have not been written yet keep
+        their value. Returns the names of the attributes that changed.
+        In the shared mode, method get calls this method automatically.
+        """
+        with self._lock_of_this_class:
+            with self._locked_file(exclusive = False):
+                changed = self._reload_changed_values()
+        self._dispatch_notifications()
+        return changed
+
+
+    def subscribe(self, name_or_pattern, callback):
+        """
+        Calls 'callback' whenever an attribute whose name matches
+        'name_or_pattern' is changed by someone else (e.g. another
+        process), i.e. when such a change is taken over from the file by
+        method reload (or by method watch). The pattern may contain the
+        wildcards of module fnmatch, e.g. "window_*" or "*". The callback
+        is called with the name of the attribute, its old value and its
+        new value; a value is None if the attribute did not exist (yet).
+        """
+        if not isinstance(name_or_pattern, str):
+            error_message = "Argument 'name_or_pattern' should be a string, but found type %s."%(type(name_or_pattern))
+            raise TypeError(error_message)
+        if not callable(callback):
+            error_message = "Argument 'callback' should be callable, but found type %s."%(type(callback))
+            raise TypeError(error_message)
+        with self._lock_of_this_class:
+            self._subscriptions_of_this_class.append((name_or_pattern, callback))
+        return self # enables chaining
+
+
+    def unsubscribe(self, name_or_pattern, callback):
+        """
+        Undoes method subscribe (with the same arguments).
+        """
+        with self._lock_of_this_class:
+            try:
+                self._subscriptions_of_this_class.remove((name_or_pattern, callback))
+            except ValueError:
+                error_message = "'%s' is not subscribed to '%s'."%(callback, name_or_pattern)
+                raise ValueError(error_message)
+        return self
+
+
+    def _add_notification(self, name, old_value, new_value):
+        # (the callbacks are only called once the file is unlocked again; see method _dispatch_notifications)
+        if self._subscriptions_of_this_class:
+            self._notifications_of_this_class.append((name,
+                                                      None if old_value is _MISSING else old_value,
+                                                      None if new_value is _MISSING else new_value))
+
+
+    def _dispatch_notifications(self):
+        with self._lock_of_this_class:
+            notifications = self._notifications_of_this_class
+            self._notifications_of_this_class = []
+            subscriptions = list(self._subscriptions_of_this_class)
+        for name, old_value, new_value in notifications:
+            for pattern, callback in subscriptions:
+                if fnmatch.fnmatchcase(name, pattern):
+                    callback(name, old_value, new_value)
+
+
+    def watch(self, interval = 1.0, use_inotify = True):
+        """
+        Starts a background thread that takes over the changes other
+        processes make to the file (see method reload) as soon as they
+        are made, and calls the subscribed callbacks (see method
+        subscribe). On Linux the thread is woken up by the operating
+        system (inotify) when the file changes; otherwise (or if
+        'use_inotify' is False) it looks at the file every 'interval'
+        seconds. Watching stops with method stop_watching, or when this
+        instance is deleted. While watching, setting an attribute takes
+        the lock of this instance (as in the thread-safe mode), so that
+        it does not interfere with the changes taken over.
+        """
+        if isinstance(interval, bool) or not isinstance(interval, (int, float)):
+            error_message = "Argument 'interval' should be a number, but found type %s."%(type(interval))
+            raise TypeError(error_message)
+        if interval <= 0:
+            error_message = "Argument 'interval' should be positive, but found %s."%(interval)
+            raise ValueError(error_message)
+        reference = weakref.ref(self) # (the thread should not keep this instance alive)
+        def on_change():
+            preferences = reference()
+            if preferences is not None:
+                preferences.reload()
+        filenames = self._storage_of_this_class.filenames()
+        if not filenames:
+            error_message = "Only preferences that are stored in a file can be watched, but the backend is %s."\
+                            %(type(self._storage_of_this_class).__name__)
+            raise ValueError(error_message)
+        with self._lock_of_this_class:
+            self.stop_watching()
+            # (its own writes then do not look like changes made by someone else)
+            self._file_signature_of_this_class = self._current_file_signature()
+            watcher = FileWatcher(filenames, on_change, interval, use_inotify)
+            self._watcher_of_this_class = watcher
+            weakref.finalize(self, watcher.stop)
+            watcher.start()
+        return self
+
+
+    def stop_watching(self):
+        """
+        Stops the background thread started by method watch (if any).
+        """
+        with self._lock_of_this_class:
+            if self._watcher_of_this_class is not None:
+                self._watcher_of_this_class.stop()
+                self._watcher_of_this_class = None
+        return self
+
+
+    def namespace(self, name, defaults = "dict", **keyword_defaults):
+        """
+        Returns the namespace 'name' of these preferences: an instance of
+        this class that stores its attributes in a file of its own, next
+        to the file of this instance (e.g. "prefs.ui.txt" for namespace
+        "ui" of "prefs.txt"). Changing an attribute of a namespace only
+        writes the file of that namespace. A namespace takes over the
+        arguments of this instance (e.g. 'format' and 'flush'), and those
+        entries of its 'schema' that start with the name of the namespace
+        (e.g. "ui.theme"). 'defaults' and 'keyword_defaults' set default
+        values, just like when initializing this class. Asking for the
+        same namespace again returns the same instance. A dotted name
+        (e.g. "ui.colors") is a namespace within a namespace.
+
+        The attributes of a namespace can also be used through this
+        instance by their dotted name, in methods get, set, set_value,
+        get_default_value and delete_attribute. Only methods set and
+        set_value create a namespace that does not exist yet (i.e. that
+        has not been used, and has no file). An attribute of this
+        instance with a dotted name of its own (e.g. read from a file)
+        takes precedence over the namespaces.
+
+        Example:
+        prefs = Preferences(filename = "prefs.txt")
+        ui = prefs.namespace("ui", theme = "light")
+        ui.theme = "dark"                       # (only writes "prefs.ui.txt")
+        prefs.get("ui.theme")
+        """
+        if not isinstance(name, str):
+            error_message = "The name of a namespace should be a string, but found type %s."%(type(name))
+            raise TypeError(error_message)
+        if not all(part.isidentifier() for part in name.split(".")):
+            error_message = "The name of a namespace should be one or more identifiers separated by dots, "+\
+                            "but found '%s'."%(name)
+            raise ValueError(error_message)
+        if not (defaults == "dict" or isinstance(defaults, dict)):
+            error_message = "The argument defaults should be a dict, but rather found type %s"%(type(defaults))
+            raise TypeError(error_message)
+
+        if isinstance(self._backend_of_this_class, Storage):
+            error_message = "Namespaces need a backend that is given by name (e.g. \"memory\"), "+\
+                            "but the backend is an instance of %s."%(type(self._backend_of_this_class).__name__)
+            raise ValueError(error_message)
+
+        first, _, rest = name.partition(".")
+        with self._lock_of_this_class:
+            namespace = self._namespaces_of_this_class.get(first)
+            if namespace is None:
+                filename = self._namespace_filename(first)
+                prefix = first + "."
+                schema = {key[len(prefix):]: spec for key, spec in (self._schema_of_this_class or {}).items()
+                          if key.startswith(prefix)}
+                namespace = type(self)(filename = filename, schema = schema or None, **self._options_of_this_class)
+                self._namespaces_of_this_class[first] = namespace
+        if rest:
+            return namespace.namespace(rest, defaults, **keyword_defaults)
+        if isinstance(defaults, dict):
+            namespace.set_default_values(defaults)
+        if keyword_defaults:
+            namespace.set_default_values(keyword_defaults)
+        return namespace
+
+
+    def _namespace_filename(self, name):
+        # (the file of namespace 'name', next to the file of this instance)
+        root, extension = os.path.splitext(self._filename_to_store_the_preferences)
+        separator = "." if isinstance(root, str) else b"."
+        return root + separator + (name if isinstance(root, str) else os.fsencode(name)) + extension
+
+
+    def _existing_namespace(self, name):
+        """
+        Returns namespace 'name' (see method namespace) if it has been
+        used already, or if its file exists; otherwise returns None
+        (without creating it, nor its file).
+        """
+        namespace = self
+        for part in name.split("."):
+            found = namespace._namespaces_of_this_class.get(part)
+            if found is None:
+                if not (part.isidentifier() and namespace._backend_of_this_class in ("file", "journal", "sqlite")
+                        and os.path.exists(namespace._namespace_filename(part))):
+                    return None
+                found = namespace.namespace(part)
+            namespace = found
+        return namespace
+
+
+    def _namespace_of_name(self, name, create = True):
+        """
+        Returns the namespace that holds attribute 'name' and the name of
+        the attribute within it, e.g. the namespace "ui" and "theme" for
+        "ui.theme" (see method namespace). For a name without dots, or
+        that of an attribute of this instance itself (e.g. read from a
+        file), that is this instance and 'name' itself. Unless 'create',
+        a namespace is only returned if it exists already (see method
+        _existing_namespace); otherwise this instance is returned as well.
+        """
+        if isinstance(name, str) and "." in name and not name in self._names_of_this_class:
+            namespace_name, _, name_within = name.rpartition(".")
+            namespace = self.namespace(namespace_name) if create else self._existing_namespace(namespace_name)
+            if namespace is not None:
+                return namespace, name_within
+        return self, name
+
+
+    def _sidecar_filename(self, extension):
+        if isinstance(self._filename_to_store_the_preferences, bytes):
+            return self._filename_to_store_the_preferences + extension.encode()
+        return self._filename_to_store_the_preferences + extension
+
+
+    def _changes_to_write(self, names):
+        """
+        Returns the changes of the attributes 'names', as method
+        save_delta of the storage takes them (see module 'storage'): their
+        current values (or DELETED), the default values that changed (or
+        all default values, unless only some of them changed, see method
+        _store_default_change), and whether these are all of them.
+        """
+        values = {}
+        defaults = {}
+        all_defaults = False
+        for name in names:
+            if name == "_defaults_of_this_class":
+                changed_defaults = self._unwritten_defaults_of_this_class
+                self._unwritten_defaults_of_this_class = set()
+                if 0 < len(changed_defaults) < len(self._defaults_of_this_class):
+                    defaults = {key: self._defaults_of_this_class.get(key, DELETED) for key in changed_defaults}
+                else:
+                    defaults = dict(self._defaults_of_this_class)
+                    all_defaults = True
+            elif name in self.__dict__:
+                values[name] = self.__dict__[name]
+            elif name in self._lazy_values_of_this_class:
+                values[name] = self._lazy_values_of_this_class[name] # (stored as it was read)
+            else:
+                values[name] = DELETED
+        return values, defaults, all_defaults
+
+
+    # (when a list is altered through methods like append or remove (or dicts with update),
+    # the __setattr__ is not triggered; with 'track_mutations', the containers of module
+    # 'tracking' take care of that instead)
 
             
 
+    def __getattr__(self, name):
+        """
+        Only called if 'name' is not found the normal way. Decodes the
+        value of attribute 'name' if it has not been decoded yet (see
+        argument 'lazy' of this class).
+        """
+        # (internal attributes are only found here before they are set, see __slots__)
+        if not name in self._INTERNAL_NAMES and name in self._lazy_values_of_this_class:
+            self._load_lazy_value(name)
+            if name in self.__dict__:
+                return self.__dict__[name]
+        error_message = "'%s' object has no attribute '%s'"%(type(self).__name__, name)
+        raise AttributeError(error_message)
+
+
+    def _load_lazy_value(self, name):
+        """
+        Decodes the stored value of attribute 'name', and sets it, just
+        like it would have been set when initializing this class.
+        """
+        with self._lock_of_this_class:
+            if not name in self._lazy_values_of_this_class:
+                return # (e.g. another thread just did)
+            value = self._lazy_values_of_this_class[name].decode()
+            self._loading_depth_of_this_class += 1
+            try:
+                if self._stored_values_are_valid_of_this_class:
+                    self._set_attribute(name, value)
+                else:
+                    setattr(self, name, value)
+            finally:
+                self._loading_depth_of_this_class -= 1
+                self._lazy_values_of_this_class.pop(name, None)
+                if not name in self.__dict__:
+                    # (not set after all, e.g. as check_before_setting_attribute returned "pass")
+                    self._names_of_this_class.pop(name, None)
+
+
     def __setattr__(self,name,value):
         """
-        Overrides default behavior for __setattr__. Calls automatically
-        upon method write_to_file and check_before_changing_attribute.
+        Overrides default behavior for __setattr__. Validates the value
+        (see argument 'schema' of this class) and calls automatically
+        upon method check_before_changing_attribute, after which the
+        change is stored to file (see argument 'flush' of this class).
+        """
+        if name in self._INTERNAL_NAMES:
+            self._set_attribute(name, value)
+            return
+        if self._instrumentation_of_this_class is not None:
+            self._instrumented_setattr(name, value)
+            return
+        validators = self._validators_of_this_class
+        if validators and name in validators:
+            value = validators[name](value)
+        self._set_attribute(name, value)
+
+
+    def _instrumented_setattr(self, name, value):
+        # (method __setattr__, timing the validation and the whole of it; see argument 'instrument')
+        start = time.perf_counter()
+        validators = self._validators_of_this_class
+        if name in validators:
+            validation_start = time.perf_counter()
+            value = validators[name](value)
+            self._record("validate", validation_start, name)
+        self._set_attribute(name, value)
+        if self._initialization_complete_of_this_class and not self._loading_depth_of_this_class:
+            self._record("set", start, name) # (values that are read are part of "load")
+
+
+    def _set_attribute(self, name, value):
+        """
+        Sets attribute 'name' to a value that has been validated already
+        (see method __setattr__).
         """
         # if the method check_before_setting_attribute is blocked (i.e., manually,
         # because someone might not like other attributes to be set), these
         # select few private values can always be changed..
-        if not name in self._ATTRIBUTES_TO_IGNORE + ("_defaults_of_this_class",):
+        # They are kept in slots (see __slots__) and never end up in the file,
+        # apart from the default values.
+        if name in self._INTERNAL_NAMES:
+            if name == "_defaults_of_this_class" and self._undo_logs_of_this_class:
+                for default_name in set(self._defaults_of_this_class) | set(value):
+                    self._remember_old_default(default_name)
+            object.__setattr__(self, name, value)
+            if name == "_defaults_of_this_class" and self._initialization_complete_of_this_class \
+               and not self._loading_depth_of_this_class:
+                self._store_change(name)
+            return
+
+        if self._instrumentation_of_this_class is None:
             result_of_check = self.check_before_setting_attribute(name,value)
         else:
-            result_of_check = True
+            start = time.perf_counter()
+            result_of_check = self.check_before_setting_attribute(name,value)
+            self._record("check", start, name)
             
         if result_of_check == "pass":
             pass
@@ -169,17 +1132,32 @@ class Preferences():
                                 %(type(value),name) #json won't accept functions and such, only predefined numbers and things
                 raise TypeError(error_message)
             
-            super().__setattr__(name,value)
-            
-            # during initialization, some values will be set. This should not trigger the file being (over)written
-            # Therefor, the attribute "_initialization_complete_of_this_class" is only initialized at the end of __init__
-            # If this value is not initialized, access to the file is blocked                
-            try:
-                self._initialization_complete_of_this_class                
-            except AttributeError:
-                pass
-            else:
-                self.write_to_file()
+            if self._track_mutations_of_this_class:
+                value = track(value, self, name)
+            # (in the thread-safe mode, the change and storing it go together; so they do while watching,
+            # as the watching thread takes over the changes of others meanwhile, see method watch)
+            with self._lock_of_this_class if self._writer_of_this_class is not None or \
+                                             self._watcher_of_this_class is not None else nullcontext():
+                values = self.__dict__ # (only holds the values of the attributes, see __slots__)
+                old_value = values.get(name, _MISSING)
+                if self._undo_logs_of_this_class:
+                    self._remember_old_value(name)
+                values[name] = value
+                self._names_of_this_class[name] = None
+                if self._lazy_values_of_this_class:
+                    self._lazy_values_of_this_class.pop(name, None) # (its stored value is no longer relevant)
+
+                # during initialization, some values will be set. This should not trigger the file being (over)written
+                # Therefor, the attribute "_initialization_complete_of_this_class" is only set to True at the end of __init__
+                # If this value is not True, access to the file is blocked
+                if not self._initialization_complete_of_this_class or self._loading_depth_of_this_class:
+                    pass
+                elif _is_same_value(old_value, value) and self._lock_file_of_this_class is None \
+                                                      and self._watcher_of_this_class is None:
+                    # (in the shared mode, or while watching, the file may hold another value by now)
+                    self._statistics_of_this_class["unchanged_values"] += 1
+                else:
+                    self._store_change(name)
         else:
             error_message = "The change of the attribute '"+name+"' failed the method "+\
                             "'check_before_setting_attribute' in this class; "+\
@@ -188,33 +1166,507 @@ class Preferences():
             raise TypeError(error_message)
         
 
+    def __delattr__(self, name):
+        # (only removes the attribute from this instance; see method delete_attribute)
+        if self._undo_logs_of_this_class:
+            self._remember_old_value(name, deleted = True)
+        super().__delattr__(name)
+        self._names_of_this_class.pop(name, None)
+
+
+    def _remember_old_value(self, name, deleted = False):
+        """
+        Keeps the state of attribute 'name' in the undo log of the
+        innermost batch, unless it is kept already (i.e. only its state
+        before the batch changed it), see method _batch. If the attribute
+        is about to be 'deleted', the order of the names is kept too.
+        """
+        undo_log = self._undo_logs_of_this_class[-1]
+        if deleted and undo_log.names_order is None:
+            undo_log.names_order = list(self._names_of_this_class)
+        if not name in undo_log.values:
+            undo_log.values[name] = (self.__dict__.get(name, _MISSING),
+                                     self._lazy_values_of_this_class.get(name, _MISSING),
+                                     name in self._names_of_this_class)
+
+
+    def _remember_old_default(self, name):
+        # (just like method _remember_old_value, but for the default value of 'name')
+        if self._undo_logs_of_this_class:
+            undo_log = self._undo_logs_of_this_class[-1]
+            if not name in undo_log.defaults:
+                undo_log.defaults[name] = self._defaults_of_this_class.get(name, _MISSING)
+
+
+    def _store_change(self, name):
+        """
+        Registers that attribute 'name' has changed, and makes sure that
+        change ends up in the file. In the "immediate" flush-mode it is
+        written right away, while in the "deferred" flush-mode a
+        background thread writes it (and any other changes that come in
+        meanwhile) after 'flush_interval' seconds. Inside a batch (see
+        method batch) nothing is written until the batch is finished.
+        """
+        with self._lock_of_this_class:
+            if self._undo_logs_of_this_class and not name in self._unwritten_changes_of_this_class:
+                self._undo_logs_of_this_class[-1].unwritten_changes.add(name)
+            self._unwritten_changes_of_this_class.add(name)
+            if self._batch_depth_of_this_class:
+                return
+        self._write_unwritten_changes()
+
+
+    def _store_default_change(self, name):
+        """
+        Registers that the default value of attribute 'name' has changed
+        (or has been removed), which is then stored just like a change of
+        an attribute. The backends "journal" and "sqlite" only store
+        the default values that changed, instead of all of them.
+        """
+        with self._lock_of_this_class:
+            if self._undo_logs_of_this_class and not name in self._unwritten_defaults_of_this_class:
+                self._undo_logs_of_this_class[-1].unwritten_defaults.add(name)
+            self._unwritten_defaults_of_this_class.add(name)
+        self._store_change("_defaults_of_this_class")
+
+
+    def _write_unwritten_changes(self):
+        if self._writer_of_this_class is not None:
+            self._writer_of_this_class.request_write()
+            return
+        with self._lock_of_this_class:
+            if self._flush_mode_of_this_class == "deferred":
+                if self._flush_timer_of_this_class is None:
+                    timer = threading.Timer(self._flush_interval_of_this_class,
+                                            self._flush_from_timer)
+                    timer.daemon = True
+                    self._flush_timer_of_this_class = timer
+                    timer.start()
+                return
+        self.flush()
+
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that collects all changes made within it, and
+        writes them to the file only once, when the with-block is left.
+        Every value is still checked by check_before_setting_attribute
+        at the moment it is set. If an error is raised within the
+        with-block, all attributes (and default values) are restored to
+        the state they had before the with-block, and nothing is
+        written (unless changes were written within the with-block, e.g.
+        by method flush; these are then written back). Batches can be
+        nested; only the outermost one writes.
+
+        In the thread-safe mode, other threads cannot change anything
+        until the with-block is left.
+
+        Example:
+        with prefs.batch():
+            prefs.x = 1
+            prefs.y = 2     # the file is written once, after this line
+        """
+        if self._writer_of_this_class is not None:
+            with self._lock_of_this_class: # (held for the entire with-block)
+                with self._batch() as batch:
+                    yield batch
+        else:
+            with self._batch() as batch:
+                yield batch
+
+
+    @contextmanager
+    def _batch(self):
+        with self._lock_of_this_class:
+            all_defaults_unwritten = not self._unwritten_defaults_of_this_class and \
+                                     "_defaults_of_this_class" in self._unwritten_changes_of_this_class
+            undo_log = _UndoLog(self._statistics_of_this_class["writes"], all_defaults_unwritten)
+            self._undo_logs_of_this_class.append(undo_log)
+            self._batch_depth_of_this_class += 1
+        try:
+            yield self
+        except:
+            with self._lock_of_this_class:
+                self._batch_depth_of_this_class -= 1
+                self._undo_logs_of_this_class.pop()
+                self._undo(undo_log)
+                write_back = undo_log.writes != self._statistics_of_this_class["writes"] and \
+                             not self._batch_depth_of_this_class
+            if write_back:
+                self._write_unwritten_changes()
+            raise
+        else:
+            with self._lock_of_this_class:
+                self._batch_depth_of_this_class -= 1
+                self._undo_logs_of_this_class.pop()
+                if self._undo_logs_of_this_class:
+                    undo_log.merge_into(self._undo_logs_of_this_class[-1])
+                if self._batch_depth_of_this_class or not self._unwritten_changes_of_this_class:
+                    return
+            self._write_unwritten_changes()
+
+
+    def _undo(self, undo_log):
+        """
+        Restores every attribute and default value in 'undo_log' (see
+        method _batch) to the state it had before the batch changed it.
+        If the batch wrote anything meanwhile (e.g. by method flush), the
+        restored values are marked to be written back.
+        """
+        values = self.__dict__ # (only holds the values of the attributes, see __slots__)
+        lazy_values = self._lazy_values_of_this_class
+        names = self._names_of_this_class
+        for name, (value, raw_value, existed) in undo_log.values.items():
+            if value is _MISSING:
+                values.pop(name, None)
+            else:
+                values[name] = value
+            if raw_value is _MISSING:
+                lazy_values.pop(name, None)
+            else:
+                lazy_values[name] = raw_value
+            if existed:
+                names.setdefault(name, None)
+            else:
+                names.pop(name, None)
+        if undo_log.names_order is not None:
+            # (the attributes that were deleted are put back in their place)
+            order = {name: None for name in undo_log.names_order if name in names}
+            order.update(names)
+            names.clear()
+            names.update(order)
+            ordered_values = [(name, values[name]) for name in order if name in values]
+            ordered_values += [(name, value) for name, value in values.items() if not name in order]
+            values.clear()
+            values.update(ordered_values)
+        defaults = self._defaults_of_this_class
+        for name, default in undo_log.defaults.items():
+            if default is _MISSING:
+                defaults.pop(name, None)
+            else:
+                defaults[name] = default
+        self._unwritten_changes_of_this_class -= undo_log.unwritten_changes
+        self._unwritten_defaults_of_this_class -= undo_log.unwritten_defaults
+        if undo_log.writes != self._statistics_of_this_class["writes"]:
+            self._unwritten_changes_of_this_class |= set(undo_log.values)
+            if undo_log.defaults:
+                if not undo_log.all_defaults_unwritten:
+                    # (otherwise all default values are written already)
+                    self._unwritten_defaults_of_this_class |= set(undo_log.defaults)
+                self._unwritten_changes_of_this_class.add("_defaults_of_this_class")
+
+
+    def _flush_from_timer(self):
+        with self._lock_of_this_class:
+            self._flush_timer_of_this_class = None
+            self.flush()
+
+
+    def flush(self):
+        """
+        Writes any changes that have not been written to the file yet.
+        In the "immediate" flush-mode every change is written right
+        away, so there is hardly ever anything to flush. In the
+        "deferred" flush-mode this method forces pending changes to be
+        written now, instead of waiting for the background thread. In the
+        thread-safe mode, this method waits until the writing thread has
+        written all changes made so far. The namespaces of this instance
+        (see method namespace) are flushed as well.
+        """
+        for namespace in list(self._namespaces_of_this_class.values()):
+            namespace.flush()
+        writer = self._writer_of_this_class
+        if writer is not None:
+            if not self._lock_of_this_class._is_owned():
+                writer.write_and_wait()
+                return self
+            # (e.g. within a batch; the writing thread cannot get the lock, so this thread writes)
+            with writer.writing:
+                self._flush_in_this_thread()
+            return self
+        self._flush_in_this_thread()
+        return self # enables chaining
+
+
+    def _flush_in_this_thread(self):
+        with self._lock_of_this_class:
+            if self._flush_timer_of_this_class is not None:
+                self._flush_timer_of_this_class.cancel()
+                self._flush_timer_of_this_class = None
+            if self._unwritten_changes_of_this_class:
+                names = self._unwritten_changes_of_this_class
+                self._unwritten_changes_of_this_class = set()
+                unwritten_defaults = self._unwritten_defaults_of_this_class # (cleared by method _changes_to_write)
+                try:
+                    with self._locked_file():
+                        if self._lock_file_of_this_class is not None:
+                            # takes over the changes other processes made in the meantime
+                            self._reload_changed_values(exclude = names)
+                        # (only the changes, if the storage can; otherwise everything)
+                        storage = self._storage_of_this_class
+                        self._statistics_of_this_class["coalesced_changes"] += len(names) - 1
+                        start = time.perf_counter()
+                        bytes_written = storage.bytes_written
+                        if storage.exists() and (self._stored_header_of_this_class or None) == (self._header_of_this_class or None) \
+                                            and storage.save_delta(*self._changes_to_write(names)):
+                            self._count_write(True, start, storage.bytes_written - bytes_written)
+                        else:
+                            self.write_to_file()
+                        if self._lock_file_of_this_class is not None or self._watcher_of_this_class is not None:
+                            self._file_signature_of_this_class = self._current_file_signature()
+                except:
+                    # (to try again with the next write)
+                    self._unwritten_changes_of_this_class |= names
+                    self._unwritten_defaults_of_this_class |= unwritten_defaults
+                    raise
+        self._dispatch_notifications() # (of changes made by other processes in the meantime)
+
+
+    def _write_from_writer_thread(self):
+        """
+        Writes the unwritten changes (in the thread-safe mode). With the
+        backend "file", the content is encoded while holding the lock, but
+        written without it, so that other threads can continue meanwhile.
+        """
+        with self._lock_of_this_class:
+            if self._backend_of_this_class != "file" or self._lock_file_of_this_class is not None:
+                self._flush_in_this_thread()
+                return
+            if not self._unwritten_changes_of_this_class:
+                return
+            names = self._unwritten_changes_of_this_class
+            self._unwritten_changes_of_this_class = set()
+            self._statistics_of_this_class["coalesced_changes"] += len(names) - 1
+            write = self._encode_file_content(self._writer_of_this_class.writing)
+            self._writer_of_this_class.writing.acquire()
+        try:
+            write()
+        except:
+            with self._lock_of_this_class:
+                self._unwritten_changes_of_this_class |= names # (to try again with the next write)
+            raise
+
+
+    def _encode_file_content(self, writing):
+        """
+        Encodes the content of the file right away, and returns a function
+        that writes that content to the file (see method encode of class
+        FileStorage). The caller acquires lock 'writing' before letting go
+        of the lock of this instance; the function releases it once the
+        file is replaced (before counting the write, which needs the lock
+        of this instance).
+        """
+        storage = self._storage_of_this_class
+        encoding_time, characters_encoded = storage.encoding_time, storage.characters_encoded
+        write = storage.encode(self._header_of_this_class, self._attributes_to_write())
+        self._record_encoding(encoding_time, characters_encoded)
+        self._stored_header_of_this_class = self._header_of_this_class
+        self._unwritten_defaults_of_this_class = set() # (as all of them are written now)
+        def write_and_count():
+            start = time.perf_counter()
+            bytes_written = storage.bytes_written
+            try:
+                written = write()
+                bytes_written = storage.bytes_written - bytes_written
+            finally:
+                writing.release()
+            self._count_write(written, start, bytes_written)
+        return write_and_count
+
+
     def write_to_file(self):
         """
         Writes ALL the values to the file.
-        This method is automatically called by __setattr__,
-        i.e. whenever the value of an attribute is set.
+        This method is automatically called (through method flush)
+        whenever the value of an attribute is set. With the backend
+        "journal", the journal is merged into the file by this method
+        (and emptied). With the backend "sqlite", all rows of the
+        database are replaced.
         """
         if self._initialization_complete_of_this_class:
-            
-            attributes = copy(self.__dict__)
-            for x in self._ATTRIBUTES_TO_IGNORE:
+            with self._locked_file():
+                storage = self._storage_of_this_class
+                start = time.perf_counter()
+                bytes_written = storage.bytes_written
+                encoding_time, characters_encoded = storage.encoding_time, storage.characters_encoded
+                attributes = self._attributes_to_write()
+                unwritten_defaults = self._unwritten_defaults_of_this_class
+                self._unwritten_defaults_of_this_class = set() # (as all of them are written now)
+                # (the backends "journal" and "sqlite" avoid rewriting everything for every change)
                 try:
-                    del attributes[x] # if this gets into the file, the attribute "_initialization_complete_of_this_class" could be initialized before it is supposed to. This could bring havoc upon method __init__
+                    written = storage.save_full(self._header_of_this_class, attributes)
                 except:
-                    pass
-            attributes = col.OrderedDict(sorted(attributes.items(), key = lambda x: x[0] if x[0] != "_defaults_of_this_class" else 40*"z"))
+                    self._unwritten_defaults_of_this_class |= unwritten_defaults # (to try again with the next write)
+                    raise
+                self._stored_header_of_this_class = self._header_of_this_class
+                self._record_encoding(encoding_time, characters_encoded)
+                self._count_write(written, start, storage.bytes_written - bytes_written)
+        return self
+
 
-            Z = json.dumps(attributes)
-            Z = Z[0:Z.index("_defaults_of_this_class")-1].replace(",",",\n") +"\n "+ Z[Z.index("_defaults_of_this_class")-1:].replace(",",",\n"+28*" ") # remark: I am pretty-typing json myself, but json self also has this capability. erghh, too late for that
+    def _count_write(self, written, start, bytes_written):
+        # (a write that began at 'start'; 'written' is False if it was skipped, see method stats)
+        with self._lock_of_this_class:
+            if written:
+                self._statistics_of_this_class["writes"] += 1
+                self._statistics_of_this_class["bytes_written"] += bytes_written
+            else:
+                self._statistics_of_this_class["unchanged_writes"] += 1
+        if written:
+            self._record("write", start, bytes_written)
 
-            if self._header_of_this_class:
-                Z = self._header_of_this_class + "\n\n"+self._HEADER_SPLITTER+"\n\n" + Z
 
-            text_file = open(self._filename_to_store_the_preferences, "w")
-            text_file.write("%s" % Z) # TODO: right now I rewrite the entire file everytime, but this is time-consuming: I should only overwrite the lines that need overwriting....
-            text_file.close()
+    def export_to_file(self, filename, format = "json", base_dir = None):
+        """
+        Writes all values (and default values) to 'filename', in 'format'
+        (see argument 'format'), e.g. to turn the database of the backend
+        "sqlite" into a file that can be read (and edited) by hand. The
+        file of this instance is left alone. A relative 'filename' is
+        relative to the calling script (or to 'base_dir', if given).
+        """
+        if not format in SERIALIZERS:
+            error_message = "Argument 'format' should be one of '%s', but found '%s'."\
+                            %("', '".join(SERIALIZERS), format)
+            raise ValueError(error_message)
+        if isinstance(filename, (str, bytes)) and not os.path.isabs(filename):
+            if base_dir is None:
+                base_dir = os.path.split( sys._getframe(1).f_code.co_filename )[0]
+            filename = os.path.abspath(os.path.join(base_dir, filename))
+        serializer = SERIALIZERS[format]
+        with self._lock_of_this_class:
+            attributes = self._attributes_to_write()
+        if not serializer.writes_raw_json:
+            for name, value in attributes.items():
+                if isinstance(value, RawJSON):
+                    attributes[name] = value.decode()
+        write_atomically(filename, lambda opened_file: serializer.dump(self._header_of_this_class, attributes, opened_file),
+                          self._durability_of_this_class, serializer.binary)
         return self
-            
+
+
+    def import_from_file(self, filename, base_dir = None):
+        """
+        Takes over all values and default values stored in 'filename',
+        which may be any file written by this class (in any format, and
+        including its journal), or a database of the backend "sqlite".
+        They are set as if by methods set_default_values and set_value
+        (so they are checked), and stored all at once. A relative
+        'filename' is relative to the calling script (or to 'base_dir',
+        if given).
+
+        Example (to move the preferences from a file into a database):
+        prefs = Preferences(filename = "prefs.db", backend = "sqlite")
+        prefs.import_from_file("prefs.txt")
+        """
+        if isinstance(filename, (str, bytes)) and not os.path.isabs(filename):
+            if base_dir is None:
+                base_dir = os.path.split( sys._getframe(1).f_code.co_filename )[0]
+            filename = os.path.abspath(os.path.join(base_dir, filename))
+        if not os.path.exists(filename):
+            error_message = "No such file: '%s'."%(os.fsdecode(filename))
+            raise FileNotFoundError(error_message)
+        source = Preferences(filename = filename, backend = "sqlite" if is_database(filename) else "file")
+        try:
+            values = {name: source.get(name) for name in source.valid_attributes()}
+            with self.batch():
+                self.set_default_values(source._defaults_of_this_class)
+                self.set_value(values)
+        finally:
+            source._storage_of_this_class.close()
+        return self
+
+
+    def fork(self, *dicts_with_values, **keyword_attributes):
+        """
+        Returns a copy-on-write variant of these preferences (see module
+        'fork'): a PreferencesFork, in which the values are those of this
+        instance, apart from those set in the fork. The values in
+        'dicts_with_values' and 'keyword_attributes' are set in the fork
+        right away (just like method set_value takes them). The fork
+        shares all other values with this instance, so creating it only
+        costs as much as the values that differ. The fork is never
+        written to a file, unless by its method export_to_file.
+
+        Example:
+        variant = prefs.fork(theme = "dark")
+        variant.theme                   # "dark", while prefs.theme is unchanged
+        variant.font_size               # the value of prefs.font_size
+        """
+        return PreferencesFork(self).set_value(*dicts_with_values, **keyword_attributes)
+
+
+    def snapshot(self):
+        """
+        Returns a Snapshot of all values and default values as they are
+        now, which method restore can put back later. Values that are
+        lists, dicts or sets are copied; all other values are shared
+        (and values that have not been decoded yet, see argument 'lazy',
+        are kept as they were read), so a snapshot is cheap.
+        """
+        with self._lock_of_this_class:
+            values = {name: copy_value(value) for name, value in self.__dict__.items()
+                      if not name in self._UNSLOTTED_NAMES}
+            defaults = {name: copy_value(value) for name, value in self._defaults_of_this_class.items()}
+            return Snapshot(values, dict(self._lazy_values_of_this_class), defaults)
+
+
+    def restore(self, snapshot):
+        """
+        Puts back the values and default values of 'snapshot' (see method
+        snapshot): attributes that did not exist yet are deleted, and
+        those that did are set to the value they had. Only the values
+        that differ are stored, all at once (see method batch). The same
+        snapshot can be restored more than once.
+        """
+        if not isinstance(snapshot, Snapshot):
+            error_message = "Argument 'snapshot' should be a Snapshot (see method snapshot), but found type %s."\
+                            %(type(snapshot))
+            raise TypeError(error_message)
+        with self.batch():
+            for name in self.valid_attributes():
+                if not name in snapshot.values and not name in snapshot.lazy_values:
+                    self.delete_attribute(name)
+            for name, value in snapshot.values.items():
+                self._set_attribute(name, copy_value(value))
+            for name, raw_value in snapshot.lazy_values.items():
+                if self._lazy_values_of_this_class.get(name) is not raw_value:
+                    self._set_attribute(name, raw_value.decode())
+            defaults = self._defaults_of_this_class
+            for name in [name for name in defaults if not name in snapshot.defaults]:
+                self._remember_old_default(name)
+                del defaults[name]
+                self._store_default_change(name)
+            for name, value in snapshot.defaults.items():
+                if not name in defaults or not _is_same_value(defaults[name], value):
+                    self._remember_old_default(name)
+                    defaults[name] = copy_value(value)
+                    self._store_default_change(name)
+        return self # enables chaining
+
+
+    def _attributes_to_write(self):
+        """
+        Returns all values that belong in the file, sorted by name, with
+        the default values last.
+        """
+        # (__dict__ only holds the values of the attributes, see __slots__)
+        items = list(self.__dict__.items())
+        if self._UNSLOTTED_NAMES:
+            items = [(name, value) for name, value in items if not name in self._UNSLOTTED_NAMES]
+        serializer = self._serializer_of_this_class
+        for name, raw_value in self._lazy_values_of_this_class.items():
+            # values that have not been decoded are written as they were read (if possible)
+            items.append((name, raw_value if serializer.writes_raw_json else raw_value.decode()))
+        if self._schema_hash_of_this_class is not None:
+            items.append((self._SCHEMA_HASH_KEY, self._schema_hash_of_this_class))
+        items.sort(key = lambda x: x[0])
+        attributes = col.OrderedDict(items)
+        # (the defaults are kept unsorted, and only sorted here)
+        attributes["_defaults_of_this_class"] = col.OrderedDict(sorted(self._defaults_of_this_class.items(),
+                                                                       key = lambda x: x[0]))
+        return attributes
+
 
     def set_default_values(self, *dicts_with_default_values, **kwargs):
         """
@@ -232,6 +1684,7 @@ class Preferences():
          e.g. A.set_default_values( x = 1 )
         Input accepts multiple dicts and keywords, e.g.
         A.set_default_values( { "x":1}, {"y1":2,"y2":3}, z1=1, z2=2 )
+        Only default values that actually change are stored again.
         """
         master_dict = {}
         for dict_with_default_values in dicts_with_default_values:
@@ -244,17 +1697,25 @@ class Preferences():
 
 
 
+        # all attributes and defaults are written to file at once
         error_collection = []
-        for x in master_dict.copy():
-            if not isinstance(x,str):
-                error_collection.append([x,master_dict[x]])
-                del master_dict[x]
-            else:
-                try:
-                    getattr(self,x)
-                except AttributeError:
+        with self.batch():
+            for x in master_dict.copy():
+                if not isinstance(x,str):
+                    error_collection.append([x,master_dict[x]])
+                    del master_dict[x]
+                elif not x in self._names_of_this_class and not hasattr(type(self), x):
                     setattr(self,x,master_dict[x])
 
+            if not error_collection:
+                # updated in place, and only stored if they changed
+                defaults = self._defaults_of_this_class
+                for x in master_dict:
+                    if not x in defaults or not _is_same_value(defaults[x], master_dict[x]):
+                        self._remember_old_default(x)
+                        defaults[x] = master_dict[x]
+                        self._store_default_change(x)
+
         if error_collection:
             error_message = "To set default for an attribute, the key in"+\
                             " the dict must be of instance string, but found"+\
@@ -262,11 +1723,6 @@ class Preferences():
                              %( ", ".join(["%s"%(x[0]) for x in error_collection]),
                                 ", ".join(["%s"%(x[1]) for x in error_collection]) )
             raise ValueError(error_message)
-
-        dict_copy = self._defaults_of_this_class.copy()
-        dict_copy.update( master_dict )       
-        
-        self._defaults_of_this_class = col.OrderedDict(sorted(dict_copy.items(),key = lambda x:x[0]))
                 
         return self # enables chaining
 
@@ -275,9 +1731,7 @@ class Preferences():
         Returns current valid attributes as strings, in a list.
         (i.e. excluding the private attributes of this class).
         """
-        current_attributes = self.__dict__.keys()
-        VALID_ATTRIBUTES = [a for a in current_attributes if not a in self._ATTRIBUTES_TO_IGNORE + ("_defaults_of_this_class",) ]
-        return VALID_ATTRIBUTES
+        return list(self._names_of_this_class)
 
 
     def reset_to_default(self,*attr_names, exclude = None):
@@ -294,7 +1748,7 @@ class Preferences():
         """
         
         names = []
-        VALID_ATTRIBUTES = self.valid_attributes()
+        valid_names = self._names_of_this_class # (the list of them is only made when it is needed)
         if len(attr_names) != 0:
             for attr_name in attr_names:
                 if not isinstance(attr_name,list):
@@ -306,7 +1760,7 @@ class Preferences():
                 else:
                     names += attr_name
         else: # if no args input, all attributes will be reset
-            names = VALID_ATTRIBUTES
+            names = self.valid_attributes()
 
         # handles keyword 'exclude', and filters it/them into correct format
         if not isinstance(exclude,(list,tuple,str,type(None))):
@@ -328,41 +1782,113 @@ class Preferences():
                                 "(which can be collected in tuple or list)"+\
                                 " but found type %s."%(type(exc))
                 raise TypeError(error_message)
-            if not exc in VALID_ATTRIBUTES:
+            if not exc in valid_names:
                 excluded_names += [exc]
-            elif exc in names:
-                names.remove(exc)
+        if exclude:
+            exclude_set = set(exclude)
+            names = [name for name in names if not name in exclude_set]
                 
         # error module, for wrongly named attributes    
         if excluded_names: 
             def f(s,m):
                 return (m if len(excluded_names)>1  else s)
             error_message = "The attribute%s '%s' you tried to exclude, %s not %svalid attribute%s. Valid attributes are '%s'."\
-                   %(f("","s"),"', '".join(exclude), f("is","are"),f(" a",""), f("","s"), "', '".join(VALID_ATTRIBUTES)) 
+                   %(f("","s"),"', '".join(exclude), f("is","are"),f(" a",""), f("","s"), "', '".join(self.valid_attributes())) 
             raise AttributeError(error_message)
 
         # collects any attributes that did not have a default value   
         name_error = []        
-        for name in names:
-            if not isinstance(name,str):
-                error_message = "The attributes should be the "+\
-                                "string-equivalents, but found type %s"\
-                                %(type(name))
-                raise TypeError(error_message)
-            try:                
-                setattr(self, name, self._defaults_of_this_class[name])                
-            except:                
-                name_error += [name]
+        with self.batch(): # all attributes are written to file at once
+            for name in names:
+                if not isinstance(name,str):
+                    error_message = "The attributes should be the "+\
+                                    "string-equivalents, but found type %s"\
+                                    %(type(name))
+                    raise TypeError(error_message)
+                try:                
+                    setattr(self, name, self._defaults_of_this_class[name])                
+                except:                
+                    name_error += [name]
 
         # resets attributes        
         if attr_names and name_error:
             error_message = "No attributes found named '%s'; valid attributes are '%s'."\
-                            %("', '".join(name_error),"', '".join(VALID_ATTRIBUTES))
+                            %("', '".join(name_error),"', '".join(self.valid_attributes()))
             raise AttributeError(error_message)
 
         return name_error # returns any attributes that did not have a default value 
 
 
+    def stats(self):
+        """
+        Returns a dict with counters of how often this instance wrote to
+        its file (or journal): "writes" counts the actual writes,
+        "unchanged_values" counts how often an attribute was set to the
+        value it already had (which is not written; only for strings,
+        numbers and the like, of the same type, and neither in the
+        shared mode nor while watching), and
+        "unchanged_writes" counts how often writing was skipped because
+        the file would have remained exactly the same. Furthermore,
+        "coalesced_changes" counts the changes that were written together
+        with another change (rather than written on their own), and
+        "bytes_written" counts the bytes written to the file (or journal,
+        or database). If instrumented (see argument 'instrument' and
+        method add_hook), "timings" holds a dict with, per event (see
+        module 'instrumentation'), the number of times it happened, their
+        total, mean, minimum and maximum duration (in seconds), estimates
+        of the median ("p50") and 99th percentile ("p99"), and the
+        histogram of the durations as a list of (upper bound, number).
+        """
+        with self._lock_of_this_class:
+            statistics = dict(self._statistics_of_this_class)
+        if self._instrumentation_of_this_class is not None:
+            statistics["timings"] = self._instrumentation_of_this_class.as_dict()
+        return statistics
+
+
+    def add_hook(self, event, callback):
+        """
+        Calls 'callback' with the duration (in seconds) and a detail of
+        'event' every time that event happens (see module
+        'instrumentation'): "set" (the detail is the name of the
+        attribute), "validate" (idem), "check" (idem), "encode" (the
+        number of characters, or bytes, that the values were encoded
+        into), "write" (the number of bytes written) or "load" (the
+        number of values read). This also turns the instrumentation on
+        (see argument 'instrument'). The callback is called in the thread
+        that caused the event, e.g. the thread that writes the file.
+
+        Example:
+        prefs.add_hook("write", lambda duration, size: print("wrote %s bytes in %.3fs"%(size, duration)))
+        """
+        if not event in EVENTS:
+            error_message = "Argument 'event' should be one of '%s', but found '%s'."\
+                            %("', '".join(EVENTS), event)
+            raise ValueError(error_message)
+        if not callable(callback):
+            error_message = "Argument 'callback' should be callable, but found type %s."%(type(callback))
+            raise TypeError(error_message)
+        with self._lock_of_this_class:
+            if self._instrumentation_of_this_class is None:
+                self._instrumentation_of_this_class = Instrumentation()
+            self._instrumentation_of_this_class.hooks[event].append(callback)
+        return self # enables chaining
+
+
+    def remove_hook(self, event, callback):
+        """
+        Undoes method add_hook (with the same arguments). The timings are
+        still kept.
+        """
+        with self._lock_of_this_class:
+            try:
+                self._instrumentation_of_this_class.hooks[event].remove(callback)
+            except (AttributeError, KeyError, ValueError):
+                error_message = "'%s' is not hooked to '%s'."%(callback, event)
+                raise ValueError(error_message)
+        return self
+
+
     def check_before_setting_attribute(self,name,value):
         """
         This method is called everytime an attribute is set/changed.
@@ -415,7 +1941,7 @@ class Preferences():
             error_message = "Input must be string-equivalent to an attribute, but found type %s."\
                             %type(name)
             return TypeError(error_message)
-        if not name in self.valid_attributes():
+        if not name in self._names_of_this_class:
             error_message = "'%s' is not a valid attribute; valid attributes are '%s'"\
                             %(name,"', '".join(sorted(self.valid_attributes())))
             return AttributeError(error_message)
@@ -427,10 +1953,16 @@ class Preferences():
         string-equivalent of attribute.
 
         For more variable input, or setting multiple attributes, see
-        method set_value.
+        method set_value. A dotted name (e.g. "ui.theme") sets the
+        attribute of a namespace (see method namespace).
         """
-        if isinstance(self._test_if_valid_attribute(name),TypeError): # Error_handling
-            raise self._test_if_valid_attribute(name)
+        namespace, name = self._namespace_of_name(name)
+        if namespace is not self:
+            namespace.set(name, value)
+            return self
+        error = self._test_if_valid_attribute(name)
+        if isinstance(error,TypeError): # Error_handling
+            raise error
         setattr(self,name,value)
         return self
 
@@ -448,6 +1980,14 @@ class Preferences():
           
         Input also accepts multiple dicts and/or keywords, e.g.
         A.set_value( { "x":1}, {"y1":2,"y2":3}, z1=1, z2=2 )
+
+        All values are written to the file at once. If any of the values
+        fails, none of the attributes are changed (see method batch). The
+        values are all validated (see argument 'schema') before any of
+        them is set, and a single error mentions all that failed. Dotted
+        names (e.g. "ui.theme") set the attributes of a namespace (see
+        method namespace); each namespace is then set (and written) on
+        its own, after the attributes of this instance.
         """
         
         # collects input into master_dict, which this method can understand
@@ -461,25 +2001,79 @@ class Preferences():
         if keyword_attributes:
             master_dict.update(keyword_attributes)
 
-        # set attributes
-        for attribute in master_dict:
-            if not isinstance(attribute,str):
-                error_message = "The keywords in the dictionaries should "+\
-                                "be the STRING-equivalent of that attribute "+\
-                                "name, but found type %s."%(type(attribute))
-                raise TypeError(error_message)
-            setattr(self,attribute,master_dict[attribute])            
+        # the attributes of namespaces are set by these namespaces
+        values_of_namespaces = {}
+        for attribute in [x for x in master_dict if isinstance(x, str) and "." in x and not x in self._names_of_this_class]:
+            namespace, name = attribute.rsplit(".", 1)
+            values_of_namespaces.setdefault(namespace, {})[name] = master_dict.pop(attribute)
+
+        # validates all values at once, before setting any of them
+        master_dict = self._validate_values(master_dict)
+
+        # set attributes (and write them to file at once)
+        instrumented = self._instrumentation_of_this_class is not None and \
+                       self._initialization_complete_of_this_class and not self._loading_depth_of_this_class
+        with self.batch():
+            for attribute in master_dict:
+                if not isinstance(attribute,str):
+                    error_message = "The keywords in the dictionaries should "+\
+                                    "be the STRING-equivalent of that attribute "+\
+                                    "name, but found type %s."%(type(attribute))
+                    raise TypeError(error_message)
+                if instrumented:
+                    start = time.perf_counter()
+                    self._set_attribute(attribute,master_dict[attribute])
+                    self._record("set", start, attribute)
+                else:
+                    self._set_attribute(attribute,master_dict[attribute])
+        for namespace, values in values_of_namespaces.items():
+            self.namespace(namespace).set_value(values)
         return self
 
 
+    def _validate_values(self, values):
+        """
+        Returns a copy of the dict 'values', with every value validated
+        (see argument 'schema'). If any of them fails, a single error is
+        raised that mentions all that failed.
+        """
+        validators = self._validators_of_this_class
+        instrumented = self._instrumentation_of_this_class is not None
+        validated_values = dict(values)
+        errors = []
+        for name in values:
+            if name in validators:
+                if instrumented:
+                    start = time.perf_counter()
+                try:
+                    validated_values[name] = validators[name](values[name])
+                except (TypeError, ValueError) as error:
+                    errors.append(error)
+                if instrumented:
+                    self._record("validate", start, name)
+        if errors:
+            error_message = " ".join(str(error) for error in errors)
+            raise type(errors[0])(error_message)
+        return validated_values
+
+
     def get(self,name):
         """
         Gets value of attribute. Method is same as obtaining value of
-        attribute directly, or using getattr.
+        attribute directly, or using getattr. In the shared mode,
+        changes made by other processes are taken over first (see
+        method reload). A dotted name (e.g. "ui.theme") gets the
+        attribute of a namespace (see method namespace).
         """
         
-        if self._test_if_valid_attribute(name): # Error_handling
-            raise self._test_if_valid_attribute(name)
+        namespace, name = self._namespace_of_name(name, create = False)
+        if namespace is not self:
+            return namespace.get(name)
+        if self._lock_file_of_this_class is not None:
+            self.reload() # takes over changes made by other processes
+        error = self._test_if_valid_attribute(name)
+        if error: # Error_handling
+            raise error
 
         return getattr(self,name)
     
@@ -489,8 +2083,12 @@ class Preferences():
         Returns default-value of attribute.
         (argument must be entered as string-equivalent).
         """
-        if self._test_if_valid_attribute(name): # Error_handling
-            raise self._test_if_valid_attribute(name)
+        namespace, name = self._namespace_of_name(name, create = False)
+        if namespace is not self:
+            return namespace.get_default_value(name)
+        error = self._test_if_valid_attribute(name)
+        if error: # Error_handling
+            raise error
         
         if not name in self._defaults_of_this_class.keys():
             error_message = "Attribute '%s' does not have a default-value."%(name)
@@ -504,22 +2102,52 @@ class Preferences():
         Also removes any default value of that attribute.
         """ # TODO: should this "override" the __delattr__ ?
 
-        if self._test_if_valid_attribute(name): # Error_handling
-            raise self._test_if_valid_attribute(name)
+        namespace, name = self._namespace_of_name(name, create = False)
+        if namespace is not self:
+            namespace.delete_attribute(name)
+            return
+        error = self._test_if_valid_attribute(name)
+        if error: # Error_handling
+            raise error
         
-        if name in self._defaults_of_this_class.keys():
-            del self._defaults_of_this_class[name]
-        super().__delattr__(name)
-        self.write_to_file()
+        with self.batch():
+            if name in self._defaults_of_this_class.keys():
+                self._remember_old_default(name)
+                del self._defaults_of_this_class[name]
+                self._store_default_change(name)
+            self._remember_old_value(name, deleted = True)
+            if self._lazy_values_of_this_class.pop(name, None) is None:
+                super().__delattr__(name)
+            self._names_of_this_class.pop(name, None)
+            self._store_change(name)
 
 
     def delete_preferences_file(self):
         """
         Deletes the stored file. This method does not destroy this
-        class, nor affects any attributes.
+        class, nor affects any attributes. Any changes that were still
+        waiting to be written (in the "deferred" flush-mode) are
+        discarded, so that they do not recreate the file. In the shared
+        mode, the lock-file is deleted as well, which ends the shared
+        mode for this instance. The files of the namespaces of this
+        instance (see method namespace) are deleted as well.
         """
-        if os.path.exists(self._filename_to_store_the_preferences):
-            os.remove(self._filename_to_store_the_preferences)
+        for namespace in list(self._namespaces_of_this_class.values()):
+            namespace.delete_preferences_file()
+        with self._lock_of_this_class:
+            if self._flush_timer_of_this_class is not None:
+                self._flush_timer_of_this_class.cancel()
+                self._flush_timer_of_this_class = None
+            self._unwritten_changes_of_this_class.clear()
+        if self._writer_of_this_class is not None:
+            with self._writer_of_this_class.writing:
+                pass # (waits for a write that is in progress, which would recreate the file)
+        self._storage_of_this_class.delete()
+        if self._lock_file_of_this_class is not None:
+            self._lock_file_of_this_class.close()
+            self._lock_file_of_this_class = None
+            if os.path.exists(self._sidecar_filename(self._LOCK_EXTENSION)):
+                os.remove(self._sidecar_filename(self._LOCK_EXTENSION))
         return self # enables chaining
         
 
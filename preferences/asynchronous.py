@@ -0,0 +1,202 @@
+"""
+Class Preferences for programs that run on an asyncio event loop.
+
+Class AsyncPreferences never writes to the file on the thread of the
+event loop: changes are written by a task, which encodes the values on
+the loop (which is fast) and leaves the writing itself to an executor.
+All changes made while such a write is waiting or in progress are
+written together afterwards, so a burst of changes leads to only a few
+writes, and never stalls the event loop.
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import asyncio
+import os.path
+import sys
+import threading
+from contextlib import contextmanager
+from . import Preferences, _INSTANCES_WITH_DEFERRED_WRITES
+
+
+
+class AsyncPreferences(Preferences):
+    """
+    Class Preferences, of which the changes made on a running asyncio
+    event loop are written in the background: setting an attribute only
+    schedules the write (see method aset to wait for it), and method
+    aflush waits for all changes to be written. Initialize this class
+    with 'await AsyncPreferences.load(...)' on an event loop, so that the
+    file is read in the background as well. Outside of an event loop,
+    this class behaves exactly like class Preferences.
+
+    Takes the same arguments as class Preferences, and:
+    executor:        The concurrent.futures.Executor that writes (and
+                     reads) the file. If None, the default executor of
+                     the event loop is used.       Default = None
+
+    With the backend "journal" or in the shared mode, the writing still
+    happens in the executor, but (as it then holds this instance locked)
+    setting an attribute during a write waits for that write to finish.
+    In the "deferred" flush-mode, the task waits 'flush_interval' seconds
+    before writing, to collect more changes. The file is replaced by one
+    writer at a time, in the order in which the content was encoded, so
+    a write of the task never overwrites a newer write made by method
+    flush or write_to_file (e.g. at exit).
+    """
+
+    _ATTRIBUTES_TO_IGNORE = Preferences._ATTRIBUTES_TO_IGNORE + ("_executor_of_this_class",
+                                                                 "_flush_task_of_this_class",
+                                                                 "_write_lock_of_this_class",
+                                                                 "_writing_of_this_class",
+                                                                 "_writing_depth_of_this_class")
+    __slots__ = ("_executor_of_this_class", "_flush_task_of_this_class", "_write_lock_of_this_class",
+                 "_writing_of_this_class", "_writing_depth_of_this_class")
+
+    def __init__(self, *args, executor = None, base_dir = None, **kwargs):
+        self._writing_of_this_class = threading.Lock() # (held while the file is replaced)
+        self._writing_depth_of_this_class = 0
+        if base_dir is None:
+            # (a relative filename is relative to the script that calls upon this class, not this module)
+            base_dir = os.path.split( sys._getframe(1).f_code.co_filename )[0]
+        super().__init__(*args, base_dir = base_dir, **kwargs)
+        self._executor_of_this_class = executor
+        self._options_of_this_class["executor"] = executor # (see method namespace)
+        self._flush_task_of_this_class = None
+        self._write_lock_of_this_class = None # (created on the event loop, see method _write_in_executor)
+        # changes that are still waiting for the task (e.g. when the event loop is closed) are written at exit
+        _INSTANCES_WITH_DEFERRED_WRITES.add(self)
+
+
+    @classmethod
+    async def load(cls, *args, executor = None, base_dir = None, **kwargs):
+        """
+        Initializes this class in 'executor' (so that reading the file
+        does not block the event loop), with the same arguments as the
+        class itself. A relative 'filename' is relative to the calling
+        script (or to 'base_dir', if given).
+
+        Example:
+        prefs = await AsyncPreferences.load(filename = "prefs.txt", x = 1)
+        """
+        if base_dir is None:
+            base_dir = os.path.split( sys._getframe(1).f_code.co_filename )[0]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, lambda: cls(*args, executor = executor,
+                                                                base_dir = base_dir, **kwargs))
+
+
+    def _write_unwritten_changes(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or not hasattr(self, "_flush_task_of_this_class"):
+            # not on an event loop (e.g. in the executor), or still initializing
+            super()._write_unwritten_changes()
+            return
+        task = self._flush_task_of_this_class
+        if task is None or task.done():
+            self._flush_task_of_this_class = loop.create_task(self._flush_soon())
+
+
+    async def _flush_soon(self):
+        if self._flush_mode_of_this_class == "deferred":
+            await asyncio.sleep(self._flush_interval_of_this_class)
+        else:
+            await asyncio.sleep(0) # (lets the other changes made right now join this write)
+        await self._write_in_executor()
+
+
+    async def _write_in_executor(self):
+        """
+        Writes the unwritten changes in the executor, until there are
+        none left (including those made while writing). Only one write is
+        done at a time.
+        """
+        loop = asyncio.get_running_loop()
+        if self._write_lock_of_this_class is None:
+            self._write_lock_of_this_class = asyncio.Lock()
+        async with self._write_lock_of_this_class:
+            while True:
+                with self._lock_of_this_class:
+                    if not self._unwritten_changes_of_this_class:
+                        return
+                    names = self._unwritten_changes_of_this_class
+                    if self._backend_of_this_class == "file" and self._lock_file_of_this_class is None:
+                        self._unwritten_changes_of_this_class = set()
+                        self._statistics_of_this_class["coalesced_changes"] += len(names) - 1
+                        write = self._encode_file_content(self._writing_of_this_class)
+                        # (taken before letting go of the lock of this instance, so no newer content is written first)
+                        self._writing_of_this_class.acquire()
+                    else:
+                        write = self.flush # (which takes care of the journal and the shared mode)
+                try:
+                    try:
+                        future = loop.run_in_executor(self._executor_of_this_class, write)
+                    except:
+                        if write != self.flush:
+                            self._writing_of_this_class.release() # (as the write never started)
+                        raise
+                    await future
+                except:
+                    with self._lock_of_this_class:
+                        self._unwritten_changes_of_this_class |= names # (to try again later)
+                    raise
+
+
+    @contextmanager
+    def _locked_file(self, exclusive = True):
+        # (method flush and write_to_file replace the file in this thread; they wait for a write in the executor)
+        with super()._locked_file(exclusive):
+            if not exclusive:
+                yield
+                return
+            with self._lock_of_this_class:
+                if not self._writing_depth_of_this_class:
+                    self._writing_of_this_class.acquire()
+                self._writing_depth_of_this_class += 1
+                try:
+                    yield
+                finally:
+                    self._writing_depth_of_this_class -= 1
+                    if not self._writing_depth_of_this_class:
+                        self._writing_of_this_class.release()
+
+
+    async def aset(self, name, value):
+        """
+        Sets attribute 'name' (just like method set), and waits until the
+        change has been written to the file. Changes made at the same
+        time are written together.
+        """
+        self.set(name, value)
+        task = self._flush_task_of_this_class
+        if task is not None and not task.done():
+            await asyncio.shield(task)
+        return self
+
+
+    async def aset_value(self, *dicts_with_values, **keyword_attributes):
+        """
+        Sets multiple attributes at once (just like method set_value),
+        and waits until they have been written to the file.
+        """
+        self.set_value(*dicts_with_values, **keyword_attributes)
+        task = self._flush_task_of_this_class
+        if task is not None and not task.done():
+            await asyncio.shield(task)
+        return self
+
+
+    async def aflush(self):
+        """
+        Writes any changes that have not been written to the file yet
+        (without waiting for the "deferred" flush-mode), and waits until
+        they are.
+        """
+        await self._write_in_executor()
+        return self
@@ -0,0 +1,237 @@
+"""
+Benchmarks of class Preferences.
+
+Measures how long the most common operations take, for preferences with
+a given number of attributes, size of the values and size of the
+header:
+-construct:  initializing Preferences with defaults (on a new file)
+-load:       initializing Preferences on an existing file
+-set:        setting a single attribute (i.e. __setattr__)
+-set_value:  setting all attributes at once with method set_value
+-reset:      resetting all attributes with method reset_to_default
+
+Run from the command line, e.g.:
+    python -m preferences.benchmark --attributes 10 100 1000 --output results.json
+and later compare against those results (exits with 1 on a regression):
+    python -m preferences.benchmark --attributes 10 100 1000 --baseline results.json
+
+Options of Preferences can be passed along, to compare them:
+    python -m preferences.benchmark --option backend=journal --option flush=deferred
+The backend "memory" leaves out the writing altogether, which measures
+what class Preferences itself costs:
+    python -m preferences.benchmark --option backend=memory
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+try:
+    from preferences import Preferences
+except ImportError:
+    # (when this file is run directly, rather than as module)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from preferences import Preferences
+
+
+
+CASES = ("construct", "load", "set", "set_value", "reset")
+
+
+
+def _make_values(attributes, value_size, offset = 0):
+    # 'value_size' is the number of characters of every (string) value
+    return {"attribute_%s"%i: ("%s"%(i + offset)).rjust(value_size, "x")
+            for i in range(attributes)}
+
+
+def _time(function, repeat, setup = None):
+    # 'setup' is called before every repetition, but is not timed
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def benchmark_case(case, attributes, value_size = 10, header_size = 0,
+                   repeat = 5, options = None):
+    """
+    Runs one benchmark, and returns a dict with its parameters and the
+    best and mean time (in seconds) of one repetition. For the case
+    "set", one repetition sets every attribute once (one by one). Every
+    repetition includes writing all changes (i.e. method flush); the
+    cases "set" and "set_value" alternate between two sets of values, so
+    that every repetition changes every attribute.
+    """
+    options = options or {}
+    directory = tempfile.mkdtemp(prefix = "preferences_benchmark_")
+    filename = os.path.join(directory, "preferences.txt")
+    header = "h"*header_size
+    defaults = _make_values(attributes, value_size)
+    new_values = _make_values(attributes, value_size, offset = 1)
+    other_values = _make_values(attributes, value_size, offset = 2)
+
+    def new_preferences():
+        return Preferences(defaults = defaults, filename = filename,
+                           header = header, **options)
+    setup = None
+    try:
+        if case == "construct":
+            def setup():
+                if os.path.exists(filename):
+                    os.remove(filename)
+            def function():
+                new_preferences().flush()
+        elif case == "load":
+            new_preferences().set_value(new_values).flush()
+            function = new_preferences
+        else:
+            preferences = new_preferences()
+            values = [other_values] # (the values of the next repetition)
+            def next_values():
+                values[0] = new_values if values[0] is other_values else other_values
+            if case == "set":
+                setup = next_values
+                def function():
+                    for name, value in values[0].items():
+                        setattr(preferences, name, value)
+                    preferences.flush()
+            elif case == "set_value":
+                setup = next_values
+                def function():
+                    preferences.set_value(values[0]).flush()
+            elif case == "reset":
+                def setup():
+                    preferences.set_value(new_values).flush()
+                def function():
+                    preferences.reset_to_default()
+                    preferences.flush()
+            else:
+                error_message = "Unknown benchmark '%s'; known benchmarks are '%s'."\
+                                %(case, "', '".join(CASES))
+                raise ValueError(error_message)
+        timings = _time(function, repeat, setup)
+    finally:
+        shutil.rmtree(directory)
+
+    return {"case": case,
+            "attributes": attributes,
+            "value_size": value_size,
+            "header_size": header_size,
+            "options": options,
+            "repeat": repeat,
+            "best": min(timings),
+            "mean": sum(timings)/len(timings)}
+
+
+def run_benchmarks(cases = CASES, attributes = (10, 100, 1000),
+                   value_sizes = (10,), header_sizes = (0,), repeat = 5,
+                   options = None):
+    """
+    Runs every combination of the given cases and parameters, and
+    returns the results (see function benchmark_case) in a dict, along
+    with a description of the environment.
+    """
+    results = []
+    for case in cases:
+        for attribute_count in attributes:
+            for value_size in value_sizes:
+                for header_size in header_sizes:
+                    results.append(benchmark_case(case, attribute_count, value_size,
+                                                  header_size, repeat, options))
+    return {"environment": {"python": platform.python_version(),
+                            "implementation": platform.python_implementation(),
+                            "platform": platform.platform()},
+            "results": results}
+
+
+def _key(result):
+    return (result["case"], result["attributes"], result["value_size"],
+            result["header_size"], json.dumps(result["options"], sort_keys = True))
+
+
+def compare(results, baseline, tolerance = 0.2):
+    """
+    Compares 'results' with those of an earlier run ('baseline'), and
+    returns a list of (result, baseline_result, ratio, regression) for
+    every result that was found in the baseline, with ratio being how
+    many times slower it has become. Results slower than 1+tolerance
+    times the baseline are regressions.
+    """
+    baseline_results = {_key(result): result for result in baseline["results"]}
+    comparison = []
+    for result in results["results"]:
+        if _key(result) in baseline_results:
+            baseline_result = baseline_results[_key(result)]
+            ratio = result["best"]/baseline_result["best"] if baseline_result["best"] else float("inf")
+            comparison.append((result, baseline_result, ratio, ratio > 1 + tolerance))
+    return comparison
+
+
+def _parse_option(text):
+    name, _, value = text.partition("=")
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass # it is just a string
+    return name, value
+
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Benchmarks of class Preferences.")
+    parser.add_argument("--cases", nargs = "+", default = list(CASES), choices = CASES)
+    parser.add_argument("--attributes", nargs = "+", type = int, default = [10, 100, 1000],
+                        help = "numbers of attributes")
+    parser.add_argument("--value-size", nargs = "+", type = int, default = [10],
+                        help = "numbers of characters of every value")
+    parser.add_argument("--header-size", nargs = "+", type = int, default = [0],
+                        help = "numbers of characters of the header")
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--option", action = "append", default = [], type = _parse_option,
+                        help = "argument for Preferences, e.g. backend=journal")
+    parser.add_argument("--output", help = "file to write the results to (as JSON)")
+    parser.add_argument("--baseline", help = "file with earlier results to compare with")
+    parser.add_argument("--tolerance", type = float, default = 0.2,
+                        help = "fraction by which a result may be slower than the baseline")
+    arguments = parser.parse_args(arguments)
+
+    results = run_benchmarks(arguments.cases, arguments.attributes, arguments.value_size,
+                             arguments.header_size, arguments.repeat, dict(arguments.option))
+
+    for result in results["results"]:
+        print("%-10s attributes=%-6s value_size=%-6s header_size=%-6s best=%.6fs mean=%.6fs"
+              %(result["case"], result["attributes"], result["value_size"],
+                result["header_size"], result["best"], result["mean"]))
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            json.dump(results, output_file, indent = 2)
+
+    regressions = 0
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print("\ncompared with %s:"%(arguments.baseline))
+        for result, baseline_result, ratio, regression in compare(results, baseline, arguments.tolerance):
+            regressions += regression
+            print("%-10s attributes=%-6s value_size=%-6s header_size=%-6s %.2fx%s"
+                  %(result["case"], result["attributes"], result["value_size"],
+                    result["header_size"], ratio, "  REGRESSION" if regression else ""))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
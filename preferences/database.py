@@ -0,0 +1,242 @@
+"""
+Stores the attributes of class Preferences in an SQLite database.
+
+Every attribute is a row of the table "preferences" (its name, its value
+and its default value, both as JSON, and the time it was last changed),
+such that changing an attribute only has to write that row. The database
+is used in WAL mode, so that other processes can keep reading while it is
+written. The header of the file is kept in the table "metadata".
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from .serializers import RawJSON
+from .storage import Storage, DELETED
+
+
+
+_DEFAULTS_KEY = "_defaults_of_this_class"
+
+_MAGIC = b"SQLite format 3\0" # (with which every database starts)
+
+_CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS preferences (key TEXT PRIMARY KEY,
+                                        value TEXT,
+                                        default_value TEXT,
+                                        updated_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY,
+                                     value TEXT);
+"""
+
+_UPSERT_VALUE = "INSERT INTO preferences (key, value, updated_at) VALUES (?, ?, ?) "+\
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at"
+
+_UPSERT_DEFAULT = "INSERT INTO preferences (key, default_value, updated_at) VALUES (?, ?, ?) "+\
+                  "ON CONFLICT(key) DO UPDATE SET default_value = excluded.default_value, updated_at = excluded.updated_at"
+
+# (how safely a transaction is written to the disk, see argument 'durability' of class Preferences)
+_SYNCHRONOUS = {"none": "NORMAL", "file": "FULL", "directory": "FULL"}
+
+
+
+def _encode(value):
+    return value.text if isinstance(value, RawJSON) else json.dumps(value)
+
+
+
+def _size(*texts):
+    # the number of bytes of the texts of a row (leaving out the overhead of the database itself)
+    return sum(len(text.encode("utf-8")) for text in texts if text is not None)
+
+
+
+def is_database(filename):
+    """
+    Returns whether 'filename' is an SQLite database (rather than a file
+    in one of the formats of module 'serializers').
+    """
+    with open(filename, "rb") as opened_file:
+        return opened_file.read(len(_MAGIC)) == _MAGIC
+
+
+
+def _sidecar_filename(filename, suffix):
+    return filename + (suffix.encode() if isinstance(filename, bytes) else suffix)
+
+
+
+class SQLiteStorage(Storage):
+    """
+    The database 'filename', in which class Preferences stores its
+    attributes with the backend "sqlite" (see module 'storage'). The
+    connection may be used by several threads, but only by one at a
+    time.
+    """
+
+    def __init__(self, filename, durability = "none"):
+        self.filename = filename
+        self._durability = durability
+        self._connection = None
+        self._has_tables = False
+        self._lock = threading.RLock()
+
+
+    def _connect(self):
+        if self._connection is None:
+            try:
+                connection = sqlite3.connect(self.filename, isolation_level = None, check_same_thread = False)
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.execute("PRAGMA synchronous = %s"%(_SYNCHRONOUS[self._durability]))
+            except sqlite3.DatabaseError as error:
+                error_message = "The file '%s' is not an SQLite database (%s). Files in the other formats can be "%(
+                                os.fsdecode(self.filename), error)+\
+                                "taken over with method import_from_file of class Preferences."
+                raise ValueError(error_message)
+            self._connection = connection
+        return self._connection
+
+
+    def filenames(self):
+        """
+        Returns the database and its write-ahead log, which together
+        change whenever the database is written.
+        """
+        return (self.filename, _sidecar_filename(self.filename, "-wal"))
+
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except:
+                connection.execute("ROLLBACK")
+                raise
+            else:
+                connection.execute("COMMIT")
+
+
+    def exists(self):
+        """
+        Returns whether the database exists, and holds the tables.
+        """
+        with self._lock:
+            if not os.path.exists(self.filename):
+                self._has_tables = False
+            elif not self._has_tables:
+                found = self._connect().execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'preferences'")
+                self._has_tables = found.fetchone() is not None
+            return self._has_tables
+
+
+    def load(self, lazy = False):
+        """
+        Returns the header (None if there is none) and a dict with the
+        stored values, with the default values under the key
+        "_defaults_of_this_class" (just like method load of the
+        serializers). If 'lazy', the values are returned as RawJSON.
+        """
+        with self._lock:
+            if not self.exists():
+                return None, {}
+            connection = self._connect()
+            header = connection.execute("SELECT value FROM metadata WHERE key = 'header'").fetchone()
+            rows = connection.execute("SELECT key, value, default_value FROM preferences ORDER BY key").fetchall()
+        values = {}
+        defaults = {}
+        for key, value, default_value in rows:
+            if value is not None:
+                values[key] = RawJSON(value) if lazy else json.loads(value)
+            if default_value is not None:
+                defaults[key] = json.loads(default_value)
+        values[_DEFAULTS_KEY] = defaults
+        return (header[0] if header is not None else None), values
+
+
+    def save_full(self, header, attributes):
+        """
+        Replaces everything in the database by 'header' and 'attributes'
+        (as the serializers would dump them), in a single transaction.
+        """
+        now = time.time()
+        defaults = attributes.get(_DEFAULTS_KEY, {})
+        rows = {key: [_encode(value), None] for key, value in attributes.items() if key != _DEFAULTS_KEY}
+        for key, value in defaults.items():
+            rows.setdefault(key, [None, None])[1] = json.dumps(value)
+        size = sum(_size(key, value, default_value) for key, (value, default_value) in rows.items())
+        with self._lock:
+            if not self._has_tables:
+                self._connect().executescript(_CREATE_TABLES)
+            with self._transaction() as connection:
+                connection.execute("DELETE FROM preferences")
+                connection.executemany("INSERT INTO preferences (key, value, default_value, updated_at) VALUES (?, ?, ?, ?)",
+                                       [(key, value, default_value, now) for key, (value, default_value) in rows.items()])
+                connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES ('header', ?)", (header,))
+            self._has_tables = True
+            self.bytes_written += size
+        return True
+
+
+    def save_delta(self, values, defaults, all_defaults = False):
+        """
+        Writes only the rows of the attributes that changed, in a single
+        transaction. 'values' and 'defaults' couple the names of these
+        attributes to their new (default) value, or to DELETED. If
+        'all_defaults', 'defaults' holds all default values, and any
+        other default value is removed.
+        """
+        now = time.time()
+        size = 0
+        with self._transaction() as connection:
+            if all_defaults:
+                connection.execute("UPDATE preferences SET default_value = NULL WHERE default_value IS NOT NULL")
+            for key, value in values.items():
+                if value is DELETED:
+                    connection.execute("UPDATE preferences SET value = NULL, updated_at = ? WHERE key = ?", (now, key))
+                else:
+                    encoded = _encode(value)
+                    connection.execute(_UPSERT_VALUE, (key, encoded, now))
+                    size += _size(key, encoded)
+            for key, value in defaults.items():
+                if value is DELETED:
+                    connection.execute("UPDATE preferences SET default_value = NULL, updated_at = ? WHERE key = ?", (now, key))
+                else:
+                    encoded = json.dumps(value)
+                    connection.execute(_UPSERT_DEFAULT, (key, encoded, now))
+                    size += _size(key, encoded)
+            if all_defaults or DELETED in values.values() or DELETED in defaults.values():
+                connection.execute("DELETE FROM preferences WHERE value IS NULL AND default_value IS NULL")
+            self.bytes_written += size
+        return True
+
+
+    def delete(self):
+        """
+        Closes the database, and deletes it (including the files of the
+        WAL mode).
+        """
+        with self._lock:
+            self.close()
+            for filename in (self.filename, _sidecar_filename(self.filename, "-wal"),
+                             _sidecar_filename(self.filename, "-shm")):
+                if os.path.exists(filename):
+                    os.remove(filename)
+            self._has_tables = False
+
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
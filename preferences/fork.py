@@ -0,0 +1,255 @@
+"""
+Copy-on-write forks and snapshots of class Preferences.
+
+A fork (see method fork of class Preferences) is a variant of an instance
+of class Preferences that only holds the values that were changed in the
+fork itself; every other value is read from the instance it was forked
+from (its parent), as long as the fork does not change it. Nothing is
+written to a file, unless the fork is written explicitly (see method
+export_to_file). Creating a fork therefore only costs as much as the
+values that differ, e.g. for a variant of the preferences per request.
+
+A snapshot (see method snapshot of class Preferences) captures the values
+and default values of an instance at one moment, so that they can be put
+back later with method restore.
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import os
+import sys
+import copy as _copy
+import collections as col
+from .serializers import SERIALIZERS
+from .storage import write_atomically
+
+
+
+_DELETED = object() # (marks an attribute of the parent that the fork has deleted)
+
+_CONTAINER_TYPES = (list, dict, set)
+
+
+
+def copy_value(value):
+    """
+    Returns a copy of 'value' if it is a list, dict or set (which could be
+    changed in place), and 'value' itself otherwise.
+    """
+    return _copy.deepcopy(value) if isinstance(value, _CONTAINER_TYPES) else value
+
+
+
+class Snapshot():
+    """
+    The values and default values of an instance of class Preferences at
+    the moment method snapshot was called; see method restore. Values
+    that had not been decoded yet (see argument 'lazy' of class
+    Preferences) are kept as they were read.
+    """
+    __slots__ = ("values", "lazy_values", "defaults")
+
+    def __init__(self, values, lazy_values, defaults):
+        self.values = values
+        self.lazy_values = lazy_values
+        self.defaults = defaults
+
+
+
+class PreferencesFork():
+    """
+    A copy-on-write variant of 'parent' (an instance of class Preferences,
+    or another fork): values that are set in the fork are kept in the
+    fork, while all other values are those of the parent (including
+    changes made to the parent later on). Lists, dicts and sets of the
+    parent are copied whenever they are read (but not kept in the fork),
+    so that changing them in place does not change the parent; to change
+    such a value in the fork, set it (e.g. fork.x = fork.x + [1]).
+    Values are validated
+    against the schema of the parent (see argument 'schema' of class
+    Preferences), but not by its method check_before_setting_attribute.
+    Nothing is ever written, unless by method export_to_file. Use method
+    fork of class Preferences to create a fork.
+    """
+    __slots__ = ("_parent", "_overrides", "__weakref__")
+
+    def __init__(self, parent):
+        object.__setattr__(self, "_parent", parent)
+        object.__setattr__(self, "_overrides", {})
+
+
+    def _preferences(self):
+        # the instance of class Preferences that this fork (ultimately) derives from
+        parent = self._parent
+        while isinstance(parent, PreferencesFork):
+            parent = parent._parent
+        return parent
+
+
+    def _value(self, name):
+        if not isinstance(name, str):
+            error_message = "Input must be string-equivalent to an attribute, but found type %s."\
+                            %type(name)
+            raise TypeError(error_message)
+        overrides = self._overrides
+        if name in overrides:
+            value = overrides[name]
+            if value is _DELETED:
+                error_message = "'%s' object has no attribute '%s'"%(type(self).__name__, name)
+                raise AttributeError(error_message)
+            return value
+        # (a copy, such that the parent keeps its own; it is not kept, so later changes of the parent show)
+        return copy_value(getattr(self._parent, name))
+
+
+    def _has_attribute(self, name):
+        # (without listing all valid attributes, see method valid_attributes)
+        if name in self._overrides:
+            return self._overrides[name] is not _DELETED
+        if isinstance(self._parent, PreferencesFork):
+            return self._parent._has_attribute(name)
+        return name in self._parent._names_of_this_class
+
+
+    def _test_if_valid_attribute(self, name):
+        if not isinstance(name, str):
+            error_message = "Input must be string-equivalent to an attribute, but found type %s."\
+                            %type(name)
+            raise TypeError(error_message)
+        if not self._has_attribute(name):
+            error_message = "'%s' is not a valid attribute; valid attributes are '%s'"\
+                            %(name,"', '".join(sorted(self.valid_attributes())))
+            raise AttributeError(error_message)
+
+
+    def __getattr__(self, name):
+        # (only called for names that are not one of the __slots__)
+        if name.startswith("__"):
+            error_message = "'%s' object has no attribute '%s'"%(type(self).__name__, name)
+            raise AttributeError(error_message)
+        return self._value(name)
+
+
+    def __setattr__(self, name, value):
+        self.set_value({name: value})
+
+
+    def __delattr__(self, name):
+        self.delete_attribute(name)
+
+
+    def valid_attributes(self):
+        """
+        Returns current valid attributes as strings, in a list.
+        """
+        names = [name for name in self._parent.valid_attributes() if not name in self._overrides]
+        names += [name for name, value in self._overrides.items() if value is not _DELETED]
+        return names
+
+
+    def get(self, name):
+        """
+        Gets value of attribute: the value set in this fork, or else that
+        of the parent.
+        """
+        self._test_if_valid_attribute(name)
+        return self._value(name)
+
+
+    def set(self, name, value):
+        """
+        Sets attribute 'name' in this fork only. Argument 'name' must be
+        string-equivalent of an existing attribute.
+        """
+        self._test_if_valid_attribute(name)
+        return self.set_value({name: value})
+
+
+    def set_value(self, *dicts_with_values, **keyword_attributes):
+        """
+        Sets multiple attributes in this fork at once (just like method
+        set_value of class Preferences). If any of the values fails
+        validation, none of them are set.
+        """
+        master_dict = {}
+        for dict_with_values in dicts_with_values:
+            if not isinstance(dict_with_values, dict):
+                error_message = "Expected dictionary but found type %s."%(type(dict_with_values))
+                raise TypeError(error_message)
+            master_dict.update(dict_with_values)
+        master_dict.update(keyword_attributes)
+        for name, value in master_dict.items():
+            if not isinstance(name, str):
+                error_message = "The keywords in the dictionaries should "+\
+                                "be the STRING-equivalent of that attribute "+\
+                                "name, but found type %s."%(type(name))
+                raise TypeError(error_message)
+            if callable(value):
+                error_message = "You cannot assign functions to attributes of this class, but still you tried to allocate a function to attribute '%s'."\
+                                %(name)
+                raise TypeError(error_message)
+        self._overrides.update(self._preferences()._validate_values(master_dict))
+        return self # enables chaining
+
+
+    def delete_attribute(self, name):
+        """
+        Deletes attribute from this fork (the parent keeps it).
+        """
+        self._test_if_valid_attribute(name)
+        self._overrides[name] = _DELETED
+
+
+    def get_default_value(self, name):
+        """
+        Returns default-value of attribute (those of the parent, as
+        default values cannot be changed in a fork).
+        """
+        return self._parent.get_default_value(name)
+
+
+    def overrides(self):
+        """
+        Returns a dict with the values that this fork holds itself (i.e.
+        that have been set in this fork).
+        """
+        return {name: value for name, value in self._overrides.items() if value is not _DELETED}
+
+
+    def fork(self, *dicts_with_values, **keyword_attributes):
+        """
+        Returns a fork of this fork (see method fork of class
+        Preferences).
+        """
+        return PreferencesFork(self).set_value(*dicts_with_values, **keyword_attributes)
+
+
+    def export_to_file(self, filename, format = "json", base_dir = None):
+        """
+        Writes all values of this fork (and the default values of its
+        parent) to 'filename', in 'format' (see argument 'format' of
+        class Preferences), such that class Preferences can read them.
+        A relative 'filename' is relative to the calling script (or to
+        'base_dir', if given).
+        """
+        if not format in SERIALIZERS:
+            error_message = "Argument 'format' should be one of '%s', but found '%s'."\
+                            %("', '".join(SERIALIZERS), format)
+            raise ValueError(error_message)
+        if isinstance(filename, (str, bytes)) and not os.path.isabs(filename):
+            if base_dir is None:
+                base_dir = os.path.split( sys._getframe(1).f_code.co_filename )[0]
+            filename = os.path.abspath(os.path.join(base_dir, filename))
+        preferences = self._preferences()
+        serializer = SERIALIZERS[format]
+        with preferences._lock_of_this_class:
+            defaults = col.OrderedDict(sorted(preferences._defaults_of_this_class.items(), key = lambda x: x[0]))
+            values = {name: self._value(name) for name in self.valid_attributes()}
+        attributes = col.OrderedDict(sorted(values.items(), key = lambda x: x[0]))
+        attributes["_defaults_of_this_class"] = defaults
+        write_atomically(filename, lambda opened_file: serializer.dump(preferences._header_of_this_class, attributes, opened_file),
+                         preferences._durability_of_this_class, serializer.binary)
+        return self
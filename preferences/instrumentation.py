@@ -0,0 +1,121 @@
+"""
+Measures where class Preferences spends its time.
+
+With argument 'instrument' of class Preferences (or once a hook is added,
+see method add_hook), every event below is timed, and its duration is
+added to a histogram of that event (see method stats of class
+Preferences). Hooks are called with the duration (in seconds) and a
+detail of the event:
+-"set":       setting an attribute (i.e. __setattr__), including its
+              validation, checks and (in the "immediate" flush-mode)
+              writing it; or setting one of the attributes of method
+              set_value (which validates them first, and writes them
+              all at once afterwards); the detail is the name of the
+              attribute
+-"validate":  validating a value (see argument 'schema'); the detail is
+              the name of the attribute
+-"check":     method check_before_setting_attribute; the detail is the
+              name of the attribute
+-"encode":    encoding all values into the content of the file (with
+              the backends "file" and "journal"), ahead of writing them;
+              the detail is the number of characters (or bytes)
+-"write":     a single write to the file (or journal, or database),
+              including encoding the values; the detail is the number of
+              bytes written
+-"load":      reading the file (when initializing, or with method
+              reload); the detail is the number of values read
+
+Without instrumentation, only a check whether it is on is added to the
+work done.
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import threading
+
+
+
+EVENTS = ("set", "validate", "check", "encode", "write", "load")
+
+# the upper bounds of the buckets of a histogram (in seconds): powers of two, from a microsecond to ~16 seconds
+_BUCKET_BOUNDS = tuple(2**i / 1e6 for i in range(25))
+
+
+
+class Histogram():
+    """
+    The number of durations (in seconds) that fell within each bucket
+    (between two powers of two microseconds), and their total, minimum
+    and maximum.
+    """
+    __slots__ = ("count", "total", "minimum", "maximum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.buckets = [0]*(len(_BUCKET_BOUNDS) + 1) # (the last one holds everything longer)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if self.minimum is None or duration < self.minimum:
+            self.minimum = duration
+        if self.maximum is None or duration > self.maximum:
+            self.maximum = duration
+        microseconds = int(duration * 1e6)
+        # (the bucket of which the upper bound is the smallest power of two that is at least 'duration')
+        self.buckets[min((microseconds - 1).bit_length() if microseconds > 1 else 0, len(_BUCKET_BOUNDS))] += 1
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket that holds the 'fraction'
+        (e.g. 0.99) of all durations (None if there are none).
+        """
+        if not self.count:
+            return None
+        needed = fraction * self.count
+        seen = 0
+        for bound, number in zip(_BUCKET_BOUNDS, self.buckets):
+            seen += number
+            if seen >= needed:
+                return bound
+        return self.maximum
+
+    def as_dict(self):
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count if self.count else None,
+                "min": self.minimum,
+                "max": self.maximum,
+                "p50": self.percentile(0.5),
+                "p99": self.percentile(0.99),
+                "buckets": [(bound, number) for bound, number in zip(_BUCKET_BOUNDS + (None,), self.buckets)
+                            if number]}
+
+
+
+class Instrumentation():
+    """
+    The histograms (see class Histogram) and hooks of the events of one
+    instance of class Preferences.
+    """
+
+    def __init__(self):
+        self.histograms = {event: Histogram() for event in EVENTS}
+        self.hooks = {event: [] for event in EVENTS}
+        self._lock = threading.Lock()
+
+    def record(self, event, duration, detail = None):
+        with self._lock:
+            self.histograms[event].add(duration)
+        for hook in self.hooks[event]:
+            hook(duration, detail)
+
+    def as_dict(self):
+        with self._lock:
+            return {event: histogram.as_dict() for event, histogram in self.histograms.items()}
@@ -0,0 +1,224 @@
+"""
+A read-only view on the file of class Preferences.
+
+Class ReadOnlyPreferences maps a file in the format "indexed" into
+memory, and only decodes the values that are asked for, each time they
+are asked for. Nothing is held in memory per value, and the pages of the
+file are shared by every process that has the same file open, which
+makes it suited for many processes that only read a large file that
+(at most) one process writes.
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import os
+import mmap
+from .serializers import IndexedData, decode_json
+from .storage import FileStorage, DELETED
+
+
+
+_MISSING = object()
+
+
+
+class ReadOnlyPreferences():
+    """
+    A read-only view on the attributes stored by class Preferences in
+    'filename', which must be in the format "indexed" (see argument
+    'format' of class Preferences). Values are read with method get or
+    as attributes, just like with class Preferences, but are decoded from
+    the file every time they are read (so changing a list that was read
+    changes nothing). Changes written by class Preferences are seen after
+    method reload (which method get calls). Use Preferences.open_readonly
+    to open a file relative to the calling script.
+    """
+    __slots__ = ("_filename", "_storage", "_file", "_mmap", "_index", "_journal", "_default_journal", "_signature")
+
+    def __init__(self, filename):
+        if not isinstance(filename, (str, bytes)):
+            error_message = "Argument 'filename' needs to be a path (either string or bytes) but found type %s."%(type(filename))
+            raise TypeError(error_message)
+        object.__setattr__(self, "_filename", filename)
+        # (only to read the journal, and to notice changes, just like class Preferences does)
+        object.__setattr__(self, "_storage", FileStorage(filename))
+        object.__setattr__(self, "_file", None)
+        object.__setattr__(self, "_mmap", None)
+        self._open()
+
+
+    def _current_file_signature(self):
+        # (the same signature as class Preferences uses in the shared mode)
+        return self._storage.signature()
+
+
+    def _open(self):
+        """
+        Maps the file into memory, and reads its journal (if any). The
+        file is replaced as a whole whenever class Preferences writes it,
+        so the mapped (old) file stays intact until method reload.
+        """
+        signature = self._current_file_signature()
+        opened_file = open(self._filename, "rb")
+        try:
+            mapped_file = mmap.mmap(opened_file.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            opened_file.close()
+            error_message = "The file '%s' is empty."%(os.fsdecode(self._filename))
+            raise ValueError(error_message)
+        try:
+            index = IndexedData(mapped_file)
+        except:
+            mapped_file.close()
+            opened_file.close()
+            raise
+        self.close()
+        object.__setattr__(self, "_file", opened_file)
+        object.__setattr__(self, "_mmap", mapped_file)
+        object.__setattr__(self, "_index", index)
+        journal, default_journal = self._read_journal()
+        object.__setattr__(self, "_journal", journal)
+        object.__setattr__(self, "_default_journal", default_journal)
+        object.__setattr__(self, "_signature", signature)
+
+
+    def _read_journal(self):
+        # changes in the journal are more recent than the file (see argument 'backend' of class Preferences)
+        # (default-values that changed one by one are kept apart, see method _store_default_change of class Preferences)
+        journal = {}
+        default_journal = {}
+        # (a change that was written halfway is left to class Preferences to remove)
+        for record in self._storage.read_journal(repair = False):
+            op = record["op"]
+            if op == "set_default":
+                default_journal[record["key"]] = record["value"]
+            elif op == "del_default":
+                default_journal[record["key"]] = DELETED
+            else:
+                journal[record["key"]] = record["value"] if op == "set" else DELETED
+                if record["key"] == "_defaults_of_this_class":
+                    default_journal.clear()
+        return journal, default_journal
+
+
+    def reload(self):
+        """
+        Takes over the changes made to the file, if the file has changed
+        since it was opened. This only costs a quick look at the file if
+        it has not changed. Returns whether the file had changed.
+        """
+        if self._current_file_signature() == self._signature:
+            return False
+        self._open()
+        return True
+
+
+    def close(self):
+        """
+        Closes the file. This view cannot be used anymore afterwards.
+        """
+        if self._mmap is not None:
+            object.__setattr__(self, "_index", None)
+            self._mmap.close()
+            self._file.close()
+            object.__setattr__(self, "_mmap", None)
+            object.__setattr__(self, "_file", None)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+    def _value(self, name, defaults = False):
+        if self._mmap is None:
+            error_message = "The file '%s' has been closed."%(os.fsdecode(self._filename))
+            raise ValueError(error_message)
+        if not isinstance(name, str):
+            error_message = "Input must be string-equivalent to an attribute, but found type %s."\
+                            %type(name)
+            raise TypeError(error_message)
+        if defaults and name in self._default_journal:
+            return self._default_journal[name]
+        journal = self._journal.get("_defaults_of_this_class" if defaults else name, _MISSING)
+        if journal is not _MISSING:
+            if defaults:
+                return journal.get(name, DELETED) if isinstance(journal, dict) else DELETED
+            return journal
+        text = self._index.find(name, defaults)
+        return DELETED if text is None else decode_json(text)
+
+
+    def __getattr__(self, name):
+        # (only called for names that are not one of the __slots__)
+        if not name.startswith("__"):
+            value = self._value(name)
+            if value is not DELETED:
+                return value
+        error_message = "'%s' object has no attribute '%s'"%(type(self).__name__, name)
+        raise AttributeError(error_message)
+
+
+    def __setattr__(self, name, value):
+        error_message = "Attribute '%s' cannot be set; the preferences are opened read-only."%(name)
+        raise AttributeError(error_message)
+
+
+    def __delattr__(self, name):
+        error_message = "Attribute '%s' cannot be deleted; the preferences are opened read-only."%(name)
+        raise AttributeError(error_message)
+
+
+    def get(self, name):
+        """
+        Gets value of attribute, after taking over any changes made to
+        the file (see method reload).
+        """
+        self.reload()
+        value = self._value(name)
+        if value is DELETED:
+            error_message = "'%s' is not a valid attribute; valid attributes are '%s'"\
+                            %(name,"', '".join(sorted(self.valid_attributes())))
+            raise AttributeError(error_message)
+        return value
+
+
+    def get_default_value(self, name):
+        """
+        Returns default-value of attribute.
+        (argument must be entered as string-equivalent).
+        """
+        if self._value(name) is DELETED:
+            error_message = "'%s' is not a valid attribute; valid attributes are '%s'"\
+                            %(name,"', '".join(sorted(self.valid_attributes())))
+            raise AttributeError(error_message)
+        value = self._value(name, defaults = True)
+        if value is DELETED:
+            error_message = "Attribute '%s' does not have a default-value."%(name)
+            raise ValueError(error_message)
+        return value
+
+
+    def header(self):
+        """
+        Returns the header of the file (None if it has none).
+        """
+        return self._index.header
+
+
+    def valid_attributes(self):
+        """
+        Returns current valid attributes as strings, in a list.
+        """
+        names = [name for name in self._index.keys()
+                 if not name in self._journal and name != "_schema_hash_of_this_class"]
+        names += [name for name, value in self._journal.items()
+                  if value is not DELETED and name != "_defaults_of_this_class"]
+        return names
+
@@ -0,0 +1,179 @@
+"""
+Declarative validation of the attributes of class Preferences.
+
+A schema is a dict that couples the names of attributes to what their
+values should be:
+- a type (or a tuple of types): the value must be an instance of it,
+  e.g. {"x": int} or {"x": (int, float)}
+- Coerce(function): the value is converted with 'function', e.g.
+  Coerce(int) turns "1" into 1 (values that already are of that type are
+  left alone)
+- Range(low, high): the value must lie between 'low' and 'high'
+  (including both); either may be None
+- any other function: it is called with the value, and returns the
+  value to set (or raises an error)
+- a list of the above: all of them, in that order, e.g.
+  [Coerce(int), Range(0, 10)]
+
+Function compile_schema turns a schema into a validator per attribute,
+such that setting an attribute only has to look up its validator.
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import hashlib
+import numbers
+
+
+
+class Coerce():
+    """
+    Converts the value with 'function' (usually a type, e.g. int), unless
+    it already is of that type. If the conversion fails, a TypeError is
+    raised.
+    """
+    def __init__(self, function):
+        if not callable(function):
+            error_message = "Coerce expects a type or function, but found type %s."%(type(function))
+            raise TypeError(error_message)
+        self.function = function
+
+    def __repr__(self):
+        return "Coerce(%s)"%(_describe(self.function))
+
+
+
+class Range():
+    """
+    Requires the value to be a number between 'low' and 'high' (including
+    both). Either of them may be None, for no limit. A value outside of
+    the range raises a ValueError.
+    """
+    def __init__(self, low = None, high = None):
+        for limit in (low, high):
+            if limit is not None and not isinstance(limit, numbers.Real):
+                error_message = "The limits of Range should be numbers (or None), but found type %s."%(type(limit))
+                raise TypeError(error_message)
+        if low is not None and high is not None and low > high:
+            error_message = "The lower limit of Range (%s) is higher than its upper limit (%s)."%(low, high)
+            raise ValueError(error_message)
+        self.low = low
+        self.high = high
+
+    def __repr__(self):
+        return "Range(%r, %r)"%(self.low, self.high)
+
+
+
+def _describe(spec):
+    # a description that is the same in every session (unlike the default repr of e.g. functions)
+    if isinstance(spec, (list, tuple)):
+        description = ", ".join(_describe(x) for x in spec)
+        return "[%s]"%(description) if isinstance(spec, list) else "(%s)"%(description)
+    if isinstance(spec, (Coerce, Range)):
+        return repr(spec)
+    return "%s.%s"%(getattr(spec, "__module__", None), getattr(spec, "__qualname__", repr(spec)))
+
+
+
+def _is_anonymous(spec):
+    # lambdas and functions defined within functions share their name (while they may differ, e.g. by what they enclose)
+    if isinstance(spec, (list, tuple)):
+        return any(_is_anonymous(x) for x in spec)
+    if isinstance(spec, Coerce):
+        return _is_anonymous(spec.function)
+    if isinstance(spec, (type, Range)) or not callable(spec):
+        return False
+    qualname = getattr(spec, "__qualname__", None)
+    return qualname is None or "<" in qualname
+
+
+
+def schema_hash(schema):
+    """
+    Returns a hash of 'schema', which only changes if the schema does.
+    Functions are only known by their name (e.g. "module.validate"), so
+    changing what a function does leaves the hash the same. Returns None
+    if the schema holds a function without a name of its own (e.g. a
+    lambda), which could not be told apart from another.
+    """
+    if any(_is_anonymous(spec) for spec in schema.values()):
+        return None
+    description = repr(sorted((name, _describe(spec)) for name, spec in schema.items()))
+    return hashlib.blake2b(description.encode("utf-8"), digest_size = 16).hexdigest()
+
+
+
+def _compile(name, spec):
+    """
+    Returns the validator of attribute 'name': a function that takes the
+    value and returns the value to be set (or raises an error).
+    """
+    if isinstance(spec, list):
+        validators = [_compile(name, x) for x in spec]
+        def validate(value):
+            for validator in validators:
+                value = validator(value)
+            return value
+        return validate
+
+    if isinstance(spec, type) or (isinstance(spec, tuple) and spec and all(isinstance(x, type) for x in spec)):
+        def validate(value):
+            if not isinstance(value, spec):
+                error_message = "Attribute '%s' should be of type %s, but found type %s."%(name, _describe(spec), type(value))
+                raise TypeError(error_message)
+            return value
+        return validate
+
+    if isinstance(spec, Coerce):
+        function = spec.function
+        def validate(value):
+            if isinstance(function, type) and isinstance(value, function):
+                return value
+            try:
+                return function(value)
+            except (TypeError, ValueError):
+                error_message = "Attribute '%s' should be convertible by %s, but found %r."%(name, _describe(function), value)
+                raise TypeError(error_message)
+        return validate
+
+    if isinstance(spec, Range):
+        low, high = spec.low, spec.high
+        def validate(value):
+            if isinstance(value, bool) or not isinstance(value, numbers.Real):
+                error_message = "Attribute '%s' should be a number, but found type %s."%(name, type(value))
+                raise TypeError(error_message)
+            if (low is not None and value < low) or (high is not None and value > high):
+                error_message = "Attribute '%s' should lie within %s, but found %s."%(name, spec, value)
+                raise ValueError(error_message)
+            return value
+        return validate
+
+    if callable(spec):
+        return spec
+
+    error_message = "The schema of attribute '%s' should be a type, Coerce, Range, function or a list of these, but found type %s."\
+                    %(name, type(spec))
+    raise TypeError(error_message)
+
+
+
+def compile_schema(schema):
+    """
+    Returns a dict that couples every attribute in 'schema' to its
+    validator: a function that takes a value, and returns the value to
+    set (possibly converted), or raises an error.
+    """
+    if not isinstance(schema, dict):
+        error_message = "The schema should be a dict, but found type %s."%(type(schema))
+        raise TypeError(error_message)
+    validators = {}
+    for name, spec in schema.items():
+        if not isinstance(name, str):
+            error_message = "The keys of the schema should be the names of attributes, but found type %s."%(type(name))
+            raise TypeError(error_message)
+        validators[name] = _compile(name, spec)
+    return validators
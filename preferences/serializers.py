@@ -0,0 +1,459 @@
+"""
+The formats in which class Preferences can store its values.
+
+Every format is a serializer with a method dump (which writes the header
+and values to an open file) and a method load (which returns the header
+and values found in the content of a file). The text formats ("json"
+and "compact-json") write the header as plain text at the top of the
+file. The binary formats start with a line that names the format, such
+that the format of a file is recognized when it is read.
+
+The formats "json" and "indexed" can also be read lazily: the values are
+then not decoded, but returned as RawJSON (which holds the text of that
+value in the file), such that only the values that are actually used
+need to be decoded. The format "indexed" starts with an index of its
+keys, such that a single value can even be found without reading the
+rest of the file (see class IndexedData).
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import json
+import re
+import pickle
+import marshal
+import struct
+import bisect
+import itertools
+import collections as col
+
+
+
+HEADER_SPLITTER = 40*"#"
+
+# (where the header ends, as written by the text formats; newlines may have become "\r\n")
+_HEADER_END = re.compile("\r?\n\r?\n" + HEADER_SPLITTER + "\r?\n\r?\n")
+
+_BINARY_MAGIC = b"\x00PREFS "
+
+_DEFAULTS_KEY = "_defaults_of_this_class"
+
+
+
+class RawJSON():
+    """
+    A value that has not been decoded yet; 'text' is its JSON.
+    """
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def decode(self):
+        return decode_json(self.text)
+
+
+
+class JSONSerializer():
+    """
+    Human-readable JSON: every attribute on its own line, followed by
+    the default values.
+    """
+    name = "json"
+    binary = False
+    writes_raw_json = True # i.e. values may be given as RawJSON to method dump
+
+    _ENCODER = json.JSONEncoder() # (same settings as json.dumps)
+
+    _DEFAULTS_KEY = _DEFAULTS_KEY
+
+    def dump(self, header, values, text_file):
+        """
+        Writes the values straight into the file, one attribute per
+        line, followed by the default values, which line up under each
+        other:
+
+        {"x": 1,
+         "y": [2, 3],
+         
+         "_defaults_of_this_class": {"x": 0,
+                                     "y": []}}
+
+        Every value is encoded on its own, so commas within values (e.g.
+        within strings) do not affect the layout, and only one value at a
+        time is held in memory as text. (Each value is encoded in one go
+        rather than with iterencode, since only the former uses the fast
+        encoder written in C.)
+        """
+        write = text_file.write
+        encode = self._ENCODER.encode
+        if header:
+            write(header + "\n\n"+HEADER_SPLITTER+"\n\n")
+
+        separator = "{"
+        for key in values:
+            if key == self._DEFAULTS_KEY:
+                continue
+            write(separator + encode(key) + ": ")
+            value = values[key]
+            write(value.text if isinstance(value, RawJSON) else encode(value))
+            separator = ",\n "
+
+        if self._DEFAULTS_KEY in values:
+            write(",\n \n " if separator != "{" else "{\n ")
+            prefix = encode(self._DEFAULTS_KEY) + ": "
+            write(prefix)
+            separator = "{"
+            for key, value in values[self._DEFAULTS_KEY].items():
+                write(separator + encode(key) + ": ")
+                write(encode(value))
+                separator = ",\n" + (len(prefix) + 2)*" "
+            write("{}}" if separator == "{" else "}}")
+        else:
+            write("{}" if separator == "{" else "}")
+
+    def load(self, data, lazy = False):
+        text = data.decode("utf-8") if isinstance(data, bytes) else data
+        header = None
+        # (the header is written first; the splitter may also be found within a value further on)
+        header_end = _HEADER_END.search(text)
+        if header_end is not None:
+            header, text = text[:header_end.start()], text[header_end.end():]
+        if not text.strip():
+            return header, {} # file was created, but nothing has been written to it yet (e.g. "deferred" flush-mode)
+        if lazy:
+            return header, index_json_object(text)
+        return header, decode_json(text)
+
+
+
+class CompactJSONSerializer(JSONSerializer):
+    """
+    JSON on a single line, without any spaces. Files in this format are
+    read exactly like the format "json".
+    """
+    name = "compact-json"
+
+    writes_raw_json = False
+
+    def dump(self, header, values, text_file):
+        if header:
+            text_file.write(header + "\n\n"+HEADER_SPLITTER+"\n\n")
+        text_file.write(json.dumps(values, separators = (",",":")))
+
+
+
+class _BinarySerializer():
+    """
+    Base class of the binary formats, which store the header and the
+    values together, after a line that names the format.
+    """
+    binary = True
+    writes_raw_json = False
+
+    def dump(self, header, values, binary_file):
+        binary_file.write(_BINARY_MAGIC + self.name.encode() + b"\n")
+        binary_file.write(self.dumps({"header": header, "values": values}))
+
+    def load(self, data, lazy = False):
+        # (these formats are always read entirely)
+        content = self.loads(data[data.index(b"\n")+1:])
+        return content["header"] or None, content["values"]
+
+
+
+class PickleSerializer(_BinarySerializer):
+    """
+    Python's pickle: fast, and able to store (almost) any python object.
+    Only read files in this format that you trust, since unpickling can
+    execute arbitrary code.
+    """
+    name = "pickle"
+
+    def dumps(self, content):
+        return pickle.dumps(content, protocol = pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+
+class MarshalSerializer(_BinarySerializer):
+    """
+    Python's marshal: the fastest format, but limited to the builtin
+    types (numbers, strings, bytes, lists, dicts, tuples, sets) and
+    dependent on the version of python.
+    """
+    name = "marshal"
+
+    def dumps(self, content):
+        try:
+            return marshal.dumps(content)
+        except ValueError:
+            # marshal only accepts the builtin types themselves, not subclasses of
+            # them (such as OrderedDict, or the containers of module 'tracking')
+            return marshal.dumps(_as_builtin_types(content))
+
+    def loads(self, data):
+        return marshal.loads(data)
+
+
+
+class IndexedSerializer(_BinarySerializer):
+    """
+    Every value as JSON, preceded by an index of the (sorted) keys with
+    the position of their value in the file. Reading a single value then
+    only requires a look at the index and at that value, which is what
+    class ReadOnlyPreferences does (on a memory-mapped file).
+
+    Layout, after the line that names the format:
+    - the length of the header, the number of values and the number of
+      default values (see _COUNTS)
+    - the header (UTF-8)
+    - an entry per value, followed by an entry per default value, both
+      sorted by key; every entry holds the position and length of the
+      key and of the value (see _ENTRY)
+    - the keys and values themselves (UTF-8 and JSON)
+    """
+    name = "indexed"
+    writes_raw_json = True
+
+    _ENCODER = json.JSONEncoder()
+
+    _COUNTS = struct.Struct("<QQQ")
+    _ENTRY = struct.Struct("<QIQI")
+
+    def _encoded_items(self, items):
+        encoded_items = []
+        for key, value in items:
+            text = value.text if isinstance(value, RawJSON) else self._ENCODER.encode(value)
+            encoded_items.append((key.encode("utf-8"), text.encode("utf-8")))
+        encoded_items.sort(key = lambda item: item[0]) # (keys are looked up by bisection)
+        return encoded_items
+
+    def dump(self, header, values, binary_file):
+        magic = _BINARY_MAGIC + self.name.encode() + b"\n"
+        header = (header or "").encode("utf-8")
+        value_items = self._encoded_items((key, value) for key, value in values.items()
+                                          if key != _DEFAULTS_KEY)
+        default_items = self._encoded_items(values.get(_DEFAULTS_KEY, {}).items())
+
+        binary_file.write(magic)
+        binary_file.write(self._COUNTS.pack(len(header), len(value_items), len(default_items)))
+        binary_file.write(header)
+        position = len(magic) + self._COUNTS.size + len(header) \
+                   + self._ENTRY.size*(len(value_items) + len(default_items))
+        for key, value in itertools.chain(value_items, default_items):
+            binary_file.write(self._ENTRY.pack(position, len(key), position + len(key), len(value)))
+            position += len(key) + len(value)
+        for key, value in itertools.chain(value_items, default_items):
+            binary_file.write(key)
+            binary_file.write(value)
+
+    def load(self, data, lazy = False):
+        index = IndexedData(data)
+        if lazy:
+            values = col.OrderedDict((key, RawJSON(text)) for key, text in index.items())
+        else:
+            values = col.OrderedDict((key, decode_json(text)) for key, text in index.items())
+        defaults = col.OrderedDict((key, decode_json(text)) for key, text in index.items(defaults = True))
+        if defaults:
+            values[_DEFAULTS_KEY] = defaults
+        return index.header, values
+
+
+
+class IndexedData():
+    """
+    Finds the values in 'data' (the content of a file in the format
+    "indexed", as bytes or as mmap) through its index, without reading
+    anything else of 'data'. Values are returned as their JSON.
+    """
+    _COUNTS = IndexedSerializer._COUNTS
+    _ENTRY = IndexedSerializer._ENTRY
+
+    def __init__(self, data):
+        if serializer_of_data(data[:len(_BINARY_MAGIC) + 20]).name != IndexedSerializer.name:
+            error_message = "The file is not stored in the format '%s'."%(IndexedSerializer.name)
+            raise ValueError(error_message)
+        self._data = data
+        position = data.find(b"\n") + 1
+        header_length, value_count, default_count = self._COUNTS.unpack_from(data, position)
+        position += self._COUNTS.size
+        self.header = data[position:position + header_length].decode("utf-8") or None
+        position += header_length
+        self._tables = {False: (position, value_count),
+                        True: (position + value_count*self._ENTRY.size, default_count)}
+
+    def __len__(self):
+        return self._tables[False][1]
+
+    def _entry(self, table_position, i):
+        return self._ENTRY.unpack_from(self._data, table_position + i*self._ENTRY.size)
+
+    def _key(self, table_position, i):
+        key_position, key_length, _, _ = self._entry(table_position, i)
+        return self._data[key_position:key_position + key_length]
+
+    def keys(self, defaults = False):
+        table_position, count = self._tables[defaults]
+        for i in range(count):
+            yield self._key(table_position, i).decode("utf-8")
+
+    def items(self, defaults = False):
+        table_position, count = self._tables[defaults]
+        for i in range(count):
+            key_position, key_length, value_position, value_length = self._entry(table_position, i)
+            yield (self._data[key_position:key_position + key_length].decode("utf-8"),
+                   self._data[value_position:value_position + value_length].decode("utf-8"))
+
+    def find(self, key, defaults = False):
+        """
+        Returns the JSON of the value of 'key' (or of its default value),
+        or None if there is no such key.
+        """
+        table_position, count = self._tables[defaults]
+        key = key.encode("utf-8")
+        entries = _LazySequence(lambda i: self._key(table_position, i), count)
+        i = bisect.bisect_left(entries, key)
+        if i == count or entries[i] != key:
+            return None
+        _, _, value_position, value_length = self._entry(table_position, i)
+        return self._data[value_position:value_position + value_length].decode("utf-8")
+
+
+
+class _LazySequence():
+    # (a sequence of which every item is computed when asked for, for module bisect)
+    def __init__(self, function, length):
+        self._function = function
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        return self._function(i)
+
+
+
+SERIALIZERS = col.OrderedDict((serializer.name, serializer) for serializer in
+                              (JSONSerializer(), CompactJSONSerializer(),
+                               PickleSerializer(), MarshalSerializer(),
+                               IndexedSerializer()))
+
+
+
+def serializer_of_data(data, allow_pickle = False):
+    """
+    Returns the serializer in whose format 'data' (the content of a
+    file, as bytes) was written. Since unpickling can execute arbitrary
+    code, a file in the format "pickle" raises a ValueError, unless
+    'allow_pickle' (i.e. that format was asked for explicitly).
+    """
+    if data.startswith(_BINARY_MAGIC):
+        name = data[len(_BINARY_MAGIC):data.index(b"\n")].decode()
+        if name == PickleSerializer.name and not allow_pickle:
+            error_message = "The file is stored in the format \"pickle\", which is only read when that format "+\
+                            "is given explicitly (see argument 'format' of class Preferences), as unpickling "+\
+                            "can execute arbitrary code."
+            raise ValueError(error_message)
+        try:
+            return SERIALIZERS[name]
+        except KeyError:
+            error_message = "The file is stored in the unknown format '%s'."%(name)
+            raise ValueError(error_message)
+    return SERIALIZERS["json"]
+
+
+
+def decode_json(text):
+    """
+    Decodes the JSON found in the file. Older versions of class
+    Preferences put newlines after every comma, including those within
+    strings, which JSON does not allow; for those files, the newlines
+    are removed first (which is only tried if decoding fails otherwise).
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(text.replace("\n",""))
+
+
+
+# (searching for a single character out of a set is much faster than
+#  searching for alternatives, hence strings are only matched once found)
+_TOP_LEVEL_TOKEN = re.compile(r'[{}\[\],:"]')
+_NESTED_TOKEN = re.compile(r'[{}\[\]"]')
+_REST_OF_STRING = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"')
+
+def _end_of_string(text, position):
+    # 'position' is just after the opening quote
+    match = _REST_OF_STRING.match(text, position)
+    if match is None:
+        raise ValueError("A string in the JSON object in the file is incomplete.")
+    return match.end()
+
+def index_json_object(text):
+    """
+    Returns the keys of the JSON object in 'text', each coupled to the
+    (undecoded) RawJSON of its value. Only the keys are decoded; nested
+    objects and arrays are skipped by looking for their brackets (and
+    strings, which may contain brackets) only.
+    """
+    match = _TOP_LEVEL_TOKEN.search(text)
+    if match is None or match.group() != "{":
+        raise ValueError("Expected a JSON object, but found '%s'."%(text[:20]))
+    values = col.OrderedDict()
+    position = match.end()
+    key = start = None
+    while True:
+        match = _TOP_LEVEL_TOKEN.search(text, position)
+        if match is None:
+            raise ValueError("The JSON object in the file is incomplete.")
+        token = match.group()
+        position = match.end()
+        if token == '"':
+            position = _end_of_string(text, position)
+            if key is None:
+                key = decode_json(text[match.start():position])
+        elif token == ":":
+            start = position
+        elif token in ",}":
+            if key is not None:
+                values[key] = RawJSON(text[start:match.start()].strip())
+                key = None
+            if token == "}":
+                return values
+        elif token in "{[":
+            depth = 1
+            while depth:
+                match = _NESTED_TOKEN.search(text, position)
+                if match is None:
+                    raise ValueError("The JSON object in the file is incomplete.")
+                position = match.end()
+                token = match.group()
+                if token == '"':
+                    position = _end_of_string(text, position)
+                elif token in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+        else:
+            raise ValueError("Unexpected '%s' in the JSON object in the file."%(token))
+
+
+
+def _as_builtin_types(value):
+    if isinstance(value, dict):
+        return {key: _as_builtin_types(x) for key, x in value.items()}
+    if isinstance(value, list):
+        return [_as_builtin_types(x) for x in value]
+    if isinstance(value, tuple):
+        return tuple(_as_builtin_types(x) for x in value)
+    if isinstance(value, (set, frozenset)):
+        return set(value) if isinstance(value, set) else frozenset(value)
+    return value
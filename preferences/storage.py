@@ -0,0 +1,530 @@
+"""
+Where class Preferences stores its attributes.
+
+Class Preferences does not read or write any file itself, but leaves that
+to a storage (see argument 'backend' of class Preferences): an instance of
+a subclass of Storage, which provides the following methods:
+- exists():               whether anything has been stored yet
+- load(lazy):             returns the header and a dict with the stored
+                          values (with the default values under the key
+                          "_defaults_of_this_class")
+- save_full(header, attributes):
+                          replaces everything that is stored
+- save_delta(values, defaults, all_defaults):
+                          stores only the attributes that changed, or
+                          returns False if the storage rather has all of
+                          them (with method save_full)
+- delete():               removes everything that is stored
+and counts the bytes it has written in attribute 'bytes_written' (see
+method stats of class Preferences).
+
+This module holds the storage of the backends "file" and "journal"
+(class FileStorage) and of the backend "memory" (class MemoryStorage),
+which does not touch the disk at all. The backend "sqlite" is in module
+'database'.
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+from copy import deepcopy
+import os
+import io
+import stat
+import json
+import hashlib
+import itertools
+import threading
+import time
+from .serializers import SERIALIZERS, RawJSON, serializer_of_data
+
+
+
+# marks a value (or default value) that has been deleted (see method save_delta)
+DELETED = object()
+
+_DEFAULTS_KEY = "_defaults_of_this_class"
+
+
+
+_TEMPORARY_FILE_COUNTER = itertools.count()
+
+def _fsync_directory(filename):
+    # makes sure that the creation/renaming/removal of 'filename' survives a crash
+    if os.name != "posix":
+        return # directories cannot be opened (and synced) on e.g. Windows
+    directory = os.path.dirname(os.path.abspath(filename))
+    file_descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
+
+class _HashingWriter():
+    """
+    Passes everything that is written on to 'opened_file', while keeping
+    track of the digest of all that has been written.
+    """
+    def __init__(self, opened_file, binary):
+        self._opened_file = opened_file
+        self._binary = binary
+        self.digest = hashlib.blake2b()
+
+    def write(self, data):
+        self.digest.update(data if self._binary else data.encode("utf-8"))
+        return self._opened_file.write(data)
+
+
+def write_atomically(filename, write, durability = "none", binary = False,
+                     unchanged_digest = None):
+    """
+    Writes to 'filename' by calling function 'write' with the opened
+    file (in binary mode if 'binary', otherwise as UTF-8 text), such
+    that anyone reading 'filename' finds either the old or the new
+    content, but never a mix of both (or an empty file), even if the
+    program crashes halfway. This is done by writing to a temporary file
+    next to it, which then replaces 'filename'.
+    'durability' determines whether the data is flushed to the disk
+    before returning: "none" leaves it up to the operating system,
+    "file" syncs the data of the file, and "directory" syncs the
+    directory as well (such that the renaming is on the disk too).
+    Returns the digest of the content and whether 'filename' has been
+    replaced; this is not done if the digest is 'unchanged_digest' (the
+    digest of the content already in 'filename').
+    An existing 'filename' keeps its permissions, and if it is a
+    symbolic link, the file it links to is replaced instead.
+    """
+    filename = os.path.realpath(os.fsdecode(filename)) # (so that a symbolic link is kept)
+    temporary_filename = "%s.%s-%s-%s.tmp"%(filename, os.getpid(), threading.get_ident(),
+                                            next(_TEMPORARY_FILE_COUNTER))
+    file_descriptor = os.open(temporary_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        try:
+            mode = stat.S_IMODE(os.stat(filename).st_mode)
+        except FileNotFoundError:
+            pass # (a new file gets the permissions of the umask)
+        else:
+            if hasattr(os, "fchmod"):
+                os.fchmod(file_descriptor, mode)
+            else:
+                os.chmod(temporary_filename, mode)
+        with (os.fdopen(file_descriptor, "wb") if binary else
+              os.fdopen(file_descriptor, "w", encoding = "utf-8")) as opened_file:
+            hashing_writer = _HashingWriter(opened_file, binary)
+            write(hashing_writer)
+            digest = hashing_writer.digest.digest()
+            unchanged = digest == unchanged_digest and os.path.exists(filename)
+            if not unchanged and durability != "none":
+                opened_file.flush()
+                os.fsync(opened_file.fileno())
+        if unchanged:
+            os.remove(temporary_filename)
+            return digest, False
+        os.replace(temporary_filename, filename)
+    except:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+        raise
+    if durability == "directory":
+        _fsync_directory(filename)
+    return digest, True
+
+
+
+class Storage():
+    """
+    Base class of the places where class Preferences stores its
+    attributes (see the description of this module). Subclasses
+    implement methods exists, load, save_full, save_delta and delete;
+    a storage in a file also returns its files in method filenames (so
+    that changes made by others can be noticed, see method reload of
+    class Preferences).
+    """
+
+    # the format of the values, as far as class Preferences needs to know it
+    serializer = SERIALIZERS["json"]
+
+    # the number of changes that method load found on top of the last full save
+    # (e.g. in a journal); these have not been checked against the schema of the file
+    journal_length = 0
+
+    # the number of bytes written so far (by methods save_full and save_delta)
+    bytes_written = 0
+
+    # the time spent encoding all values so far (in seconds), and the number of characters (or
+    # bytes) they were encoded into (by a storage that encodes them as a whole, e.g. in a file)
+    encoding_time = 0.0
+    characters_encoded = 0
+
+    def exists(self):
+        """
+        Returns whether anything has been stored yet. If not, class
+        Preferences stores everything (with method save_full).
+        """
+        raise NotImplementedError
+
+    def load(self, lazy = False):
+        """
+        Returns the stored header (None if there is none) and a dict with
+        the stored values, with the default values under the key
+        "_defaults_of_this_class". If 'lazy', values may be returned as
+        RawJSON (i.e. not decoded yet).
+        """
+        raise NotImplementedError
+
+    def save_full(self, header, attributes):
+        """
+        Replaces everything that is stored by 'header' and 'attributes'
+        (which holds the default values under "_defaults_of_this_class").
+        Returns whether anything was written (False if it would have
+        remained exactly the same).
+        """
+        raise NotImplementedError
+
+    def save_delta(self, values, defaults, all_defaults = False):
+        """
+        Stores only the attributes that changed: 'values' and 'defaults'
+        couple their names to their new (default) value, or to DELETED.
+        If 'all_defaults', 'defaults' holds all default values, and any
+        other default value is removed. Returns False (without storing
+        anything) if the storage rather has everything, with method
+        save_full.
+        """
+        return False
+
+    def delete(self):
+        """
+        Removes everything that is stored.
+        """
+        raise NotImplementedError
+
+    def filenames(self):
+        """
+        Returns the files that change whenever something is stored.
+        """
+        return ()
+
+    def signature(self):
+        """
+        Returns something that changes whenever something is stored (by
+        anyone), without having to read what is stored; by default, the
+        sizes and times of modification of the files (see method
+        filenames).
+        """
+        signature = []
+        for filename in self.filenames():
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                signature.append(None)
+            else:
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns))
+        return tuple(signature)
+
+    def close(self):
+        pass
+
+
+
+class FileStorage(Storage):
+    """
+    Stores the attributes in 'filename', in the format of 'serializer'
+    (see module 'serializers'; if None, the format of the existing file
+    is used, or "json" for a new file). The file is always replaced as a
+    whole (see function write_atomically). With 'journal' (the backend
+    "journal"), the changes are appended to a journal instead (the
+    filename followed by ".journal"), until it holds 'compact_every'
+    changes.
+    """
+
+    _JOURNAL_EXTENSION = ".journal"
+
+    def __init__(self, filename, serializer = None, durability = "none",
+                       journal = False, compact_every = 1000):
+        self.filename = filename
+        self.serializer = serializer
+        extension = self._JOURNAL_EXTENSION
+        self.journal_filename = filename + (extension.encode() if isinstance(filename, bytes) else extension)
+        self._journal = journal
+        self._durability = durability
+        self._compact_every = compact_every
+        self._digest = None # (of what the file holds, to skip writing the same content)
+        self._lock = threading.Lock()
+        self.journal_length = 0
+
+
+    def exists(self):
+        # (an empty file, as created by method load, holds no values nor header yet)
+        try:
+            return os.path.getsize(self.filename) > 0
+        except FileNotFoundError:
+            return False
+
+
+    def filenames(self):
+        return (self.filename, self.journal_filename)
+
+
+    def load(self, lazy = False):
+        """
+        Reads the file (and its journal, if any). If the file does not
+        exist yet, it is created.
+        """
+        header_from_file = None
+        saved_values = {}
+        serializer = SERIALIZERS["json"]
+        try:
+            with open(self.filename, 'rb') as inputfile:
+                data = inputfile.read()
+        except FileNotFoundError:
+             text_file = open(self.filename,'a') # (does not truncate, in case another process was first)
+             text_file.close()
+        else:
+            self._digest = hashlib.blake2b(data).digest()
+            try:
+                # (only unpickles if the format "pickle" was given explicitly)
+                serializer = serializer_of_data(data, allow_pickle = self.serializer is SERIALIZERS["pickle"])
+                header_from_file, saved_values = serializer.load(data, lazy)
+            except:
+                print("something has gone wrong when trying to read the preferences_file named '%s'. What was read is: \n'%s'"%(
+                    self.filename,data) )
+                raise
+        if self.serializer is None:
+            self.serializer = serializer
+
+        # a journal may hold changes that are more recent than the file
+        # (it is read regardless of the backend, so that its changes do not get lost)
+        self.journal_length = 0
+        self._replay_journal(saved_values)
+        return header_from_file, saved_values
+
+
+    def read_journal(self, repair = True):
+        """
+        Returns the changes stored in the journal, in the order in which
+        they were made: dicts with the operation ("op": "set", "del",
+        "set_default" or "del_default"), the name ("key") and, unless it
+        is removed, the "value". Every line of the journal holds one
+        change, as JSON. A last change that was only written halfway
+        (e.g. due to a crash) is left out, and if 'repair', removed from
+        the journal (so that new changes are not appended to it).
+        """
+        try:
+            with open(self.journal_filename, 'r') as journal:
+                lines = journal.read().split("\n")
+        except FileNotFoundError:
+            return []
+        records = []
+        for i, line in enumerate(lines):
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                if i == len(lines) - 1:
+                    if repair:
+                        with open(self.journal_filename, 'w') as journal:
+                            journal.write("".join(line + "\n" for line in lines[:i]))
+                    break
+                raise
+        return records
+
+
+    def _replay_journal(self, saved_values):
+        """
+        Applies the changes stored in the journal (see method
+        read_journal) to the dict 'saved_values' (which holds the values
+        as read from the file).
+        """
+        for record in self.read_journal():
+            if record["op"] in ("set_default", "del_default") and isinstance(saved_values.get(_DEFAULTS_KEY), RawJSON):
+                saved_values[_DEFAULTS_KEY] = saved_values[_DEFAULTS_KEY].decode() # (read lazily, see method load)
+            if record["op"] == "set":
+                saved_values[record["key"]] = record["value"]
+            elif record["op"] == "del":
+                saved_values.pop(record["key"], None)
+            elif record["op"] == "set_default":
+                saved_values.setdefault(_DEFAULTS_KEY, {})[record["key"]] = record["value"]
+            elif record["op"] == "del_default":
+                saved_values.get(_DEFAULTS_KEY, {}).pop(record["key"], None)
+            self.journal_length += 1
+
+
+    def save_delta(self, values, defaults, all_defaults = False):
+        """
+        Appends the changes to the journal (only with the backend
+        "journal"). Once the journal would hold more than 'compact_every'
+        changes, False is returned, so that the journal is merged into
+        the file by method save_full. As the journal holds JSON, the same
+        is done for the formats "pickle" and "marshal" (of which the
+        values may be sets, tuples and the like), and for values that
+        cannot be written as JSON.
+        """
+        serializer = self.serializer
+        if not self._journal or (serializer.binary and not serializer.writes_raw_json):
+            return False
+        records = []
+        if all_defaults:
+            records.append({"op": "set", "key": _DEFAULTS_KEY, "value": defaults})
+        else:
+            for key in sorted(defaults):
+                if defaults[key] is DELETED:
+                    records.append({"op": "del_default", "key": key})
+                else:
+                    records.append({"op": "set_default", "key": key, "value": defaults[key]})
+        for key in sorted(values):
+            value = values[key]
+            if value is DELETED:
+                records.append({"op": "del", "key": key})
+            else:
+                records.append({"op": "set", "key": key, "value": value.decode() if isinstance(value, RawJSON) else value})
+        try:
+            lines = [json.dumps(record) + "\n" for record in records]
+        except (TypeError, ValueError):
+            return False
+        if self.journal_length + len(lines) > self._compact_every:
+            return False
+        with open(self.journal_filename, 'a') as journal:
+            journal.write("".join(lines))
+            if self._durability != "none":
+                journal.flush()
+                os.fsync(journal.fileno())
+        if self._durability == "directory" and not self.journal_length:
+            _fsync_directory(self.journal_filename) # the journal has just been created
+        self.journal_length += len(lines)
+        self.bytes_written += sum(len(line) for line in lines) # (json.dumps only writes ASCII)
+        return True
+
+
+    def save_full(self, header, attributes):
+        """
+        Writes the file (encoded first, see method encode), and removes
+        the journal (as every change in it is now in the file as well).
+        """
+        return self.encode(header, attributes)()
+
+
+    def encode(self, header, attributes):
+        """
+        Encodes the content of the file right away, and returns a function
+        that writes that content to the file (just like method save_full),
+        so that the writing itself can be done later (or elsewhere).
+        """
+        serializer = self.serializer
+        start = time.perf_counter()
+        content = io.BytesIO() if serializer.binary else io.StringIO()
+        serializer.dump(header, attributes, content)
+        content = content.getvalue()
+        digest = hashlib.blake2b(content if serializer.binary else content.encode("utf-8")).digest()
+        with self._lock:
+            self.encoding_time += time.perf_counter() - start
+            self.characters_encoded += len(content)
+        return lambda: self._replace(content, digest, serializer.binary)
+
+
+    def _replace(self, content, digest, binary):
+        """
+        Replaces the file by 'content' (of which 'digest' is the digest),
+        unless that is exactly what the file holds already; the file is
+        then not touched at all. Any journal is obsolete afterwards.
+        """
+        replaced = not (digest == self._digest and os.path.exists(self.filename))
+        if replaced:
+            write_atomically(self.filename, lambda opened_file: opened_file.write(content), self._durability, binary)
+        with self._lock:
+            if replaced:
+                self._digest = digest
+                self.bytes_written += os.path.getsize(self.filename)
+            if self.journal_length:
+                # every change in the journal is now also in the file
+                if os.path.exists(self.journal_filename):
+                    os.remove(self.journal_filename)
+                    if self._durability == "directory":
+                        _fsync_directory(self.journal_filename)
+                self.journal_length = 0
+        return replaced
+
+
+    def delete(self):
+        with self._lock:
+            self._digest = None
+            for filename in (self.filename, self.journal_filename):
+                if os.path.exists(filename):
+                    os.remove(filename)
+            self.journal_length = 0
+
+
+
+class MemoryStorage(Storage):
+    """
+    Keeps the attributes in memory only (the backend "memory"), e.g. for
+    tests and short-lived programs that do not need the values to
+    survive: nothing is ever written to (or read from) the disk. The
+    values are stored as copies, so changing a value in place changes
+    nothing that is stored. Several instances of class Preferences can
+    share the same MemoryStorage (given as their 'backend'), just like
+    they would share a file.
+    """
+
+    def __init__(self):
+        self._header = None
+        self._values = None # (None until something is stored)
+        self._version = 0 # (see method signature)
+        self._lock = threading.Lock()
+
+
+    def exists(self):
+        return self._values is not None
+
+
+    def signature(self):
+        return self._version
+
+
+    def load(self, lazy = False):
+        with self._lock:
+            if self._values is None:
+                return None, {}
+            return self._header, deepcopy(self._values)
+
+
+    def save_full(self, header, attributes):
+        attributes = {key: value.decode() if isinstance(value, RawJSON) else value
+                      for key, value in attributes.items()}
+        attributes = deepcopy(attributes)
+        attributes[_DEFAULTS_KEY] = dict(attributes.get(_DEFAULTS_KEY, {}))
+        with self._lock:
+            self._header = header
+            self._values = attributes
+            self._version += 1
+        return True
+
+
+    def save_delta(self, values, defaults, all_defaults = False):
+        # (DELETED is left out of the copies, as a copy of it would not be DELETED anymore)
+        deleted_values = [key for key, value in values.items() if value is DELETED]
+        deleted_defaults = [key for key, value in defaults.items() if value is DELETED]
+        values = deepcopy({key: value.decode() if isinstance(value, RawJSON) else value
+                           for key, value in values.items() if value is not DELETED})
+        defaults = deepcopy({key: value for key, value in defaults.items() if value is not DELETED})
+        with self._lock:
+            stored_defaults = self._values[_DEFAULTS_KEY]
+            if all_defaults:
+                stored_defaults.clear()
+            stored_defaults.update(defaults)
+            for key in deleted_defaults:
+                stored_defaults.pop(key, None)
+            self._values.update(values)
+            for key in deleted_values:
+                self._values.pop(key, None)
+            self._version += 1
+        return True
+
+
+    def delete(self):
+        with self._lock:
+            self._header = None
+            self._values = None
+            self._version += 1
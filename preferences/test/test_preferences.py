@@ -1,6 +1,7 @@
 import unittest
 import os
 import inspect
+import json
 
 
 try:
@@ -58,6 +59,14 @@ def set_to_different_values(self,list_with_values = (4,5,6)):
     self.P.x3 = list_with_values[2]
 
 
+VALIDATED = [] # (the values that function upper validated)
+
+def upper(value):
+    # (a validator for the schema; at module level, as it is then known by its name)
+    VALIDATED.append(value)
+    return value.upper()
+
+
 class MyTestPrefs(Preferences):
     def check_before_setting_attribute(self, name, value):
         # checks if x1 is integer; otherwise raise TypeError
@@ -248,7 +257,11 @@ class TestPreferences(unittest.TestCase):
 
         self.P = self.initialize_with_dict()
         set_to_different_values(self)
-        self.P.reset_to_default("x1")
+        # (resetting a single attribute does not list all of them)
+        from unittest import mock
+        with mock.patch.object(Preferences, "valid_attributes") as valid_attributes:
+            self.P.reset_to_default("x1")
+        self.assertFalse(valid_attributes.called)
         assert_values(self,[1,5,6])
 
         self.tearDown()
@@ -396,6 +409,986 @@ class TestPreferences(unittest.TestCase):
         
         
 
+    def test_deferred_flush(self):
+        self.P = Preferences(defaults = self.defaults_with_dict,
+                             filename = self.filename,
+                             flush = "deferred",
+                             flush_interval = 60)
+        for i in range(100):
+            self.P.x1 = i
+        # nothing is written before the interval passed
+        with open(self.P._filename_to_store_the_preferences) as inputfile:
+            self.assertTrue(inputfile.read() == "")
+        self.P.flush()
+        P2 = Preferences(filename = self.filename)
+        self.assertTrue(P2.x1 == 99)
+
+    def test_deferred_flush_by_timer(self):
+        import time
+        self.P = Preferences(defaults = self.defaults_with_dict,
+                             filename = self.filename,
+                             flush = "deferred",
+                             flush_interval = 0.01)
+        self.P.flush()
+        self.P.x1 = 4
+        for i in range(200):
+            with self.P._lock_of_this_class:
+                if self.P._flush_timer_of_this_class is None:
+                    break
+            time.sleep(0.01)
+        P2 = Preferences(filename = self.filename)
+        self.assertTrue(P2.x1 == 4)
+
+    def test_batch(self):
+        self.P = self.initialize_with_dict()
+        file_name_ = self.P._filename_to_store_the_preferences
+        with self.P.batch():
+            set_to_different_values(self)
+            self.P.x4 = 7
+            # nothing is written within the batch
+            self.assertTrue(Preferences(filename = file_name_).x1 == 1)
+        P2 = Preferences(filename = file_name_)
+        self.assertTrue(P2.x1 == 4 and P2.x4 == 7)
+
+        # when an error is raised, all changes are undone
+        with self.assertRaises(ZeroDivisionError):
+            with self.P.batch():
+                self.P.x1 = 10
+                self.P.x5 = 11
+                self.P.set_default_values(x1 = 12)
+                1/0
+        assert_different_values(self)
+        self.assertFalse("x5" in self.P.valid_attributes())
+        self.assertTrue(self.P.get_default_value("x1") == 1)
+        P2 = Preferences(filename = file_name_)
+        self.assertTrue(P2.x1 == 4 and not "x5" in P2.valid_attributes())
+
+        # changes that were written within the batch are written back as well
+        for backend in ("file", "journal"):
+            P3 = Preferences(filename = file_name_, backend = backend)
+            with self.assertRaises(ZeroDivisionError):
+                with P3.batch():
+                    P3.x1 = 10
+                    P3.x5 = 11
+                    P3.set_default_values(x1 = 12)
+                    P3.flush()
+                    1/0
+            P2 = Preferences(filename = file_name_)
+            self.assertTrue(P2.x1 == 4 and not "x5" in P2.valid_attributes())
+            self.assertTrue(P2.get_default_value("x1") == 1)
+
+        # only what a batch changes is kept to undo it, including values that were not decoded yet
+        P3 = Preferences(filename = file_name_, lazy = True)
+        with self.assertRaises(ZeroDivisionError):
+            with P3.batch():
+                with P3.batch():
+                    P3.x1 = 10
+                    P3.delete_attribute("x2")
+                P3.set_default_values(x6 = 13)
+                self.assertTrue(sorted(P3._undo_logs_of_this_class[-1].values) == ["x1", "x2", "x6"])
+                self.assertTrue(sorted(P3._undo_logs_of_this_class[-1].defaults) == ["x2", "x6"])
+                1/0
+        self.assertTrue(P3.valid_attributes() == P2.valid_attributes() and not P3._unwritten_changes_of_this_class)
+        self.assertTrue(P3.x1 == 4 and P3.get("x2") == P2.get("x2") and P3.get_default_value("x2") == 2)
+        self.assertFalse("x6" in P3._defaults_of_this_class or P3._undo_logs_of_this_class)
+
+    def test_set_value_is_all_or_nothing(self):
+        self.P = MyTestPrefs(filename = self.filename)
+        self.P.set_value(x1 = 1, x4 = 1)
+        with self.assertRaises(TypeError):
+            self.P.set_value(x4 = 2, x1 = "not an integer")
+        self.assertTrue(self.P.x4 == 1)
+
+    def test_journal(self):
+        self.P = Preferences(defaults = self.defaults_with_dict,
+                             filename = self.filename,
+                             backend = "journal",
+                             compact_every = 10)
+        file_name_ = self.P._filename_to_store_the_preferences
+        with open(file_name_) as inputfile:
+            file_string = inputfile.read()
+        set_to_different_values(self)
+        self.P.delete_attribute("x2")
+        # only the journal has been written
+        with open(file_name_) as inputfile:
+            self.assertTrue(inputfile.read() == file_string)
+        P2 = Preferences(filename = file_name_)
+        self.assertTrue(P2.x1 == 4 and P2.x3 == 6)
+        self.assertFalse("x2" in P2.valid_attributes())
+
+        # a change that was only written halfway is ignored
+        with open(file_name_ + ".journal", "a") as journal:
+            journal.write('{"op": "set", "key": "x1", "va')
+        P2 = Preferences(filename = file_name_)
+        self.assertTrue(P2.x1 == 4)
+
+        # the journal is merged into the file once it gets too long
+        for i in range(25):
+            self.P.x1 = i
+            self.assertTrue(self.P._storage_of_this_class.journal_length <= 10)
+        P2 = Preferences(filename = file_name_)
+        self.assertTrue(P2.x1 == 24 and P2.x3 == 6)
+        self.P.delete_preferences_file()
+        self.assertFalse(os.path.exists(file_name_))
+
+        # a new file (or a new header) is written as a whole, before any change goes to the journal
+        self.P = Preferences(filename = file_name_, backend = "journal", header = "HEAD", format = "indexed", x1 = 1)
+        self.P.x1 = 2
+        P2 = Preferences(filename = file_name_)
+        self.assertTrue(P2._header_of_this_class == "HEAD" and P2.x1 == 2)
+        with Preferences.open_readonly(file_name_) as view:
+            self.assertTrue(view.x1 == 2)
+        self.P = Preferences(filename = file_name_, backend = "journal", header = "HEAD2")
+        self.P.x1 = 3
+        P2 = Preferences(filename = file_name_)
+        self.assertTrue(P2._header_of_this_class == "HEAD2" and P2.x1 == 3)
+        self.P.delete_preferences_file()
+
+        # values that the journal (JSON) cannot hold are written to the file as a whole
+        for format, value in (("pickle", {1, 2}), ("marshal", (1, 2))):
+            self.P = Preferences(filename = file_name_, backend = "journal", format = format, x1 = 1)
+            self.P.x1 = value
+            P2 = Preferences(filename = file_name_, format = format)
+            self.assertTrue(P2.x1 == value and type(P2.x1) is type(value))
+            self.assertFalse(os.path.exists(file_name_ + ".journal"))
+            self.P.delete_preferences_file()
+
+    def test_sqlite(self):
+        self.P = Preferences(filename = self.filename, backend = "sqlite", header = "some header",
+                             x1 = 1, x2 = [2, "a,b"], x3 = {"c": None})
+        database = self.P._storage_of_this_class
+        self.assertTrue(database.exists())
+        connection = database._connect()
+        writes = self.P.stats()["writes"]
+        self.P.x1 = 4
+        self.P.x4 = "new"
+        self.P.set_default_values(x2 = [])
+        self.P.delete_attribute("x3")
+        self.assertTrue(self.P.stats()["writes"] == writes + 4)  # one transaction per change
+        rows = connection.execute("SELECT key, value, default_value FROM preferences ORDER BY key").fetchall()
+        self.assertTrue(rows == [("x1", "4", "1"), ("x2", '[2, "a,b"]', "[]"), ("x4", '"new"', None)])
+
+        for lazy in (False, True):
+            P2 = Preferences(filename = self.filename, backend = "sqlite", lazy = lazy)
+            self.assertTrue(P2.x1 == 4 and P2.get("x2") == [2, "a,b"] and P2.x4 == "new")
+            self.assertTrue(P2.get_default_value("x2") == [] and not "x3" in P2.valid_attributes())
+            self.assertTrue(P2._header_of_this_class == "some header")
+
+        # other instances take over the changes (see method reload)
+        P2.x1 = 5
+        self.assertTrue(self.P.reload() == ["x1"] and self.P.x1 == 5)
+
+        # to and from files
+        text_filename = os.path.join(CURRENT_PATH, "exported_" + self.filename)
+        self.P.export_to_file(text_filename)
+        P3 = Preferences(filename = text_filename)
+        self.assertTrue(P3.x2 == [2, "a,b"] and P3.get_default_value("x1") == 1)
+        P3.x5 = 6
+        self.P.import_from_file(text_filename)
+        self.assertTrue(self.P.x5 == 6)
+        self.assertTrue(Preferences(filename = self.filename, backend = "sqlite").x5 == 6)
+        with self.assertRaises(ValueError):
+            Preferences(filename = text_filename, backend = "sqlite")
+        P3.delete_preferences_file()
+
+        # the database is created again after it has been deleted
+        self.P.delete_preferences_file()
+        self.assertFalse(os.path.exists(self.P._filename_to_store_the_preferences))
+        self.P.x1 = 7
+        self.assertTrue(Preferences(filename = self.filename, backend = "sqlite").x4 == "new")
+
+    def test_storage(self):
+        from preferences.storage import Storage, MemoryStorage
+        self.P = Preferences(filename = self.filename, backend = "memory", x1 = 1, x2 = [2])
+        self.assertFalse(os.path.exists(self.P._filename_to_store_the_preferences))
+        self.P.x1 = 3
+        self.P.x2.append(3) # (not stored, as only a copy is)
+        self.assertTrue(self.P._storage_of_this_class.load()[1] == {"x1": 3, "x2": [2],
+                                                                    "_defaults_of_this_class": {"x1": 1, "x2": [2]}})
+        self.assertTrue(Preferences(filename = self.filename, backend = "memory").valid_attributes() == [])
+        with self.assertRaises(ValueError):
+            self.P.watch()
+
+        # instances with the same storage share their values
+        storage = MemoryStorage()
+        P2 = Preferences(backend = storage, x1 = 1)
+        P3 = Preferences(backend = storage)
+        self.assertTrue(P3.x1 == 1 and P3.get_default_value("x1") == 1)
+        P2.x1 = 2
+        P2.delete_attribute("x1")
+        P2.x3 = 4
+        self.assertTrue(sorted(P3.reload()) == ["x1", "x3"] and P3.x3 == 4)
+        with self.assertRaises(ValueError):
+            P2.namespace("ui")
+        P2.delete_preferences_file()
+        self.assertFalse(storage.exists())
+
+        # any storage will do
+        class CountingStorage(MemoryStorage):
+            deltas = 0
+            def save_delta(self, values, defaults, all_defaults = False):
+                self.deltas += 1
+                return super().save_delta(values, defaults, all_defaults)
+        P4 = Preferences(backend = CountingStorage(), x1 = 1)
+        P4.x1 = 2
+        self.assertTrue(P4._storage_of_this_class.deltas == 1)
+
+        # changes that failed to be written are written with the next write
+        class FailingStorage(MemoryStorage):
+            fail = False
+            def save_delta(self, values, defaults, all_defaults = False):
+                if self.fail:
+                    raise OSError("disk full")
+                return super().save_delta(values, defaults, all_defaults)
+        storage = FailingStorage()
+        P5 = Preferences(backend = storage, defaults = {"x1": 1, "x2": 2}, flush = "deferred", flush_interval = 1000)
+        P5.flush()
+        P5.set_default_values(x1 = 10)
+        P5.x2 = 3
+        storage.fail = True
+        with self.assertRaises(OSError):
+            P5.flush()
+        self.assertTrue(P5._unwritten_changes_of_this_class == {"x2", "_defaults_of_this_class"})
+        self.assertTrue(P5._unwritten_defaults_of_this_class == {"x1"})
+        storage.fail = False
+        P5.flush()
+        self.assertTrue(storage.load()[1] == {"x1": 1, "x2": 3, "_defaults_of_this_class": {"x1": 10, "x2": 2}})
+        with self.assertRaises(ValueError):
+            Preferences(backend = "tape")
+        with self.assertRaises(NotImplementedError):
+            Storage().load()
+
+    def test_atomic_write(self):
+        from unittest import mock
+        for durability in ("none", "file", "directory"):
+            self.P = Preferences(defaults = self.defaults_with_dict,
+                                 filename = self.filename,
+                                 durability = durability)
+            set_to_different_values(self)
+            self.assertTrue(Preferences(filename = self.filename).x3 == 6)
+            self.tearDown()
+
+        self.P = self.initialize_with_dict()
+        file_name_ = self.P._filename_to_store_the_preferences
+        with open(file_name_) as inputfile:
+            file_string = inputfile.read()
+        # when writing fails halfway, the old file is left intact
+        with mock.patch("os.replace", side_effect = OSError):
+            with self.assertRaises(OSError):
+                self.P.x1 = 4
+        with open(file_name_) as inputfile:
+            self.assertTrue(inputfile.read() == file_string)
+        self.assertFalse([f for f in os.listdir(CURRENT_PATH) if f.endswith(".tmp")])
+        with self.assertRaises(ValueError):
+            Preferences(filename = self.filename, durability = "always")
+
+    @unittest.skipIf(os.name != "posix", "needs file permissions and symbolic links")
+    def test_atomic_write_keeps_permissions_and_links(self):
+        import stat
+        self.P = self.initialize_with_dict()
+        file_name_ = self.P._filename_to_store_the_preferences
+        os.chmod(file_name_, 0o600)
+        self.P.x1 = 4
+        self.assertTrue(stat.S_IMODE(os.stat(file_name_).st_mode) == 0o600)
+
+        # a symbolic link stays a link; the file it links to is written
+        link_name = os.path.join(TARGET_FOLDER, "link_to_preferences.txt")
+        os.symlink(file_name_, link_name)
+        try:
+            P2 = Preferences(filename = link_name)
+            P2.x1 = 5
+            self.assertTrue(os.path.islink(link_name))
+            self.assertTrue(Preferences(filename = file_name_).x1 == 5)
+            self.assertTrue(stat.S_IMODE(os.stat(file_name_).st_mode) == 0o600)
+        finally:
+            os.remove(link_name)
+
+    @unittest.skipIf(os.name != "posix", "the shared mode requires module fcntl")
+    def test_shared(self):
+        self.P = Preferences(defaults = self.defaults_with_dict,
+                             filename = self.filename,
+                             shared = True)
+        P2 = Preferences(filename = self.filename, shared = True)
+        self.P.x1 = 4
+        P2.x2 = 5  # P2 has not seen the change of x1 yet, but does not undo it
+        self.assertTrue(P2.x1 == 4)
+        self.assertTrue(self.P.get("x2") == 5)
+        self.assertTrue(self.P.reload() == [])  # nothing changed since
+        P2.delete_attribute("x3")
+        self.assertTrue(self.P.reload() == ["x3"])
+        self.assertFalse("x3" in self.P.valid_attributes())
+        P3 = Preferences(filename = self.filename)
+        self.assertTrue(P3.x1 == 4 and P3.x2 == 5)
+
+        # setting the value an instance last saw is still written, as another process may have changed it
+        P4 = Preferences(filename = self.filename, shared = True)
+        P2.x1 = 5
+        P4.x1 = 4
+        self.assertTrue(P2.get("x1") == 4 and Preferences(filename = self.filename).x1 == 4)
+        P2.delete_preferences_file()
+
+    def test_subscribe(self):
+        self.P = Preferences(defaults = self.defaults_with_dict,
+                             filename = self.filename,
+                             shared = True)
+        P2 = Preferences(filename = self.filename, shared = True)
+        changes = []
+        self.P.subscribe("x1", lambda *change: changes.append(change))
+        def on_any_change(*change):
+            changes.append(("x*",) + change)
+        self.P.subscribe("x*", on_any_change)
+        P2.x1 = 4
+        P2.x4 = [5]
+        P2.delete_attribute("x3")
+        self.P.x2 = 6  # changes of other processes are taken over before writing
+        self.assertTrue(changes == [("x1", 1, 4), ("x*", "x1", 1, 4),
+                                    ("x*", "x4", None, [5]), ("x*", "x3", 3, None)])
+        self.P.unsubscribe("x*", on_any_change)
+        P2.x1 = 7
+        self.assertTrue(self.P.reload() == ["x1"])
+        self.assertTrue(changes[-1] == ("x1", 4, 7))
+        with self.assertRaises(ValueError):
+            self.P.unsubscribe("x*", print)
+
+    def test_watch(self):
+        import time
+        for use_inotify in (True, False):
+            self.P = Preferences(filename = self.filename, x1 = 1)
+            changes = []
+            self.P.subscribe("*", lambda *change: changes.append(change))
+            self.P.watch(interval = 0.01, use_inotify = use_inotify)
+            self.P.x1 = 2 # its own changes are not reported
+            P2 = Preferences(filename = self.filename)
+            P2.x1 = 3
+            for i in range(200):
+                if changes:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(changes == [("x1", 2, 3)])
+            self.assertTrue(self.P.x1 == 3)
+            self.P.stop_watching()
+            self.tearDown()
+
+        # while watching, setting an attribute waits for the lock (which the watching thread holds while reloading)
+        import threading
+        self.P = Preferences(filename = self.filename, x1 = 1)
+        self.P.watch(interval = 10, use_inotify = False)
+        with self.P._lock_of_this_class:
+            thread = threading.Thread(target = self.P.set, args = ("x1", 5))
+            thread.start()
+            thread.join(0.1)
+            self.assertTrue(thread.is_alive() and self.P.x1 == 1)
+        thread.join()
+        self.assertTrue(self.P.x1 == 5)
+        self.P.stop_watching()
+
+    def test_async(self):
+        import asyncio
+        from preferences.asynchronous import AsyncPreferences
+
+        async def use_preferences():
+            self.P = await AsyncPreferences.load(filename = self.filename, x1 = 1, x2 = 2)
+            # (a relative filename is relative to this script, as with class Preferences)
+            self.assertTrue(self.P._filename_to_store_the_preferences == os.path.join(CURRENT_PATH, self.filename))
+            writes = self.P.stats()["writes"]
+            # setting an attribute does not write to the file yet
+            self.P.x1 = 3
+            self.assertTrue(Preferences(filename = self.filename).x1 == 1)
+            # changes made at the same time are written together
+            await asyncio.gather(*(self.P.aset("x2", i) for i in range(10)))
+            self.assertTrue(self.P.stats()["writes"] == writes + 1)
+            self.assertTrue(Preferences(filename = self.filename).x1 == 3)
+            self.assertTrue(Preferences(filename = self.filename).x2 == 9)
+            for i in range(100):
+                self.P.x1 = i
+            await self.P.aflush()
+            self.assertTrue(self.P.stats()["writes"] == writes + 2)
+            self.assertTrue(Preferences(filename = self.filename).x1 == 99)
+
+            # a write that waits in the executor is not overwritten by an older one, nor overwrites a newer one
+            import threading
+            from concurrent.futures import ThreadPoolExecutor
+            loop = asyncio.get_running_loop()
+            executor = ThreadPoolExecutor(1)
+            P2 = AsyncPreferences(filename = self.filename, executor = executor)
+            blocked = threading.Event()
+            executor.submit(blocked.wait)
+            P2.x1 = 5
+            while not P2._writing_of_this_class.locked():
+                await asyncio.sleep(0) # (until the content with x1 == 5 is encoded)
+            thread = threading.Thread(target = P2.set, args = ("x1", 6)) # (written right away)
+            thread.start()
+            blocked.set()
+            await loop.run_in_executor(None, thread.join)
+            await P2.aflush()
+            executor.shutdown()
+            self.assertTrue(Preferences(filename = self.filename).x1 == 6)
+        asyncio.run(use_preferences())
+
+        # outside of an event loop, changes are written right away
+        self.P.x1 = 4
+        self.assertTrue(Preferences(filename = self.filename).x1 == 4)
+
+    def test_thread_safe(self):
+        import threading
+        self.P = Preferences(filename = self.filename, thread_safe = True, x1 = 0)
+        def work(i):
+            for j in range(50):
+                self.P.set_value({"x%s_%s"%(i, j): j, "x1": i})
+                with self.P.batch():
+                    # other threads cannot change anything within the batch
+                    self.P.x1 = -1
+                    self.assertTrue(self.P.x1 == -1)
+                    self.P.x1 = i
+        threads = [threading.Thread(target = work, args = (i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.P.flush()
+        P2 = Preferences(filename = self.filename)
+        self.assertTrue(len(P2.valid_attributes()) == 1 + 8*50)
+        self.assertTrue(P2.x7_49 == 49)
+        self.assertTrue(P2.x1 == self.P.x1)
+
+        # writing within a batch is done by the thread that holds the batch
+        with self.P.batch():
+            self.P.x1 = 100
+            self.P.flush()
+        self.assertTrue(Preferences(filename = self.filename).x1 == 100)
+
+        # changes that are still waiting for the writing thread are written after the instance is deleted
+        import gc, time
+        P3 = Preferences(filename = self.filename, thread_safe = True, flush = "deferred", flush_interval = 0.05)
+        writer = P3._writer_of_this_class
+        P3.x1 = 101
+        del P3
+        gc.collect()
+        writer.join(5)
+        self.assertFalse(writer.is_alive())  # (stopped once the instance is gone)
+        self.assertTrue(Preferences(filename = self.filename).x1 == 101)
+
+    def test_schema(self):
+        from preferences.schema import Coerce, Range
+        validated = VALIDATED
+        schema = {"x1": int, "x2": Coerce(int), "x3": [Coerce(float), Range(0, 10)], "x4": upper}
+        self.P = Preferences(filename = self.filename, schema = schema,
+                             x1 = 1, x2 = "2", x3 = 3, x4 = "a")
+        self.assertTrue(self.P.x2 == 2 and self.P.x3 == 3.0 and self.P.x4 == "A")
+        with self.assertRaises(TypeError):
+            self.P.x1 = "1"
+        with self.assertRaises(TypeError):
+            self.P.x2 = "two"
+        with self.assertRaises(ValueError):
+            self.P.x3 = 11
+        self.P.x5 = "anything" # not in the schema
+        # all values are validated before any of them is set
+        with self.assertRaises(TypeError) as context:
+            self.P.set_value(x1 = 4, x2 = "five", x3 = 12)
+        self.assertTrue("x2" in str(context.exception) and "x3" in str(context.exception))
+        self.assertTrue(self.P.x1 == 1)
+        self.P.set_value(x1 = 4, x3 = "5")
+        self.assertTrue(self.P.x3 == 5.0)
+
+        # values from a file written with the same schema are not validated again
+        del validated[:]
+        P2 = Preferences(filename = self.filename, schema = schema)
+        self.assertTrue(validated == [] and P2.x4 == "A")
+        P2 = Preferences(filename = self.filename, schema = dict(schema, x5 = upper))
+        self.assertTrue(validated == ["A", "anything"] and P2.x5 == "ANYTHING")
+        self.assertFalse("_schema_hash_of_this_class" in P2.valid_attributes())
+
+        # lambdas cannot be told apart by their name, so values are then always validated
+        P2 = Preferences(filename = self.filename, schema = {"x1": lambda value: value + 1})
+        P2 = Preferences(filename = self.filename, schema = {"x1": lambda value: value * 10})
+        self.assertTrue(P2.x1 == 40) # (4, as read, times 10)
+        self.assertTrue(P2._schema_hash_of_this_class is None)
+
+        with self.assertRaises(TypeError):
+            Preferences(filename = self.filename, schema = {"x1": 1})
+
+    def test_index_of_valid_attributes(self):
+        self.P = self.initialize_with_keywords()
+        self.P.x4 = 4
+        self.assertTrue(self.P.valid_attributes() == ["x1", "x2", "x3", "x4"])
+        with self.assertRaises(ValueError):
+            with self.P.batch():
+                self.P.x5 = 5
+                self.P.delete_attribute("x1")
+                raise ValueError
+        self.assertTrue(self.P.valid_attributes() == ["x1", "x2", "x3", "x4"])
+        del self.P.x4
+        self.P.delete_attribute("x3")
+        self.assertTrue(self.P.valid_attributes() == ["x1", "x2"])
+        with self.assertRaises(AttributeError):
+            self.P.get("x3")
+        self.assertTrue(self.P.reset_to_default(exclude = ["x2"]) == [])
+        with self.assertRaises(AttributeError):
+            self.P.reset_to_default(exclude = ["x3"])
+
+    def test_defaults_registry(self):
+        self.P = Preferences(filename = self.filename, backend = "journal", format = "indexed",
+                             defaults = {"x2": 2, "x1": 1, "x3": 3})
+        self.assertTrue(list(self.P._defaults_of_this_class) == ["x2", "x1", "x3"])
+        self.P.write_to_file() # (empties the journal)
+        writes = self.P.stats()["writes"]
+        self.P.set_default_values(x1 = 1)
+        self.assertTrue(self.P.stats()["writes"] == writes) # unchanged
+        self.P.set_default_values(x1 = 4)
+        self.P.delete_attribute("x3")
+        self.assertTrue(self.P.stats()["writes"] == writes + 2)
+        # only the default-values that changed are in the journal
+        with open(self.P._storage_of_this_class.journal_filename) as journal:
+            records = [json.loads(line) for line in journal]
+        self.assertTrue([(r["op"], r["key"]) for r in records] == [("set_default", "x1"), ("del_default", "x3"),
+                                                                  ("del", "x3")])
+        view = Preferences.open_readonly(self.filename)
+        self.assertTrue(view.get_default_value("x1") == 4 and view.get_default_value("x2") == 2)
+        P2 = Preferences(filename = self.filename)
+        self.assertTrue(P2._defaults_of_this_class == {"x1": 4, "x2": 2})
+        # the file keeps the defaults sorted
+        self.P.write_to_file()
+        self.assertTrue(view.get_default_value("x1") == 4)
+        self.assertTrue(list(Preferences(filename = self.filename)._defaults_of_this_class) == ["x1", "x2"])
+        view.close()
+
+    def test_namespace(self):
+        from preferences.schema import Range
+        self.P = Preferences(filename = self.filename, schema = {"ui.size": Range(0, 10)}, x1 = 1)
+        ui = self.P.namespace("ui", theme = "light", size = 5)
+        self.assertTrue(self.P.namespace("ui") is ui)
+        root, extension = os.path.splitext(self.P._filename_to_store_the_preferences)
+        self.assertTrue(ui._filename_to_store_the_preferences == root + ".ui" + extension)
+        writes = self.P.stats()["writes"]
+        ui.theme = "dark"
+        self.P.set("ui.theme", "darker")
+        self.P.set_value({"x1": 2, "ui.size": 6})
+        self.assertTrue(self.P.stats()["writes"] == writes + 1) # (only x1)
+        self.assertTrue(self.P.get("ui.theme") == "darker" and self.P.get_default_value("ui.size") == 5)
+        self.assertFalse("theme" in self.P.valid_attributes())
+        with self.assertRaises(ValueError):
+            self.P.set("ui.size", 11)
+
+        # namespaces within namespaces
+        colors = self.P.namespace("ui.colors", background = "white")
+        self.assertTrue(ui.namespace("colors") is colors)
+        self.assertTrue(colors._filename_to_store_the_preferences == root + ".ui.colors" + extension)
+        self.P.delete_attribute("ui.colors.background")
+        self.assertFalse("background" in colors.valid_attributes())
+
+        P2 = Preferences(filename = self.filename)
+        self.assertTrue(P2.get("ui.theme") == "darker" and P2.get("ui.size") == 6)
+
+        # reading does not create a namespace (nor its file)
+        with self.assertRaises(AttributeError):
+            self.P.get("typo.theme")
+        with self.assertRaises(AttributeError):
+            self.P.get_default_value("typo.theme")
+        with self.assertRaises(AttributeError):
+            self.P.delete_attribute("typo.theme")
+        self.assertFalse("typo" in self.P._namespaces_of_this_class)
+        self.assertFalse(os.path.exists(root + ".typo" + extension))
+
+        # an attribute with a dotted name of its own takes precedence
+        setattr(self.P, "a.b", 1)
+        P2 = Preferences(filename = self.filename)
+        self.assertTrue(P2.get("a.b") == 1)
+        P2.set_value({"a.b": 2})
+        self.assertTrue(P2.get("a.b") == 2 and not "a" in P2._namespaces_of_this_class)
+        P2.delete_attribute("a.b")
+        self.assertFalse("a.b" in P2.valid_attributes())
+        with self.assertRaises(ValueError):
+            self.P.namespace("ui/theme")
+        with self.assertRaises(TypeError):
+            self.P.namespace(1)
+        self.P.delete_preferences_file()
+        self.assertFalse(os.path.exists(ui._filename_to_store_the_preferences))
+        self.assertFalse(os.path.exists(colors._filename_to_store_the_preferences))
+
+    def test_track_mutations(self):
+        self.P = Preferences(filename = self.filename,
+                             track_mutations = True,
+                             x1 = [1, 2], x2 = {"a": [3]})
+        self.P.x1.append(3)
+        self.P.x2["a"].append(4) # also works for lists in a dict
+        self.P.x2.update(b = 5)
+        self.assertTrue(self.P.get_default_value("x1") == [1, 2])
+        P2 = Preferences(filename = self.filename)
+        self.assertTrue(P2.x1 == [1, 2, 3])
+        self.assertTrue(P2.x2 == {"a": [3, 4], "b": 5})
+        self.assertTrue(type(P2.x1) is list)  # without 'track_mutations', values are not replaced
+
+        # containers without an owner report their changes to no one
+        from preferences.tracking import TrackedList, TrackedDict, TrackedSet
+        unowned = TrackedDict({"a": [1]})
+        unowned["a"].append(2)
+        unowned["b"] = {3}
+        unowned["b"].add(4)
+        self.assertTrue(unowned == {"a": [1, 2], "b": {3, 4}})
+        self.assertTrue(TrackedList([1]) + [2] == [1, 2] and TrackedSet() == set())
+
+        with self.P.batch():
+            for i in range(10):
+                self.P.x1.append(i)
+        self.assertTrue(Preferences(filename = self.filename).x1 == [1, 2, 3] + list(range(10)))
+
+        import pickle, copy
+        self.assertTrue(type(copy.deepcopy(self.P.x2)["a"]) is list)
+        self.assertTrue(pickle.loads(pickle.dumps(self.P.x2)) == self.P.x2)
+        
+    def test_base_dir(self):
+        self.P = Preferences(filename = self.filename, base_dir = TARGET_FOLDER, x1 = 1)
+        self.assertTrue(self.P._filename_to_store_the_preferences == os.path.join(TARGET_FOLDER, self.filename))
+        self.assertTrue(Preferences(filename = os.path.join(RELATIVE_FOLDER, self.filename)).x1 == 1)
+
+    def test_read_file_of_older_versions(self):
+        # older versions put a newline after every comma, also within strings
+        file_name_ = os.path.join(CURRENT_PATH, self.filename)
+        with open(file_name_, "w") as text_file:
+            text_file.write('some header\n\n' + 40*"#" + '\n\n{"x1": "a,\nb",\n "x2": 2,\n \n '+
+                            '"_defaults_of_this_class": {"x1": "c",\n                            "x2": 3}}')
+        self.P = Preferences(filename = self.filename)
+        self.assertTrue(self.P.x1 == "a,b" and self.P.x2 == 2)
+        self.assertTrue(self.P.get_default_value("x2") == 3)
+        self.assertTrue(self.P._header_of_this_class == "some header")
+
+    def test_formats(self):
+        values = {"x1": [1.5, "a,b"], "x2": {"c": None}, "x3": True}
+        for format in ("json", "compact-json", "pickle", "marshal", "indexed"):
+            self.P = Preferences(defaults = values,
+                                 filename = self.filename,
+                                 header = "some header",
+                                 format = format)
+            self.P.x4 = "_defaults_of_this_class"
+            # the format is recognized when reading the file (but pickle is only read when asked for)
+            if format == "pickle":
+                with self.assertRaises(ValueError):
+                    Preferences(filename = self.filename)
+            P2 = Preferences(filename = self.filename, format = "pickle" if format == "pickle" else None)
+            for key in values:
+                self.assertTrue(P2.get(key) == values[key])
+                self.assertTrue(P2.get_default_value(key) == values[key])
+            self.assertTrue(P2.x4 == "_defaults_of_this_class")
+            self.assertTrue(P2._header_of_this_class == "some header")
+            self.assertTrue(P2._serializer_of_this_class.name == format if format != "compact-json" else "json")
+            self.tearDown()
+
+        # a value may hold the line that ends the header (with or without a header)
+        for format in ("json", "compact-json"):
+            for header in ("some header", ""):
+                value = "\n\n" + 40*"#" + "\n\n{"
+                self.P = Preferences(filename = self.filename, header = header, format = format, x1 = value)
+                for lazy in (False, True):
+                    P2 = Preferences(filename = self.filename, lazy = lazy)
+                    self.assertTrue(P2.x1 == value and P2._header_of_this_class == header)
+                self.tearDown()
+
+        self.P = Preferences(filename = self.filename, format = "pickle", track_mutations = True, x1 = [1])
+        self.P.x1.append({2})
+        self.assertTrue(Preferences(filename = self.filename, format = "pickle").x1 == [1, {2}])
+        with self.assertRaises(ValueError):
+            Preferences(filename = self.filename, format = "xml")
+
+    def test_open_readonly(self):
+        self.P = Preferences(filename = self.filename, header = "some header",
+                             format = "indexed", x1 = 1, x2 = [2, "a,b"], x3 = {"c": None})
+        self.P.x1 = 4
+        view = Preferences.open_readonly(self.filename)
+        self.assertTrue(view.x1 == 4)
+        self.assertTrue(view.get("x2") == [2, "a,b"])
+        self.assertTrue(view.get_default_value("x1") == 1)
+        self.assertTrue(sorted(view.valid_attributes()) == ["x1", "x2", "x3"])
+        self.assertTrue(view.header() == "some header")
+        with self.assertRaises(AttributeError):
+            view.x4
+        with self.assertRaises(AttributeError):
+            view.x1 = 5
+
+        # changes are seen after reloading (which method get does)
+        self.P.x1 = 5
+        self.P.x4 = "new"
+        self.assertTrue(view.get("x1") == 5)
+        self.assertTrue(view.x4 == "new")
+        self.P.delete_attribute("x4")
+        self.assertTrue(view.reload())
+        self.assertFalse(view.reload())
+        with self.assertRaises(AttributeError):
+            view.get("x4")
+        view.close()
+
+        # including those that are still in the journal
+        P2 = Preferences(filename = self.filename, backend = "journal")
+        with Preferences.open_readonly(self.filename) as view:
+            P2.x1 = 6
+            P2.x5 = 7
+            P2.delete_attribute("x3")
+            self.assertTrue(view.get("x1") == 6)
+            self.assertTrue(sorted(view.valid_attributes()) == ["x1", "x2", "x5"])
+            self.assertTrue(view.get_default_value("x2") == [2, "a,b"])
+            with self.assertRaises(ValueError):
+                view.get_default_value("x5")
+            with self.assertRaises(AttributeError):
+                view.get_default_value("x3")
+
+            # a change that was only written halfway is ignored, and left to class Preferences to remove
+            journal_filename = P2._storage_of_this_class.journal_filename
+            with open(journal_filename, "a") as journal:
+                journal.write('{"op": "set", "key": "x1", "va')
+            with open(journal_filename) as journal:
+                journal_string = journal.read()
+            self.assertTrue(view.get("x1") == 6)
+            with open(journal_filename) as journal:
+                self.assertTrue(journal.read() == journal_string)
+
+        # only the format "indexed" has an index
+        P2.delete_preferences_file()
+        Preferences(filename = self.filename, x1 = 1)
+        with self.assertRaises(ValueError):
+            Preferences.open_readonly(self.filename)
+
+    def test_layout_of_file(self):
+        self.P = Preferences(filename = self.filename, x1 = 1, x2 = "a, b")
+        with open(self.P._filename_to_store_the_preferences) as inputfile:
+            file_string = inputfile.read()
+        self.assertTrue(file_string == '{"x1": 1,\n "x2": "a, b",\n \n'+
+                                       ' "_defaults_of_this_class": {"x1": 1,\n'+
+                                       29*" "+'"x2": "a, b"}}')
+
+    def test_flush_arguments(self):
+        with self.assertRaises(ValueError):
+            Preferences(filename = self.filename, flush = "sometimes")
+        with self.assertRaises(TypeError):
+            Preferences(filename = self.filename, flush_interval = "1")
+
+    def test_unchanged_values_are_not_written(self):
+        self.P = self.initialize_with_dict()
+        writes = self.P.stats()["writes"]
+        self.P.x1 = 1
+        self.P.set_value(x1 = 1, x2 = 2)
+        self.assertTrue(self.P.stats()["writes"] == writes)
+        self.assertTrue(self.P.stats()["unchanged_values"] == 3)
+        self.P.x1 = 1.0 # not the same type, so written
+        self.assertTrue(self.P.stats()["writes"] == writes + 1)
+
+        # a list that is set to itself may have been changed in place
+        self.P.x3 = [1]
+        self.P.x3.append(2)
+        self.P.x3 = self.P.x3
+        self.assertTrue(Preferences(filename = self.filename).x3 == [1, 2])
+
+        # equal containers may hold values of other types, which are written
+        self.P.x3 = {"a": 1}
+        self.P.x3 = {"a": True}
+        self.P.x4 = [1]
+        self.P.x4 = [1.0]
+        self.P.x2 = 0.0
+        self.P.x2 = -0.0
+        P2 = Preferences(filename = self.filename)
+        self.assertTrue(P2.x3["a"] is True and type(P2.x4[0]) is float and str(P2.x2) == "-0.0")
+
+        # writing the same content is skipped as well
+        statistics = self.P.stats()
+        self.P.write_to_file()
+        self.assertTrue(self.P.stats()["unchanged_writes"] == statistics["unchanged_writes"] + 1)
+        from unittest import mock
+        with mock.patch("preferences.storage.write_atomically") as write_atomically:
+            self.P.x4 = self.P.x4 # (not even a temporary file is written)
+        self.assertFalse(write_atomically.called)
+        self.assertTrue(self.P.stats()["unchanged_writes"] == statistics["unchanged_writes"] + 2)
+
+        # the same defaults do not need to be written again
+        P2 = self.initialize_with_dict()
+        self.assertTrue(P2.stats()["writes"] == 0)
+
+    def test_lazy(self):
+        self.P = Preferences(filename = self.filename, x1 = [1, "]"], x2 = {"a": 2}, x3 = 3)
+        self.P.x3 = 4
+        checked = []
+        class CountingPrefs(Preferences):
+            def check_before_setting_attribute(self, name, value):
+                checked.append(name)
+                return True
+        P2 = CountingPrefs(filename = self.filename, lazy = True)
+        self.assertTrue(checked == [])  # nothing has been decoded yet
+        self.assertTrue(sorted(P2.valid_attributes()) == ["x1", "x2", "x3"])
+        self.assertTrue(P2.x2 == {"a": 2})
+        self.assertTrue(P2.get("x3") == 4 and checked == ["x2", "x3"])
+        self.assertTrue(P2.stats()["writes"] == 0)
+
+        # values that have not been decoded, are written as they were
+        P2.x4 = 5
+        P2.delete_attribute("x3")
+        P3 = Preferences(filename = self.filename)
+        self.assertTrue(P3.x1 == [1, "]"] and P3.x4 == 5 and not "x3" in P3.valid_attributes())
+        P2.reset_to_default("x1")
+        self.assertTrue(P2.x1 == [1, "]"])
+        with self.assertRaises(AttributeError):
+            P2.x5
+
+        # a value that check_before_setting_attribute passes on is not set, nor a valid attribute
+        class PassingPrefs(Preferences):
+            def check_before_setting_attribute(self, name, value):
+                return "pass" if name == "x4" else True
+        P4 = PassingPrefs(filename = self.filename, lazy = True)
+        with self.assertRaises(AttributeError):
+            P4.x4
+        self.assertFalse("x4" in P4.valid_attributes())
+
+        # default values that changed in the journal are read as well
+        self.P = Preferences(filename = self.filename, backend = "journal", x1 = 1)
+        self.P.set_default_values(x1 = 2)
+        self.assertTrue(Preferences(filename = self.filename, lazy = True).get_default_value("x1") == 2)
+
+    def test_benchmark(self):
+        from preferences import benchmark
+        results = benchmark.run_benchmarks(attributes = [3], repeat = 3)
+        self.assertTrue([r["case"] for r in results["results"]] == list(benchmark.CASES))
+        comparison = benchmark.compare(results, results)
+        self.assertTrue(len(comparison) == len(benchmark.CASES))
+        self.assertFalse(any(regression for _, _, _, regression in comparison))
+
+        # every repetition changes the values (rather than writing the same ones again)
+        from preferences.storage import MemoryStorage
+        class ChangeCountingStorage(MemoryStorage):
+            changes = 0
+            def save_delta(self, values, defaults, all_defaults = False):
+                self.changes += any(self._values.get(name) != value for name, value in values.items())
+                return super().save_delta(values, defaults, all_defaults)
+        storage = ChangeCountingStorage()
+        benchmark.benchmark_case("set_value", 3, repeat = 3, options = {"backend": storage})
+        self.assertTrue(storage.changes == 3)
+
+    def test_internal_attributes_are_slots(self):
+        self.P = self.initialize_with_dict()
+        self.P.x4 = [4]
+        self.assertTrue(self.P.__dict__ == {"x1": 1, "x2": 2, "x3": 3, "x4": [4]})
+        self.assertTrue(self.P._header_of_this_class == "" and self.P._defaults_of_this_class == self.defaults_with_dict)
+
+        # internal attributes of subclasses that are not slots do not end up in the file either
+        class PrefsWithCounter(Preferences):
+            _ATTRIBUTES_TO_IGNORE = Preferences._ATTRIBUTES_TO_IGNORE + ("_counter_of_this_class",)
+            def check_before_setting_attribute(self, name, value):
+                self._counter_of_this_class = getattr(self, "_counter_of_this_class", 0) + 1
+                return True
+        P2 = PrefsWithCounter(filename = self.filename)
+        counter = P2._counter_of_this_class # (of the values read)
+        P2.x1 = 5
+        self.assertTrue(P2._counter_of_this_class == counter + 1)
+        with open(self.P._filename_to_store_the_preferences) as opened_file:
+            self.assertFalse("_counter_of_this_class" in opened_file.read())
+        self.assertTrue(Preferences(filename = self.filename).valid_attributes() == ["x1", "x2", "x3", "x4"])
+        with self.assertRaises(ValueError):
+            with P2.batch():
+                P2.x5 = 5
+                raise ValueError
+        self.assertTrue(P2._counter_of_this_class == counter + 2 and not "x5" in P2.valid_attributes())
+
+    def test_fork_and_snapshot(self):
+        from preferences.schema import Coerce
+        self.P = Preferences(filename = self.filename, schema = {"x1": Coerce(int)}, x1 = 1, x2 = [2], x3 = 3)
+        writes = self.P.stats()["writes"]
+        fork = self.P.fork(x1 = "4")
+        fork.x2.append(5) # (only changes a copy, which is not kept)
+        self.assertTrue(fork.x2 == [2] and self.P.x2 == [2] and sorted(fork.overrides()) == ["x1"])
+        fork.x2 = fork.x2 + [5]
+        fork.x4 = 4
+        self.assertTrue(fork.x1 == 4 and fork.x2 == [2, 5] and fork.get("x3") == 3 and fork.x4 == 4)
+        self.assertTrue(self.P.x1 == 1 and self.P.x2 == [2] and not "x4" in self.P.valid_attributes())
+        self.assertTrue(self.P.stats()["writes"] == writes)  # nothing is written
+        self.P.x3 = 6
+        self.assertTrue(fork.x3 == 6)  # (shared with the parent, as long as the fork does not change it)
+        other_fork = self.P.fork()
+        self.assertTrue(other_fork.x2 == [2])
+        self.P.x2 = [3]
+        self.assertTrue(other_fork.x2 == [3] and not other_fork.overrides()) # (also after it was read)
+        self.P.x2 = [2]
+        self.assertTrue(sorted(fork.overrides()) == ["x1", "x2", "x4"])
+        fork.delete_attribute("x3")
+        self.assertTrue(sorted(fork.valid_attributes()) == ["x1", "x2", "x4"] and self.P.x3 == 6)
+        self.assertTrue(fork.get_default_value("x1") == 1)
+        with self.assertRaises(TypeError):
+            fork.x1 = "a"
+        with self.assertRaises(AttributeError):
+            fork.get("x3")
+        self.assertTrue(fork.fork(x1 = 7).x1 == 7 and fork.x1 == 4)
+        forked_filename = os.path.join(CURRENT_PATH, "forked_" + self.filename)
+        try:
+            fork.export_to_file(forked_filename)
+            P2 = Preferences(filename = forked_filename)
+            self.assertTrue(P2.x1 == 4 and P2.x2 == [2, 5] and P2.x4 == 4 and not "x3" in P2.valid_attributes())
+            self.assertTrue(P2._defaults_of_this_class == {"x1": 1, "x2": [2], "x3": 3})
+        finally:
+            os.remove(forked_filename)
+
+        snapshot = self.P.snapshot()
+        self.P.x2.append(7)
+        self.P.set_value(x1 = 8, x5 = 5)
+        self.P.set_default_values(x1 = 9)
+        self.P.delete_attribute("x3")
+        writes = self.P.stats()["writes"]
+        self.P.restore(snapshot)
+        self.assertTrue(self.P.stats()["writes"] == writes + 1)
+        for P in (self.P, Preferences(filename = self.filename)):
+            self.assertTrue(P.x1 == 1 and P.x2 == [2] and P.x3 == 6 and not "x5" in P.valid_attributes())
+            self.assertTrue(P.get_default_value("x1") == 1 and P.get_default_value("x3") == 3)
+        self.P.x1 = 10
+        self.P.restore(snapshot)  # (again)
+        self.assertTrue(self.P.x1 == 1)
+        with self.assertRaises(TypeError):
+            self.P.restore({"x1": 1})
+
+    def test_instrumentation(self):
+        from preferences.schema import Coerce
+        self.P = self.initialize_with_dict()
+        self.assertFalse("timings" in self.P.stats())  # off by default
+        bytes_written = self.P.stats()["bytes_written"]
+        self.P.x1 = 5
+        file_name_ = self.P._filename_to_store_the_preferences
+        self.assertTrue(self.P.stats()["bytes_written"] == bytes_written + os.path.getsize(file_name_))
+        coalesced_changes = self.P.stats()["coalesced_changes"]
+        with self.P.batch():
+            self.P.x1 = 7
+            self.P.x2 = 8
+        self.assertTrue(self.P.stats()["coalesced_changes"] == coalesced_changes + 1)
+
+        self.P = Preferences(filename = self.filename, instrument = True, schema = {"x1": Coerce(int)})
+        loaded = self.P.stats()["timings"]
+        self.assertTrue(loaded["load"]["count"] == 1 and loaded["set"]["count"] == 0)
+        self.assertTrue(loaded["validate"]["count"] == 1) # (the file was written without the schema)
+        writes = []
+        self.P.add_hook("write", lambda duration, size: writes.append(size))
+        self.P.x1 = "9"
+        self.P.x2 = 9
+        timings = self.P.stats()["timings"]
+        self.assertTrue(timings["set"]["count"] == 2 and timings["validate"]["count"] == 2)
+        self.assertTrue(timings["check"]["count"] == loaded["check"]["count"] + 2)
+        self.assertTrue(timings["write"]["count"] == loaded["write"]["count"] + 2 == len(writes))
+        self.assertTrue(writes[-1] == os.path.getsize(file_name_))
+        self.assertTrue(sum(n for _, n in timings["set"]["buckets"]) == 2)
+        self.assertTrue(timings["set"]["min"] <= timings["set"]["p50"] and timings["set"]["max"] <= timings["set"]["total"])
+
+        set_names = []
+        hook = lambda duration, name: set_names.append(name)
+        self.P.add_hook("set", hook)
+        self.P.x1 = 10
+        self.P.remove_hook("set", hook)
+        self.P.x1 = 11
+        self.assertTrue(set_names == ["x1"])
+
+        # method set_value sets (and validates) every attribute, and encoding is timed apart from writing
+        encodings = []
+        self.P.add_hook("encode", lambda duration, size: encodings.append(size))
+        timings = self.P.stats()["timings"]
+        self.P.set_value(x1 = "12", x2 = 13)
+        new_timings = self.P.stats()["timings"]
+        self.assertTrue(new_timings["set"]["count"] == timings["set"]["count"] + 2)
+        self.assertTrue(new_timings["validate"]["count"] == timings["validate"]["count"] + 1)
+        self.assertTrue(encodings == [os.path.getsize(file_name_)])
+        with self.assertRaises(ValueError):
+            self.P.remove_hook("set", hook)
+        with self.assertRaises(ValueError):
+            self.P.add_hook("read", hook)
+
     def tearDown(self):
         try:    self.P
         except: pass
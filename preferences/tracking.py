@@ -0,0 +1,196 @@
+"""
+Containers that notice when they are changed in place.
+
+In the mode 'track_mutations' of class Preferences, every list, dict
+and set that is assigned to an attribute is replaced by one of the
+containers below. Whenever such a container is changed in place (e.g.
+with list.append or dict.update), it tells the instance of Preferences
+it belongs to, which then stores the change just like it would after
+setting the attribute.
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import weakref
+
+
+
+def track(value, owner, name):
+    """
+    Returns 'value' as a tracked container (including any lists, dicts
+    and sets within it), which reports changes to attribute 'name' of
+    'owner'. Values that are not a list, dict or set are returned as is.
+    """
+    if isinstance(value, dict):
+        return TrackedDict(value, owner = owner, name = name)
+    if isinstance(value, list):
+        return TrackedList(value, owner = owner, name = name)
+    if isinstance(value, set):
+        return TrackedSet(value, owner = owner, name = name)
+    return value
+
+
+
+def _no_owner():
+    # (stands in for the weak reference of a container without an owner)
+    return None
+
+
+
+class _Tracked():
+    """
+    Shared behavior of the tracked containers. The owner is only
+    referred to weakly, so that a container that outlives its instance
+    of Preferences does not keep it alive. A container without an owner
+    (i.e. owner None) reports its changes to no one.
+    """
+    __slots__ = ()
+
+    def _attach(self, owner, name):
+        if owner is None or owner is _no_owner:
+            self._owner = _no_owner
+        else:
+            self._owner = owner if isinstance(owner, weakref.ref) else weakref.ref(owner)
+        self._name = name
+
+    def _track(self, value):
+        return track(value, self._owner, self._name)
+
+    def _changed(self):
+        owner = self._owner()
+        if owner is not None:
+            owner._store_change(self._name)
+
+    def __reduce__(self):
+        # copies and pickles are plain containers, without an owner
+        return (self._BASE, (self._BASE(self),))
+
+
+
+def _reports_change(base, method_name):
+    base_method = getattr(base, method_name)
+    def method(self, *args, **kwargs):
+        result = base_method(self, *args, **kwargs)
+        self._changed()
+        return result
+    method.__name__ = method_name
+    method.__doc__ = base_method.__doc__
+    return method
+
+
+
+class TrackedList(_Tracked, list):
+    """
+    A list that reports changes made to it to its instance of
+    Preferences.
+    """
+    __slots__ = ("_owner", "_name")
+    _BASE = list
+
+    def __init__(self, iterable = (), owner = None, name = None):
+        self._attach(owner, name)
+        list.__init__(self, (self._track(x) for x in iterable))
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [self._track(x) for x in value]
+        else:
+            value = self._track(value)
+        list.__setitem__(self, index, value)
+        self._changed()
+
+    def __iadd__(self, iterable):
+        list.__iadd__(self, [self._track(x) for x in iterable])
+        self._changed()
+        return self
+
+    def append(self, value):
+        list.append(self, self._track(value))
+        self._changed()
+
+    def extend(self, iterable):
+        list.extend(self, [self._track(x) for x in iterable])
+        self._changed()
+
+    def insert(self, index, value):
+        list.insert(self, index, self._track(value))
+        self._changed()
+
+    __delitem__ = _reports_change(list, "__delitem__")
+    __imul__ = _reports_change(list, "__imul__")
+    pop = _reports_change(list, "pop")
+    remove = _reports_change(list, "remove")
+    clear = _reports_change(list, "clear")
+    sort = _reports_change(list, "sort")
+    reverse = _reports_change(list, "reverse")
+
+
+
+class TrackedDict(_Tracked, dict):
+    """
+    A dict that reports changes made to it to its instance of
+    Preferences.
+    """
+    __slots__ = ("_owner", "_name")
+    _BASE = dict
+
+    def __init__(self, mapping = (), owner = None, name = None):
+        self._attach(owner, name)
+        dict.__init__(self)
+        for key, value in dict(mapping).items():
+            dict.__setitem__(self, key, self._track(value))
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, self._track(value))
+        self._changed()
+
+    def __ior__(self, mapping):
+        self.update(mapping)
+        return self
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            dict.__setitem__(self, key, self._track(value))
+        self._changed()
+
+    def setdefault(self, key, default = None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return self[key]
+
+    __delitem__ = _reports_change(dict, "__delitem__")
+    pop = _reports_change(dict, "pop")
+    popitem = _reports_change(dict, "popitem")
+    clear = _reports_change(dict, "clear")
+
+
+
+class TrackedSet(_Tracked, set):
+    """
+    A set that reports changes made to it to its instance of
+    Preferences.
+    """
+    __slots__ = ("_owner", "_name")
+    _BASE = set
+
+    def __init__(self, iterable = (), owner = None, name = None):
+        self._attach(owner, name)
+        set.__init__(self, iterable)
+
+    __ior__ = _reports_change(set, "__ior__")
+    __iand__ = _reports_change(set, "__iand__")
+    __isub__ = _reports_change(set, "__isub__")
+    __ixor__ = _reports_change(set, "__ixor__")
+    add = _reports_change(set, "add")
+    discard = _reports_change(set, "discard")
+    remove = _reports_change(set, "remove")
+    pop = _reports_change(set, "pop")
+    clear = _reports_change(set, "clear")
+    update = _reports_change(set, "update")
+    difference_update = _reports_change(set, "difference_update")
+    intersection_update = _reports_change(set, "intersection_update")
+    symmetric_difference_update = _reports_change(set, "symmetric_difference_update")
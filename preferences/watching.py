@@ -0,0 +1,129 @@
+"""
+Notices when the file of class Preferences is changed by someone else.
+
+A FileWatcher is a background thread that calls a function whenever one
+of the files it watches may have changed. On Linux it is woken up by the
+kernel (inotify) as soon as something changes in the directory of the
+files; elsewhere (or if inotify cannot be used) it looks at the files
+every 'interval' seconds instead. Either way, the function is expected
+to find out itself whether anything actually changed (e.g. method
+reload of class Preferences, which only has to look at the file).
+
+Author: Arrethra ( https://github.com/arrethra )
+Under MIT license
+"""
+
+
+
+import os
+import sys
+import select
+import struct
+import threading
+import traceback
+import ctypes
+
+
+
+# (from <sys/inotify.h>)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+
+_WATCHED_EVENTS = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO \
+                  | _IN_CREATE | _IN_DELETE
+
+_EVENT = struct.Struct("iIII") # wd, mask, cookie, length of the name that follows
+
+
+
+def _open_inotify(directory):
+    """
+    Returns a (non-blocking) file descriptor from which the changes in
+    'directory' can be read, or None if inotify is not available.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno = True)
+        file_descriptor = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if file_descriptor < 0:
+        return None
+    if libc.inotify_add_watch(file_descriptor, os.fsencode(directory), _WATCHED_EVENTS) < 0:
+        os.close(file_descriptor)
+        return None
+    return file_descriptor
+
+
+
+class FileWatcher(threading.Thread):
+    """
+    Background thread that calls 'on_change' (without arguments) whenever
+    one of 'filenames' (which must be in the same directory) may have
+    changed, until method stop is called. Several changes in quick
+    succession lead to a single call. If 'on_change' raises an error, it
+    is printed, and watching continues. Set 'use_inotify' to False to
+    always look at the files every 'interval' seconds.
+    """
+
+    def __init__(self, filenames, on_change, interval = 1.0, use_inotify = True):
+        super().__init__(name = "preferences-watcher", daemon = True)
+        filenames = [os.fsdecode(os.path.abspath(filename)) for filename in filenames]
+        self._names = {os.fsencode(os.path.basename(filename)) for filename in filenames}
+        self._on_change = on_change
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._inotify = _open_inotify(os.path.dirname(filenames[0])) if use_inotify else None
+
+    @property
+    def uses_inotify(self):
+        return self._inotify is not None
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        try:
+            while not self._stopped.is_set():
+                if self._wait_for_change() and not self._stopped.is_set():
+                    try:
+                        self._on_change()
+                    except Exception:
+                        traceback.print_exc()
+        finally:
+            if self._inotify is not None:
+                os.close(self._inotify)
+
+    def _wait_for_change(self):
+        """
+        Waits at most 'interval' seconds, and returns whether any of the
+        files may have changed meanwhile.
+        """
+        if self._inotify is None:
+            return not self._stopped.wait(self._interval)
+        readable = select.select([self._inotify], [], [], self._interval)[0]
+        return bool(readable) and self._read_events()
+
+    def _read_events(self):
+        changed = False
+        while True:
+            try:
+                data = os.read(self._inotify, 65536)
+            except BlockingIOError:
+                return changed
+            position = 0
+            while position < len(data):
+                _, mask, _, length = _EVENT.unpack_from(data, position)
+                position += _EVENT.size
+                name = data[position:position + length].rstrip(b"\0")
+                position += length
+                if mask & _IN_Q_OVERFLOW or name in self._names:
+                    changed = True